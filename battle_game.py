@@ -1,15 +1,29 @@
 import pygame
 import random
 import math
+import time
+import argparse
 
-# Initialize Pygame
-pygame.init()
+from gameloop import GameLoop
+from pools import Pool, memory_report
+from profiler import Profiler
+from spatial import SpatialGrid
+from sprites import SpriteCache, quantize
+from targeting import CachedTargeting
 
 # Set up the display
 WIDTH = 800
 HEIGHT = 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Stickman Battle")
+screen = None
+
+def init_display():
+    # Open the window on first use so headless games never touch the display
+    global screen
+    if screen is None:
+        pygame.display.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Stickman Battle")
+    return screen
 
 # Colors
 WHITE = (255, 255, 255)
@@ -17,7 +31,80 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 
+# Sprite cache layout: stickman sprites are keyed by team, gun angle in
+# ANGLE_STEPS steps and health in HEALTH_STEPS steps
+ANGLE_STEPS = 32
+HEALTH_STEPS = 20
+STICKMAN_SPRITE_SIZE = (45, 93)
+STICKMAN_ORIGIN = (22, 51)  # Sprite pixel the stickman's (x, y) maps to
+BULLET_RADIUS = 3
+SPRITE_KEY = (255, 0, 255)
+
+# Profiler columns for Game.update and Game.draw
+PROFILE_PHASES = ('spawn', 'bullet_move', 'bullet_hits', 'squads', 'red_army', 'blue_army',
+                  'draw')
+PROFILE_COUNTERS = ('red', 'blue', 'bullets', 'distance_checks')
+
+# Soldiers and bullets within this many pixels of the viewport are drawn
+VIEW_MARGIN = 64
+CAMERA_SPEED = 12  # Pixels per tick while a scroll key is held
+
+# Past this many dirty rects a dirty-rect frame falls back to a full flip
+DIRTY_RECT_LIMIT = 200
+
+def draw_stickman(surface, x, y, team, health, gun_angle):
+    # Draw body
+    color = RED if team == 'red' else BLUE
+    pygame.draw.line(surface, color, (x, y - 20), (x, y + 20), 2)
+    # Draw head
+    pygame.draw.circle(surface, color, (x, y - 30), 10)
+    # Draw arms
+    pygame.draw.line(surface, color, (x, y - 10), (x - 15, y), 2)
+    pygame.draw.line(surface, color, (x, y - 10), (x + 15, y), 2)
+    # Draw legs
+    pygame.draw.line(surface, color, (x, y + 20), (x - 15, y + 40), 2)
+    pygame.draw.line(surface, color, (x, y + 20), (x + 15, y + 40), 2)
+
+    # Draw health bar
+    pygame.draw.rect(surface, BLACK, (x - 20, y - 50, 40, 5))
+    pygame.draw.rect(surface, color, (x - 20, y - 50, 40 * (health/100), 5))
+
+    # Draw gun
+    gun_length = 20
+    gun_end_x = x + math.cos(gun_angle) * gun_length
+    gun_end_y = y + math.sin(gun_angle) * gun_length
+    pygame.draw.line(surface, color, (x, y), (gun_end_x, gun_end_y), 3)
+
+def stickman_key(team, gun_angle, health):
+    angle_step = quantize(gun_angle % (2 * math.pi), 0, 2 * math.pi, ANGLE_STEPS) % ANGLE_STEPS
+    return ('stickman', team, angle_step, quantize(health, 0, 100, HEALTH_STEPS))
+
+def sprite_surface(size):
+    # Colorkeyed rather than per-pixel alpha: nothing is antialiased, and
+    # RLE colorkey blits skip the mostly empty sprite area cheaply
+    surface = pygame.Surface(size)
+    surface.fill(SPRITE_KEY)
+    surface.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+    return surface
+
+def render_sprite(key):
+    if key[0] == 'bullet':
+        size = BULLET_RADIUS * 2 + 1
+        surface = sprite_surface((size, size))
+        color = RED if key[1] == 'red' else BLUE
+        pygame.draw.circle(surface, color, (BULLET_RADIUS, BULLET_RADIUS), BULLET_RADIUS)
+        return surface
+    _, team, angle_step, health_step = key
+    surface = sprite_surface(STICKMAN_SPRITE_SIZE)
+    draw_stickman(surface, STICKMAN_ORIGIN[0], STICKMAN_ORIGIN[1], team,
+                  health_step * 100 / HEALTH_STEPS, angle_step * 2 * math.pi / ANGLE_STEPS)
+    return surface
+
 class Bullet:
+    # Slotted: there can be tens of thousands in flight, and no __dict__
+    # roughly halves what each one costs
+    __slots__ = ('x', 'y', 'dx', 'dy', 'team', 'speed', 'damage', 'uid')
+
     def __init__(self, x, y, dx, dy, team):
         self.x = x
         self.y = y
@@ -31,9 +118,9 @@ class Bullet:
         self.x += self.dx * self.speed
         self.y += self.dy * self.speed
         
-    def draw(self):
+    def draw(self, offset_x=0, offset_y=0):
         color = RED if self.team == 'red' else BLUE
-        pygame.draw.circle(screen, color, (int(self.x), int(self.y)), 3)
+        pygame.draw.circle(screen, color, (int(self.x) - offset_x, int(self.y) - offset_y), 3)
 
 class Stickman:
     def __init__(self, x, y, team):
@@ -45,34 +132,18 @@ class Stickman:
         self.attack_range = 50
         self.attack_damage = 10
         self.target = None
+        self.target_distance = 0.0  # Distance to the target when it was picked
+        self.squad = None  # Set while a squads.Squad moves this soldier
         self.shoot_timer = 0
         self.shoot_delay = 60  # Shoot every 1 second (60 frames)
         
-    def draw(self):
-        # Draw body
-        color = RED if self.team == 'red' else BLUE
-        pygame.draw.line(screen, color, (self.x, self.y - 20), (self.x, self.y + 20), 2)
-        # Draw head
-        pygame.draw.circle(screen, color, (self.x, self.y - 30), 10)
-        # Draw arms
-        pygame.draw.line(screen, color, (self.x, self.y - 10), (self.x - 15, self.y), 2)
-        pygame.draw.line(screen, color, (self.x, self.y - 10), (self.x + 15, self.y), 2)
-        # Draw legs
-        pygame.draw.line(screen, color, (self.x, self.y + 20), (self.x - 15, self.y + 40), 2)
-        pygame.draw.line(screen, color, (self.x, self.y + 20), (self.x + 15, self.y + 40), 2)
-        
-        # Draw health bar
-        pygame.draw.rect(screen, BLACK, (self.x - 20, self.y - 50, 40, 5))
-        pygame.draw.rect(screen, color, (self.x - 20, self.y - 50, 40 * (self.health/100), 5))
-        
-        # Draw gun
-        gun_angle = math.atan2(self.target.y - self.y if self.target else 0, 
-                             self.target.x - self.x if self.target else 1)
-        gun_length = 20
-        gun_end_x = self.x + math.cos(gun_angle) * gun_length
-        gun_end_y = self.y + math.sin(gun_angle) * gun_length
-        color = RED if self.team == 'red' else BLUE
-        pygame.draw.line(screen, color, (self.x, self.y), (gun_end_x, gun_end_y), 3)
+    def gun_angle(self):
+        return math.atan2(self.target.y - self.y if self.target else 0, 
+                          self.target.x - self.x if self.target else 1)
+
+    def draw(self, offset_x=0, offset_y=0):
+        draw_stickman(screen, self.x - offset_x, self.y - offset_y, self.team, self.health,
+                      self.gun_angle())
 
     def move_towards(self, target):
         dx = target.x - self.x
@@ -90,7 +161,7 @@ class Stickman:
             return True
         return False
 
-    def shoot(self, target):
+    def shoot(self, target, pool=None):
         if not target:
             return None
             
@@ -103,77 +174,242 @@ class Stickman:
         dx = dx / distance
         dy = dy / distance
         
+        if pool is not None:
+            return pool.acquire(self.x, self.y, dx, dy, self.team)
         return Bullet(self.x, self.y, dx, dy, self.team)
 
+def split_stats(stats):
+    # Per-team overrides name Stickman attributes ('shoot_delay') or, with a
+    # 'bullet_' prefix, attributes of the bullets that team fires ('bullet_damage')
+    soldier_template = Stickman(0, 0, 'red')
+    bullet_template = Bullet(0, 0, 0, 0, 'red')
+    soldier_stats = {}
+    bullet_stats = {}
+    for name, value in (stats or {}).items():
+        if name.startswith('bullet_') and hasattr(bullet_template, name[len('bullet_'):]):
+            bullet_stats[name[len('bullet_'):]] = value
+        elif hasattr(soldier_template, name):
+            soldier_stats[name] = value
+        else:
+            raise ValueError(f"unknown unit stat: {name}")
+    return soldier_stats, bullet_stats
+
 class Game:
-    def __init__(self):
-        # Define base positions at the bottom of the screen
+    def __init__(self, headless=False, use_spatial_index=True, seed=None,
+                 spawn_jitter=0, spawn_delay=180, red_stats=None, blue_stats=None,
+                 use_sprites=True, dirty_rects=False, profiler=None, targeting=None,
+                 world_size=None, squads=None):
+        self.headless = headless
+        self.profiler = profiler
+        self.targeting = targeting  # None re-picks every target every tick
+        self.squads = squads  # None simulates every soldier on its own
+        self.use_spatial_index = use_spatial_index
+        self.sprites = SpriteCache(render_sprite) if use_sprites else None
+        self.dirty_rects = dirty_rects
+        self.background = None
+        self.previous_rects = None
+        self.previous_positions = {}
+        if not headless:
+            init_display()
+        self.tick = 0
+        self.next_uid = 0
+
+        # Soldiers spawn up to spawn_jitter pixels off their base; the jitter
+        # is the only randomness in a battle, so a seed fixes the outcome
+        self.rng = random.Random(seed)
+        self.spawn_jitter = spawn_jitter
+        self.soldier_stats = {}
+        self.bullet_stats = {}
+        for team, stats in (('red', red_stats), ('blue', blue_stats)):
+            self.soldier_stats[team], self.bullet_stats[team] = split_stats(stats)
+
+        # Define base positions at the bottom of the world
+        self.setup_world(world_size)
         self.red_base_x = 100
-        self.blue_base_x = WIDTH - 100
-        self.base_y = HEIGHT - 80  # Position bases slightly above bottom
+        self.blue_base_x = self.world_width - 100
+        self.base_y = self.world_height - 80  # Position bases slightly above bottom
         
         # Spawn initial armies at their bases
-        self.red_army = [Stickman(self.red_base_x, self.base_y, 'red') 
-                        for _ in range(5)]
-        self.blue_army = [Stickman(self.blue_base_x, self.base_y, 'blue') 
-                         for _ in range(5)]
+        self.red_army = [self.spawn_soldier('red') for _ in range(5)]
+        self.blue_army = [self.spawn_soldier('blue') for _ in range(5)]
         
         # Add spawn timer
         self.spawn_timer = 0
-        self.spawn_delay = 180  # Spawn new soldier every 3 seconds (60 fps * 3)
+        self.spawn_delay = spawn_delay  # Spawn new soldier every 3 seconds (60 fps * 3)
         
         self.bullets = []
-    
+        self.bullet_pool = Pool(Bullet)  # Spent bullets, reused by shoot()
+
+        # Grids over each army for targeting and bullet hits, rebuilt every tick
+        self.red_grid = SpatialGrid()
+        self.blue_grid = SpatialGrid()
+        if self.use_spatial_index:
+            self.red_grid.rebuild(self.red_army)
+            self.blue_grid.rebuild(self.blue_army)
+
+    def setup_world(self, world_size):
+        # The battlefield may be larger than the screen, with a camera (the
+        # viewport's top-left corner in world coordinates) starting over the
+        # red base. On a screen-sized field everything is always drawn.
+        self.world_width, self.world_height = world_size or (WIDTH, HEIGHT)
+        self.scrolling = self.world_width > WIDTH or self.world_height > HEIGHT
+        self.camera_x = 0
+        self.camera_y = max(0, self.world_height - HEIGHT)
+        self.background_camera = None
+
+    def move_camera(self, dx, dy):
+        self.camera_x = max(0, min(self.world_width - WIDTH, self.camera_x + dx))
+        self.camera_y = max(0, min(self.world_height - HEIGHT, self.camera_y + dy))
+
+    def view_bounds(self):
+        # Viewport plus VIEW_MARGIN, in world coordinates
+        return (self.camera_x - VIEW_MARGIN, self.camera_y - VIEW_MARGIN,
+                self.camera_x + WIDTH + VIEW_MARGIN, self.camera_y + HEIGHT + VIEW_MARGIN)
+
+    def spawn_soldier(self, team):
+        x = self.red_base_x if team == 'red' else self.blue_base_x
+        y = self.base_y
+        if self.spawn_jitter:
+            x += self.rng.uniform(-self.spawn_jitter, self.spawn_jitter)
+            y += self.rng.uniform(-self.spawn_jitter, self.spawn_jitter)
+        soldier = Stickman(x, y, team)
+        for name, value in self.soldier_stats[team].items():
+            setattr(soldier, name, value)
+        soldier.uid = self.new_uid()
+        return soldier
+
+    def add_bullet(self, bullet):
+        for name, value in self.bullet_stats[bullet.team].items():
+            setattr(bullet, name, value)
+        bullet.uid = self.new_uid()
+        self.bullets.append(bullet)
+
+    def new_uid(self):
+        # Stable ids let replays and other observers follow entities across ticks
+        self.next_uid += 1
+        return self.next_uid
+
+    def find_nearest(self, soldier, enemies, grid):
+        if self.use_spatial_index:
+            return grid.nearest(soldier.x, soldier.y)
+
+        if self.profiler:
+            self.profiler.count('distance_checks', len(enemies))
+        nearest = None
+        min_dist = float('inf')
+        for enemy in enemies:
+            dist = math.sqrt((enemy.x - soldier.x)**2 + (enemy.y - soldier.y)**2)
+            if dist < min_dist:
+                min_dist = dist
+                nearest = enemy
+        return nearest
+
+    def update_bullets(self):
+        profiler = self.profiler
+        if not self.use_spatial_index:
+            # Moves and hits are interleaved here, so it all counts as hits
+            for bullet in self.bullets[:]:
+                bullet.move()
+            
+                # Remove bullets that are off screen
+                if (bullet.x < 0 or bullet.x > self.world_width or 
+                    bullet.y < 0 or bullet.y > self.world_height):
+                    self.bullets.remove(bullet)
+                    continue
+                
+                # Check bullet collisions
+                if bullet.team == 'red':
+                    for enemy in self.blue_army:
+                        if (abs(bullet.x - enemy.x) < 15 and 
+                            abs(bullet.y - enemy.y) < 20):
+                            enemy.health -= bullet.damage
+                            if bullet in self.bullets:
+                                self.bullets.remove(bullet)
+                            break
+                else:
+                    for enemy in self.red_army:
+                        if (abs(bullet.x - enemy.x) < 15 and 
+                            abs(bullet.y - enemy.y) < 20):
+                            enemy.health -= bullet.damage
+                            if bullet in self.bullets:
+                                self.bullets.remove(bullet)
+                            break
+            if profiler:
+                profiler.lap('bullet_hits')
+            return
+
+        # Bullets only test soldiers in the grid cells under their hit box,
+        # and survivors are compacted into a new list once per tick. Nothing
+        # a bullet does changes another bullet's hit, so moving them all
+        # first and then testing them in order gives the same result.
+        release = self.bullet_pool.release
+        moved = []
+        for bullet in self.bullets:
+            bullet.move()
+
+            # Drop bullets that are off screen
+            if (bullet.x < 0 or bullet.x > self.world_width or
+                bullet.y < 0 or bullet.y > self.world_height):
+                release(bullet)
+                continue
+            moved.append(bullet)
+        if profiler:
+            profiler.lap('bullet_move')
+
+        # Check bullet collisions
+        self.red_grid.rebuild(self.red_army)
+        self.blue_grid.rebuild(self.blue_army)
+        survivors = []
+        for bullet in moved:
+            grid = self.blue_grid if bullet.team == 'red' else self.red_grid
+            enemy = grid.first_within(bullet.x, bullet.y, 15, 20)
+            if enemy is not None:
+                enemy.health -= bullet.damage
+                release(bullet)
+                continue
+            survivors.append(bullet)
+        self.bullets[:] = survivors
+        if profiler:
+            profiler.lap('bullet_hits')
+
     def update(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(self.tick + 1)
+        self.tick += 1
+
         # Handle spawning new soldiers
         self.spawn_timer += 1
         if self.spawn_timer >= self.spawn_delay:
             self.spawn_timer = 0
-            self.red_army.append(Stickman(self.red_base_x, self.base_y, 'red'))
-            self.blue_army.append(Stickman(self.blue_base_x, self.base_y, 'blue'))
+            self.red_army.append(self.spawn_soldier('red'))
+            self.blue_army.append(self.spawn_soldier('blue'))
+        if profiler:
+            profiler.lap('spawn')
         
         # Update bullets
-        for bullet in self.bullets[:]:
-            bullet.move()
-            
-            # Remove bullets that are off screen
-            if (bullet.x < 0 or bullet.x > WIDTH or 
-                bullet.y < 0 or bullet.y > HEIGHT):
-                self.bullets.remove(bullet)
-                continue
-                
-            # Check bullet collisions
-            if bullet.team == 'red':
-                for enemy in self.blue_army:
-                    if (abs(bullet.x - enemy.x) < 15 and 
-                        abs(bullet.y - enemy.y) < 20):
-                        enemy.health -= bullet.damage
-                        if bullet in self.bullets:
-                            self.bullets.remove(bullet)
-                        break
-            else:
-                for enemy in self.red_army:
-                    if (abs(bullet.x - enemy.x) < 15 and 
-                        abs(bullet.y - enemy.y) < 20):
-                        enemy.health -= bullet.damage
-                        if bullet in self.bullets:
-                            self.bullets.remove(bullet)
-                        break
-        
-        # Update red army
+        self.update_bullets()
+
+        # Move and fire the squads far from the fighting
+        if self.squads is not None:
+            self.squads.update(self)
+            if profiler:
+                profiler.lap('squads')
+
+        # Update red army (the blue grid is still current: at most the blue
+        # squads have moved, by one step)
         for soldier in self.red_army[:]:
             if soldier.health <= 0:
                 self.red_army.remove(soldier)
                 continue
+            if soldier.squad is not None:
+                continue
                 
             # Find nearest enemy
-            nearest = None
-            min_dist = float('inf')
-            for enemy in self.blue_army:
-                dist = math.sqrt((enemy.x - soldier.x)**2 + (enemy.y - soldier.y)**2)
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest = enemy
+            if self.targeting is None:
+                nearest = self.find_nearest(soldier, self.blue_army, self.blue_grid)
+            else:
+                nearest = self.targeting.choose(self, soldier, self.blue_army, self.blue_grid)
                     
             if nearest:
                 soldier.target = nearest
@@ -183,24 +419,27 @@ class Game:
                 soldier.shoot_timer += 1
                 if soldier.shoot_timer >= soldier.shoot_delay:
                     soldier.shoot_timer = 0
-                    bullet = soldier.shoot(nearest)
+                    bullet = soldier.shoot(nearest, self.bullet_pool)
                     if bullet:
-                        self.bullets.append(bullet)
+                        self.add_bullet(bullet)
+        if profiler:
+            profiler.lap('red_army')
 
         # Update blue army
+        if self.use_spatial_index:
+            self.red_grid.rebuild(self.red_army)
         for soldier in self.blue_army[:]:
             if soldier.health <= 0:
                 self.blue_army.remove(soldier)
                 continue
+            if soldier.squad is not None:
+                continue
                 
             # Find nearest enemy
-            nearest = None
-            min_dist = float('inf')
-            for enemy in self.red_army:
-                dist = math.sqrt((enemy.x - soldier.x)**2 + (enemy.y - soldier.y)**2)
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest = enemy
+            if self.targeting is None:
+                nearest = self.find_nearest(soldier, self.red_army, self.red_grid)
+            else:
+                nearest = self.targeting.choose(self, soldier, self.red_army, self.red_grid)
                     
             if nearest:
                 soldier.target = nearest
@@ -210,43 +449,341 @@ class Game:
                 soldier.shoot_timer += 1
                 if soldier.shoot_timer >= soldier.shoot_delay:
                     soldier.shoot_timer = 0
-                    bullet = soldier.shoot(nearest)
+                    bullet = soldier.shoot(nearest, self.bullet_pool)
                     if bullet:
-                        self.bullets.append(bullet)
+                        self.add_bullet(bullet)
+        if profiler:
+            profiler.lap('blue_army')
+            self.count_entities()
+
+    def count_entities(self):
+        profiler = self.profiler
+        profiler.count('red', len(self.red_army))
+        profiler.count('blue', len(self.blue_army))
+        profiler.count('bullets', len(self.bullets))
+        profiler.count('distance_checks', self.red_grid.checks + self.blue_grid.checks)
+        self.red_grid.checks = 0
+        self.blue_grid.checks = 0
+
+    def memory_report(self):
+        # Bytes per live entity, and what the bullet pool is holding
+        report = memory_report({
+            'soldiers': self.red_army + self.blue_army,
+            'bullets': self.bullets,
+            'free_bullets': self.bullet_pool.free,
+        })
+        report['bullet_pool'] = self.bullet_pool.stats()
+        return report
+
+    def army_sizes(self):
+        return len(self.red_army), len(self.blue_army)
+
+    def winner(self):
+        # 'red' or 'blue' once the other army is wiped out, 'draw' if both are
+        red, blue = self.army_sizes()
+        if red and blue:
+            return None
+        if red:
+            return 'red'
+        if blue:
+            return 'blue'
+        return 'draw'
+
+    def run(self, ticks, until_winner=False):
+        # Step the simulation as fast as possible, without drawing or frame limiting
+        start = time.perf_counter()
+        steps = 0
+        red, blue = self.army_sizes()
+        peak_red, peak_blue = red, blue
+        while steps < ticks and not (until_winner and not (red and blue)):
+            self.update()
+            steps += 1
+            red, blue = self.army_sizes()
+            peak_red = max(peak_red, red)
+            peak_blue = max(peak_blue, blue)
+        elapsed = time.perf_counter() - start
+        return {
+            'ticks': steps,
+            'seconds': elapsed,
+            'ticks_per_second': steps / elapsed if elapsed > 0 else float('inf'),
+            'winner': self.winner(),
+            'red': red,
+            'blue': blue,
+            'peak_red': peak_red,
+            'peak_blue': peak_blue,
+        }
+
+    def run_until_winner(self, max_ticks=60 * 60 * 60):
+        return self.run(max_ticks, until_winner=True)
+
+    def step(self):
+        # One fixed-timestep update that remembers where everything was, so
+        # draw() can interpolate between the last two ticks
+        self.save_positions()
+        self.update()
+
+    def save_positions(self):
+        self.previous_positions = {e.uid: (e.x, e.y) for entities in
+                                   (self.bullets, self.red_army, self.blue_army)
+                                   for e in entities}
+
+    def interpolate(self, alpha):
+        # Moves everything alpha of the way from its saved position to its
+        # current one; returns what restore_positions() needs to undo it
+        saved = []
+        previous = self.previous_positions
+        for entities in (self.bullets, self.red_army, self.blue_army):
+            for e in entities:
+                position = previous.get(e.uid)
+                if position is not None:
+                    saved.append((e, e.x, e.y))
+                    e.x = position[0] + (e.x - position[0]) * alpha
+                    e.y = position[1] + (e.y - position[1]) * alpha
+        return saved
 
-    def draw(self):
+    def restore_positions(self, saved):
+        for e, x, y in saved:
+            e.x = x
+            e.y = y
+
+    def draw(self, alpha=1.0):
+        if self.headless:
+            return
+        if self.profiler:
+            self.profiler.start()
+        if alpha < 1.0:
+            saved = self.interpolate(alpha)
+            self.draw_frame()
+            self.restore_positions(saved)
+        else:
+            self.draw_frame()
+        if self.profiler:
+            self.profiler.lap('draw')
+
+    def draw_overlay(self):
+        # Profiler overlay, if shown; returns the screen area it covers
+        if self.profiler:
+            return self.profiler.draw_overlay(screen)
+        return None
+
+    def draw_frame(self):
+        view = self.visible()
+        if self.dirty_rects:
+            self.draw_dirty(view)
+            return
         screen.fill(WHITE)
         
         # Draw bases
-        pygame.draw.rect(screen, RED, (self.red_base_x - 30, self.base_y, 60, 60))
-        pygame.draw.rect(screen, BLUE, (self.blue_base_x - 30, self.base_y, 60, 60))
-        
-        # Draw bullets
-        for bullet in self.bullets:
-            bullet.draw()
-            
-        # Draw soldiers
-        for soldier in self.red_army:
-            soldier.draw()
-        for soldier in self.blue_army:
-            soldier.draw()
-        
+        self.draw_bases(screen, self.camera_x, self.camera_y)
+        self.draw_entities(view)
+        self.draw_overlay()
         pygame.display.flip()
 
+    def draw_bases(self, surface, offset_x=0, offset_y=0):
+        for color, x in ((RED, self.red_base_x), (BLUE, self.blue_base_x)):
+            rect = pygame.Rect(x - 30 - offset_x, self.base_y - offset_y, 60, 60)
+            if rect.colliderect(surface.get_rect()):
+                pygame.draw.rect(surface, color, rect)
+
+    def visible(self):
+        # (bullets, soldiers) to draw, in draw order. On a scrolling field the
+        # soldiers come from the grids rather than a walk over both armies;
+        # the blue grid predates the blue army's moves and removals, hence
+        # the padded query and the position and health filters.
+        if not self.scrolling:
+            return self.bullets, self.red_army + self.blue_army
+        x0, y0, x1, y1 = self.view_bounds()
+        bullets = [b for b in self.bullets if x0 <= b.x < x1 and y0 <= b.y < y1]
+        if not self.use_spatial_index:
+            return bullets, [s for army in (self.red_army, self.blue_army) for s in army
+                             if x0 <= s.x < x1 and y0 <= s.y < y1]
+        soldiers = []
+        for grid in (self.red_grid, self.blue_grid):
+            pad = grid.cell_size
+            soldiers += [s for s in grid.query_rect(x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+                         if s.health > 0 and x0 <= s.x < x1 and y0 <= s.y < y1]
+        return bullets, soldiers
+
+    def draw_entities(self, view):
+        bullets, soldiers = view
+        cx, cy = self.camera_x, self.camera_y
+        if self.sprites is None:
+            # Draw bullets
+            for bullet in bullets:
+                bullet.draw(cx, cy)
+            
+            # Draw soldiers
+            for soldier in soldiers:
+                soldier.draw(cx, cy)
+            return
+
+        # Same order, as cached sprites in one blits() call per kind
+        sprites = self.sprites
+        ox, oy = STICKMAN_ORIGIN
+        screen.blits([(sprites.get(('bullet', b.team)),
+                       (int(b.x) - BULLET_RADIUS - cx, int(b.y) - BULLET_RADIUS - cy))
+                      for b in bullets], doreturn=False)
+        screen.blits([(sprites.get(stickman_key(s.team, s.gun_angle(), s.health)),
+                       (int(s.x) - ox - cx, int(s.y) - oy - cy))
+                      for s in soldiers], doreturn=False)
+
+    def entity_rects(self, view):
+        # Screen area each visible bullet and soldier covers this frame
+        bullets, soldiers = view
+        cx, cy = self.camera_x, self.camera_y
+        size = BULLET_RADIUS * 2 + 1
+        w, h = STICKMAN_SPRITE_SIZE
+        ox, oy = STICKMAN_ORIGIN
+        rects = [pygame.Rect(int(b.x) - BULLET_RADIUS - cx, int(b.y) - BULLET_RADIUS - cy,
+                             size, size)
+                 for b in bullets]
+        rects += [pygame.Rect(int(s.x) - ox - cx, int(s.y) - oy - cy, w, h) for s in soldiers]
+        return rects
+
+    def draw_dirty(self, view):
+        # Erase last frame's entities from a cached background, draw this
+        # frame's, and push only those areas to the display. A camera move
+        # changes the whole screen, so it rebuilds the background.
+        camera = (self.camera_x, self.camera_y)
+        if self.background is None or self.background_camera != camera:
+            self.background = pygame.Surface(screen.get_size()).convert()
+            self.background.fill(WHITE)
+            self.draw_bases(self.background, *camera)
+            self.background_camera = camera
+            self.previous_rects = None
+        rects = self.entity_rects(view)
+        previous = self.previous_rects
+        self.previous_rects = rects
+        if previous is None or len(previous) + len(rects) > DIRTY_RECT_LIMIT:
+            screen.blit(self.background, (0, 0))
+            self.draw_entities(view)
+            self.draw_dirty_overlay(rects)
+            pygame.display.flip()
+            return
+        screen.blits([(self.background, rect, rect) for rect in previous], doreturn=False)
+        self.draw_entities(view)
+        self.draw_dirty_overlay(rects)
+        pygame.display.update(previous + rects)
+
+    def draw_dirty_overlay(self, rects):
+        # The overlay is erased and redrawn like any entity
+        overlay = self.draw_overlay()
+        if overlay is not None:
+            rects.append(overlay)
+
+def make_game(backend='object', **kwargs):
+    # 'object' is the Stickman/Bullet simulation, 'numpy' the array one
+    if backend == 'numpy':
+        from battle_numpy import ArrayGame
+        return ArrayGame(**kwargs)
+    return Game(**kwargs)
+
 def main():
-    clock = pygame.time.Clock()
-    game = Game()
-    running = True
+    parser = argparse.ArgumentParser(description="Stickman Battle")
+    parser.add_argument('--headless', action='store_true',
+                        help="simulate without a window and print the result")
+    parser.add_argument('--ticks', type=int, default=60 * 60 * 60,
+                        help="tick limit for a headless run")
+    parser.add_argument('--backend', choices=('object', 'numpy'), default='object',
+                        help="simulation backend")
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help="redraw and update only the screen areas that changed")
+    parser.add_argument('--fps', type=int, default=120,
+                        help="render rate cap, 0 for uncapped; the simulation always steps at 60 Hz")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each phase of a tick; F3 toggles the overlay")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="write per-tick profile records (.csv, otherwise JSON lines)")
+    parser.add_argument('--targeting', choices=('exact', 'cached'), default='exact',
+                        help="re-pick every target every tick, or keep targets between "
+                             "staggered re-picks (object backend only)")
+    parser.add_argument('--target-interval', type=int, default=10,
+                        help="ticks between forced re-picks with cached targeting")
+    parser.add_argument('--target-slack', type=float, default=20.0,
+                        help="pixels a cached target may drift beyond its pick distance")
+    parser.add_argument('--audit-targets', action='store_true',
+                        help="count how often a cached target is not the nearest enemy")
+    parser.add_argument('--squads', action='store_true',
+                        help="simulate soldiers far from any enemy as squads that move and "
+                             "fight as one unit (object backend only)")
+    parser.add_argument('--world', metavar='WxH',
+                        help="battlefield size, e.g. 4000x3000; arrow keys scroll the view")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="print bytes per live entity at the end of a headless run")
+    parser.add_argument('--resume', metavar='PATH',
+                        help="carry on from a checkpoint instead of starting a new battle")
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help="save a checkpoint when the run ends, for --resume; for big "
+                             "battles use --backend numpy, as the object backend takes "
+                             "about a second per million entities each way")
+    args = parser.parse_args()
+
+    options = {}
+    if args.world:
+        options['world_size'] = tuple(int(size) for size in args.world.lower().split('x'))
+    if args.targeting == 'cached':
+        if args.backend != 'object':
+            parser.error("--targeting cached needs --backend object")
+        options['targeting'] = CachedTargeting(args.target_interval, args.target_slack,
+                                               args.audit_targets)
+    if args.squads:
+        if args.backend != 'object':
+            parser.error("--squads needs --backend object")
+        from squads import SquadLOD
+        options['squads'] = SquadLOD()
+
+    profiler = None
+    if args.profile or args.trace:
+        profiler = Profiler(PROFILE_PHASES, PROFILE_COUNTERS, args.trace)
+        profiler.overlay = args.profile
+
+    def new_game(**kwargs):
+        if args.resume:
+            import checkpoint
+            return checkpoint.load(args.resume, args.backend, **kwargs)
+        return make_game(args.backend, **kwargs)
+
+    def save_checkpoint(game):
+        if args.checkpoint:
+            import checkpoint
+            checkpoint.save(game, args.checkpoint)
+            print(f"checkpoint at tick {game.tick} saved to {args.checkpoint}")
+
+    if args.headless:
+        game = new_game(headless=True, profiler=profiler, **options)
+        result = game.run_until_winner(args.ticks)
+        print(f"winner: {result['winner']}  ticks: {result['ticks']}  "
+              f"red: {result['red']}  blue: {result['blue']}  "
+              f"({result['ticks_per_second']:.0f} ticks/s)")
+        if profiler:
+            profiler.close()
+            print("last %d ticks: %s" % (len(profiler.history), "  ".join(
+                f"{name} {value:.3f}" for name, value in profiler.summary().items())))
+        if 'targeting' in options:
+            print("targeting: " + "  ".join(f"{key} {value:.3g}" for key, value
+                                            in options['targeting'].stats().items()))
+        if 'squads' in options:
+            print("squads: " + "  ".join(f"{key} {value:.3g}" for key, value
+                                         in options['squads'].stats().items()))
+        if args.memory_report:
+            for name, entry in game.memory_report().items():
+                print(f"{name}: " + "  ".join(f"{key} {value:.0f}" for key, value in entry.items()))
+        save_checkpoint(game)
+        return
 
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
+    game = new_game(dirty_rects=args.dirty_rects, profiler=profiler, **options)
 
-        game.update()
-        game.draw()
-        clock.tick(60)
+    def step():
+        keys = pygame.key.get_pressed()
+        game.move_camera((keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * CAMERA_SPEED,
+                         (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * CAMERA_SPEED)
+        game.step()
 
+    GameLoop(step, game.draw, profiler.handle_event if profiler else None,
+             max_fps=args.fps, caption="Stickman Battle").run()
+    if profiler:
+        profiler.close()
+    save_checkpoint(game)
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,652 @@
+import random
+
+import numpy as np
+import pygame
+
+import battle_game
+from battle_game import (RED, BLUE, Bullet, Stickman,
+                         Game, init_display, split_stats, render_sprite,
+                         stickman_key, BULLET_RADIUS, STICKMAN_ORIGIN,
+                         STICKMAN_SPRITE_SIZE)
+from sprites import SpriteCache
+
+# Structure-of-arrays backend for battle_game. Soldiers and bullets live in
+# NumPy columns and every phase of Game.update runs as one batch operation.
+# A tick follows the object backend step for step (bullets, then the red
+# army, then the blue army), so both backends can be compared directly.
+
+NO_TARGET = -1
+INDEX_MAX = np.iinfo(np.int64).max
+
+# Pair budget for brute-force nearest searches before switching to a grid,
+# and the queries searched at a time in a grid
+BRUTE_FORCE_PAIRS = 1 << 20
+GRID_QUERIES = 4096
+
+TEAM_CODES = {'red': 0, 'blue': 1}
+
+
+def square(v):
+    # Python's float ** 2 goes through C pow(), which can differ from v * v
+    # in the last bit; float_power takes the same route so distances match
+    return np.float_power(v, 2)
+
+
+def unique_points(x, y):
+    # Distinct positions, the lowest index sitting at each one, and the
+    # position each input maps to. Soldiers spawn stacked on their base and
+    # walk the same path, so this collapses most of a dense army. Sorting
+    # x + iy orders by x, then y, several times faster than lexsort; it is
+    # not stable, so the lowest index is looked up per position.
+    order = np.argsort(x + 1j * y)
+    xs = x[order]
+    ys = y[order]
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return xs[new], ys[new], np.minimum.reduceat(order, np.flatnonzero(new)), inverse
+
+
+class CellGrid:
+    # Enemies bucketed into row-major cells over their bounding box, so any
+    # run of cells within one row maps to one contiguous slice of `order`.
+    # Cells are numbered by np.floor(x / cell_size), which is monotonic and,
+    # unlike floor_divide, cheap; a member always lies in its query's span
+    # as long as both are numbered the same way.
+    def __init__(self, x, y, cell_size):
+        self.cell_size = cell_size
+        cx = np.floor(x / cell_size).astype(np.int64)
+        cy = np.floor(y / cell_size).astype(np.int64)
+        self.min_cx = int(cx.min())
+        self.min_cy = int(cy.min())
+        self.width = int(cx.max()) - self.min_cx + 1
+        self.height = int(cy.max()) - self.min_cy + 1
+        key = (cy - self.min_cy) * self.width + (cx - self.min_cx)
+        self.order = np.argsort(key, kind='stable')
+        counts = np.bincount(key, minlength=self.width * self.height)
+        self.bounds = np.concatenate(([0], np.cumsum(counts)))
+
+    def columns(self, x):
+        return np.floor(x / self.cell_size).astype(np.int64) - self.min_cx
+
+    def rows(self, y):
+        return np.floor(y / self.cell_size).astype(np.int64) - self.min_cy
+
+    def span_members(self, queries, row, col0, col1):
+        # Expand each query into (query, member) pairs for cells col0..col1
+        # of its row; spans must already be clipped to the grid
+        lo = self.bounds[row * self.width + col0]
+        hi = self.bounds[row * self.width + col1 + 1]
+        counts = hi - lo
+        pair_queries = np.repeat(queries, counts)
+        first = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        return pair_queries, self.order[first + np.arange(len(first))]
+
+    def block_members(self, queries, row0, row1, col0, col1):
+        # Pairs for the block of cells row0..row1 x col0..col1, clipped to the grid
+        keep = ((row1 >= 0) & (row0 < self.height) &
+                (col1 >= 0) & (col0 < self.width))
+        queries = queries[keep]
+        row0 = np.maximum(row0[keep], 0)
+        row1 = np.minimum(row1[keep], self.height - 1)
+        col0 = np.maximum(col0[keep], 0)
+        col1 = np.minimum(col1[keep], self.width - 1)
+        counts = row1 - row0 + 1
+        which = np.repeat(np.arange(len(queries)), counts)
+        row = np.repeat(row0 - (np.cumsum(counts) - counts), counts) + np.arange(len(which))
+        return self.span_members(queries[which], row, col0[which], col1[which])
+
+    def disk_members(self, queries, row, radius, qx, qy, first, last):
+        # Pairs for the cells first..last of each row that touch its query's disk
+        top = (row + self.min_cy) * self.cell_size
+        y = qy[queries]
+        gap_y = np.maximum(np.maximum(top - y, y - (top + self.cell_size)), 0)
+        reach_x = np.sqrt(np.maximum(radius**2 - gap_y**2, 0))
+        x = qx[queries]
+        col0 = np.maximum(np.maximum(self.columns(x - reach_x), first), 0)
+        col1 = np.minimum(np.minimum(self.columns(x + reach_x), last), self.width - 1)
+        keep = (gap_y <= radius) & (col0 <= col1)
+        return self.span_members(queries[keep], row[keep], col0[keep], col1[keep])
+
+
+def closest_pairs(pq, pm, qx, qy, ex, ey, index, best_dist, best_index):
+    # Fold candidate pairs into the running (distance, index) minimum per
+    # query; pairs come grouped by query, in ascending order. Squares by
+    # multiplication can be a bit off Python's ** 2 (see square), so they
+    # only pick the pairs near each query's minimum, and those few have
+    # their distances taken the exact way.
+    if not len(pq):
+        return
+    dx = ex[pm] - qx[pq]
+    dy = ey[pm] - qy[pq]
+    rough = dx * dx + dy * dy
+    start = np.flatnonzero(np.concatenate(([True], pq[1:] != pq[:-1])))
+    bound = np.minimum(np.minimum.reduceat(rough, start), best_dist[pq[start]] ** 2)
+    near = rough <= np.repeat(bound * (1 + 1e-9), np.diff(np.append(start, len(pq))))
+    pq = pq[near]
+    pm = pm[near]
+    dist = np.sqrt(square(ex[pm] - qx[pq]) + square(ey[pm] - qy[pq]))
+    previous = best_dist.copy()
+    np.minimum.at(best_dist, pq, dist)
+    best_index[best_dist < previous] = INDEX_MAX
+    tied = dist == best_dist[pq]
+    np.minimum.at(best_index, pq[tied], index[pm[tied]])
+
+
+def nearest_brute(qx, qy, ex, ey, index):
+    best_dist = np.full(len(qx), np.inf)
+    best_index = np.full(len(qx), INDEX_MAX)
+    chunk = max(1, BRUTE_FORCE_PAIRS // len(ex))
+    for start in range(0, len(qx), chunk):
+        stop = start + chunk
+        # Rough squares, taken in place to keep the chunk's peak memory down
+        rough = ex[None, :] - qx[start:stop, None]
+        rough *= rough
+        dy = ey[None, :] - qy[start:stop, None]
+        dy *= dy
+        rough += dy
+        pq, pm = np.nonzero(rough <= rough.min(axis=1, keepdims=True) * (1 + 1e-9))
+        closest_pairs(pq + start, pm, qx, qy, ex, ey, index, best_dist, best_index)
+    return best_index
+
+
+def nearest_grid(qx, qy, ex, ey, index):
+    # Two passes over a grid of about one enemy per cell. The first looks at
+    # the cells around each query (pulled into the grid if it is outside) to
+    # get a real distance as an upper bound; the second collects the enemies
+    # in cells touching the disk of that radius and picks the closest.
+    #
+    # The second bound keeps a flat army from spreading over more than about
+    # two cells per enemy; only a lone enemy leaves both at zero
+    width, height = np.ptp(ex), np.ptp(ey)
+    cell_size = max(float(np.sqrt(width * height / len(ex))),
+                    float(width + height) / len(ex)) or 1.0
+    grid = CellGrid(ex, ey, cell_size)
+
+    # Queries go through in blocks, sorted by position as unique_points
+    # leaves them, so the pair arrays of a block stay in cache
+    best = np.empty(len(qx), dtype=np.int64)
+    for start in range(0, len(qx), GRID_QUERIES):
+        stop = start + GRID_QUERIES
+        best[start:stop] = nearest_block(grid, qx[start:stop], qy[start:stop], ex, ey, index)
+    return best
+
+
+def nearest_block(grid, qx, qy, ex, ey, index):
+    count = len(qx)
+    best_dist = np.full(count, np.inf)
+    best_index = np.full(count, INDEX_MAX)
+
+    row = np.clip(grid.rows(qy), 0, grid.height - 1)
+    col = np.clip(grid.columns(qx), 0, grid.width - 1)
+    pending = np.arange(count)
+    reach = 1
+    while pending.size:
+        r, c = row[pending], col[pending]
+        pq, pm = grid.block_members(pending, r - reach, r + reach, c - reach, c + reach)
+        closest_pairs(pq, pm, qx, qy, ex, ey, index, best_dist, best_index)
+        pending = pending[np.isinf(best_dist[pending])]
+        reach *= 2
+
+    # Gaps to the enemies' own extent, not to the grid's cells, which can be
+    # a cell nearer and would widen every far query's disk
+    gap_x = np.maximum(np.maximum(ex.min() - qx, qx - ex.max()), 0)
+    gap_y = np.maximum(np.maximum(ey.min() - qy, qy - ey.max()), 0)
+
+    # Rings of cells around each query's cell, doubling in width, every ring
+    # searched with the radius the rings inside it have shrunk; the first
+    # pass has covered the cells next to it. A far query's first bound can
+    # be a cell too long, and the disk of that radius then cuts a long lens
+    # through the enemy army; the rings find the closest enemies first and
+    # stop once they cover what is left of the disk.
+    pending = np.arange(count)
+    near, far = 2, 4  # Cell offsets from near up to far - 1
+    while pending.size:
+        # Slack so rounding in the cell arithmetic never drops an exact tie
+        radius = best_dist[pending] * (1 + 1e-9) + 1e-6
+        reach_x = np.sqrt(np.maximum(radius**2 - gap_y[pending]**2, 0))
+        reach_y = np.sqrt(np.maximum(radius**2 - gap_x[pending]**2, 0))
+        x, y = qx[pending], qy[pending]
+        row0 = np.clip(grid.rows(y - reach_y), 0, grid.height - 1)
+        row1 = np.clip(grid.rows(y + reach_y), 0, grid.height - 1)
+        col0 = np.clip(grid.columns(x - reach_x), 0, grid.width - 1)
+        col1 = np.clip(grid.columns(x + reach_x), 0, grid.width - 1)
+        r, c = row[pending], col[pending]
+
+        # Two spans per row of the ring: either side of its hole, or either
+        # side of the query's column in the rows above and below the hole
+        top = np.maximum(r - far + 1, row0)
+        counts = 2 * np.maximum(np.minimum(r + far - 1, row1) - top + 1, 0)
+        queries = np.repeat(pending, counts)
+        k = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ring_row = np.repeat(top, counts) + k // 2
+        r = np.repeat(r, counts)
+        c = np.repeat(c, counts)
+        right = (k % 2).astype(bool)
+        inner = np.abs(ring_row - r) < near
+        first = np.where(right, np.where(inner, c + near, c), c - far + 1)
+        last = np.where(right, c + far - 1, np.where(inner, c - near, c - 1))
+        pq, pm = grid.disk_members(queries, ring_row, np.repeat(radius, counts),
+                                   qx, qy, first, last)
+        closest_pairs(pq, pm, qx, qy, ex, ey, index, best_dist, best_index)
+
+        r, c = row[pending], col[pending]
+        covered = ((r - far < row0) & (r + far > row1) &
+                   (c - far < col0) & (c + far > col1))
+        pending = pending[~covered]
+        near, far = far, far * 2
+    return best_index
+
+
+def outside(q, e):
+    # How far the queries lie beyond the enemies' extent along one axis
+    return np.maximum(np.maximum(e.min() - q, q - e.max()), 0).sum()
+
+
+def nearest_indices(qx, qy, ex, ey):
+    # Index of the nearest enemy for every query, the lowest index on a tie
+    if not len(qx) or not len(ex):
+        return np.full(len(qx), NO_TARGET, dtype=np.int64)
+    ux, uy, first, _ = unique_points(ex, ey)
+    vx, vy, _, inverse = unique_points(qx, qy)
+    if len(vx) * len(ux) <= BRUTE_FORCE_PAIRS:
+        best = nearest_brute(vx, vy, ux, uy, first)
+    elif outside(vx, ux) > outside(vy, uy):
+        # Armies facing each other across x: swap the axes, so the disk of a
+        # query beside the enemies cuts a few long rows instead of a column
+        # of short ones. dx**2 + dy**2 == dy**2 + dx**2, so nothing changes.
+        best = nearest_grid(vy, vx, uy, ux, first)
+    else:
+        best = nearest_grid(vx, vy, ux, uy, first)
+    return best[inverse]
+
+
+def first_within_indices(qx, qy, ex, ey, half_width, half_height):
+    # Lowest enemy index strictly inside each query's box, or NO_TARGET
+    if not len(qx) or not len(ex):
+        return np.full(len(qx), NO_TARGET, dtype=np.int64)
+    ux, uy, first, _ = unique_points(ex, ey)
+    vx, vy, _, inverse = unique_points(qx, qy)
+    grid = CellGrid(ux, uy, 2 * max(half_width, half_height))
+    pq, pm = grid.block_members(np.arange(len(vx)),
+                                grid.rows(vy - half_height), grid.rows(vy + half_height),
+                                grid.columns(vx - half_width), grid.columns(vx + half_width))
+    hit = ((np.abs(vx[pq] - ux[pm]) < half_width) &
+           (np.abs(vy[pq] - uy[pm]) < half_height))
+    best = np.full(len(vx), INDEX_MAX)
+    np.minimum.at(best, pq[hit], first[pm[hit]])
+    best = best[inverse]
+    best[best == INDEX_MAX] = NO_TARGET
+    return best
+
+
+class Army:
+    COLUMNS = ('x', 'y', 'health', 'shoot_timer', 'target')
+
+    def __init__(self, team, stats=None):
+        self.team = team
+
+        # Unit stats are shared by the whole army: the defaults of Stickman
+        # and Bullet with the same per-team overrides the object backend takes
+        self.stats = dict(stats or {})
+        soldier_stats, bullet_stats = split_stats(stats)
+        self.template = Stickman(0, 0, team)
+        for name, value in soldier_stats.items():
+            setattr(self.template, name, value)
+        bullet = Bullet(0, 0, 0, 0, team)
+        for name, value in bullet_stats.items():
+            setattr(bullet, name, value)
+        self.speed = self.template.speed
+        self.attack_range = self.template.attack_range
+        self.shoot_delay = self.template.shoot_delay
+        self.bullet_speed = bullet.speed
+        self.bullet_damage = bullet.damage
+
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.health = np.empty(0)
+        self.shoot_timer = np.empty(0, dtype=np.int64)
+        self.target = np.empty(0, dtype=np.int64)
+        self.prev_x = None
+        self.prev_y = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def save_positions(self):
+        # Positions before a step, kept aligned through remove_dead()
+        self.prev_x = self.x.copy()
+        self.prev_y = self.y.copy()
+
+    def spawn(self, x, y):
+        count = len(x)
+        self.x = np.append(self.x, np.asarray(x, dtype=float))
+        self.y = np.append(self.y, np.asarray(y, dtype=float))
+        self.health = np.append(self.health, np.full(count, float(self.template.health)))
+        self.shoot_timer = np.append(self.shoot_timer,
+                                     np.full(count, self.template.shoot_timer, dtype=np.int64))
+        self.target = np.append(self.target, np.full(count, NO_TARGET, dtype=np.int64))
+
+    def remove_dead(self):
+        # Drop dead soldiers; returns old -> new index map, or None if none died
+        alive = self.health > 0
+        if alive.all():
+            return None
+        remap = np.cumsum(alive) - 1
+        remap[~alive] = NO_TARGET
+        for name in self.COLUMNS:
+            setattr(self, name, getattr(self, name)[alive])
+        if self.prev_x is not None:
+            saved = alive[:len(self.prev_x)]
+            self.prev_x = self.prev_x[saved]
+            self.prev_y = self.prev_y[saved]
+        return remap
+
+    def retarget(self, remap):
+        # Follow the enemy army's compaction
+        if remap is not None and len(self.target):
+            self.target = np.where(self.target >= 0,
+                                   remap[np.maximum(self.target, 0)], NO_TARGET)
+
+
+class Bullets:
+    COLUMNS = ('x', 'y', 'dx', 'dy', 'team')
+
+    def __init__(self):
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.dx = np.empty(0)
+        self.dy = np.empty(0)
+        self.team = np.empty(0, dtype=np.int8)
+        self.prev_x = None
+        self.prev_y = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def save_positions(self):
+        self.prev_x = self.x.copy()
+        self.prev_y = self.y.copy()
+
+    def append(self, x, y, dx, dy, team):
+        self.x = np.concatenate((self.x, x))
+        self.y = np.concatenate((self.y, y))
+        self.dx = np.concatenate((self.dx, dx))
+        self.dy = np.concatenate((self.dy, dy))
+        self.team = np.concatenate((self.team, np.full(len(x), TEAM_CODES[team], dtype=np.int8)))
+
+    def keep(self, mask):
+        for name in self.COLUMNS:
+            setattr(self, name, getattr(self, name)[mask])
+        if self.prev_x is not None:
+            saved = mask[:len(self.prev_x)]
+            self.prev_x = self.prev_x[saved]
+            self.prev_y = self.prev_y[saved]
+
+
+class ArrayGame(Game):
+    def __init__(self, headless=False, seed=None, spawn_jitter=0, spawn_delay=180,
+                 red_stats=None, blue_stats=None, use_sprites=True, dirty_rects=False,
+                 profiler=None, world_size=None):
+        self.headless = headless
+        self.profiler = profiler
+        self.sprites = SpriteCache(render_sprite) if use_sprites else None
+        self.dirty_rects = dirty_rects
+        self.background = None
+        self.previous_rects = None
+        if not headless:
+            init_display()
+        self.tick = 0
+
+        # Same layout, spawn jitter draws and unit stats as the object backend
+        self.rng = random.Random(seed)
+        self.spawn_jitter = spawn_jitter
+        self.setup_world(world_size)
+        self.red_base_x = 100
+        self.blue_base_x = self.world_width - 100
+        self.base_y = self.world_height - 80
+
+        self.red_army = Army('red', red_stats)
+        self.blue_army = Army('blue', blue_stats)
+        self.spawn_soldiers('red', 5)
+        self.spawn_soldiers('blue', 5)
+
+        self.spawn_timer = 0
+        self.spawn_delay = spawn_delay
+
+        self.bullets = Bullets()
+
+    def spawn_soldiers(self, team, count=1):
+        army = self.red_army if team == 'red' else self.blue_army
+        base_x = self.red_base_x if team == 'red' else self.blue_base_x
+        xs = []
+        ys = []
+        for _ in range(count):
+            x, y = base_x, self.base_y
+            if self.spawn_jitter:
+                x += self.rng.uniform(-self.spawn_jitter, self.spawn_jitter)
+                y += self.rng.uniform(-self.spawn_jitter, self.spawn_jitter)
+            xs.append(x)
+            ys.append(y)
+        army.spawn(xs, ys)
+
+    def update(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(self.tick + 1)
+        self.tick += 1
+
+        # Handle spawning new soldiers
+        self.spawn_timer += 1
+        if self.spawn_timer >= self.spawn_delay:
+            self.spawn_timer = 0
+            self.spawn_soldiers('red')
+            self.spawn_soldiers('blue')
+        if profiler:
+            profiler.lap('spawn')
+
+        self.update_bullets()
+        self.update_army(self.red_army, self.blue_army)
+        if profiler:
+            profiler.lap('red_army')
+        self.update_army(self.blue_army, self.red_army)
+        if profiler:
+            profiler.lap('blue_army')
+            # Pair tests happen inside NumPy calls, so distance_checks stays 0
+            profiler.count('red', len(self.red_army))
+            profiler.count('blue', len(self.blue_army))
+            profiler.count('bullets', len(self.bullets))
+
+    def update_bullets(self):
+        bullets = self.bullets
+        if not len(bullets):
+            return
+        speed = np.array([self.red_army.bullet_speed,
+                          self.blue_army.bullet_speed])[bullets.team]
+        bullets.x = bullets.x + bullets.dx * speed
+        bullets.y = bullets.y + bullets.dy * speed
+
+        # Remove bullets that are off screen
+        bullets.keep((bullets.x >= 0) & (bullets.x <= self.world_width) &
+                     (bullets.y >= 0) & (bullets.y <= self.world_height))
+        if self.profiler:
+            self.profiler.lap('bullet_move')
+
+        # Every bullet hits the first enemy in list order under its box. No
+        # soldier moves or leaves the army in this phase, so the hits do not
+        # depend on each other and damage can be applied with one scatter.
+        spent = np.zeros(len(bullets), dtype=bool)
+        for army, enemies in ((self.red_army, self.blue_army),
+                              (self.blue_army, self.red_army)):
+            mine = np.flatnonzero(bullets.team == TEAM_CODES[army.team])
+            hits = first_within_indices(bullets.x[mine], bullets.y[mine],
+                                        enemies.x, enemies.y, 15, 20)
+            landed = hits >= 0
+            np.subtract.at(enemies.health, hits[landed], army.bullet_damage)
+            spent[mine[landed]] = True
+        bullets.keep(~spent)
+        if self.profiler:
+            self.profiler.lap('bullet_hits')
+
+    def update_army(self, army, enemies):
+        enemies.retarget(army.remove_dead())
+        if not len(army) or not len(enemies):
+            army.target[:] = NO_TARGET
+            return
+
+        # Find nearest enemy (dead enemies still count until their own phase)
+        target = nearest_indices(army.x, army.y, enemies.x, enemies.y)
+        army.target = target
+        tx = enemies.x[target]
+        ty = enemies.y[target]
+
+        dx = tx - army.x
+        dy = ty - army.y
+        distance = np.sqrt(square(dx) + square(dy))
+        moving = distance > army.attack_range
+        army.x[moving] += (dx[moving] / distance[moving]) * army.speed
+        army.y[moving] += (dy[moving] / distance[moving]) * army.speed
+
+        # Handle shooting
+        army.shoot_timer += 1
+        firing = np.flatnonzero(army.shoot_timer >= army.shoot_delay)
+        if not firing.size:
+            return
+        army.shoot_timer[firing] = 0
+        sx = army.x[firing]
+        sy = army.y[firing]
+        dx = tx[firing] - sx
+        dy = ty[firing] - sy
+        distance = np.sqrt(square(dx) + square(dy))
+        aimed = distance != 0
+        self.bullets.append(sx[aimed], sy[aimed], dx[aimed] / distance[aimed],
+                            dy[aimed] / distance[aimed], army.team)
+
+    def save_positions(self):
+        for columns in (self.bullets, self.red_army, self.blue_army):
+            columns.save_positions()
+
+    def interpolate(self, alpha):
+        # Saved positions cover the leading entries: later spawns and shots
+        # are appended and compaction keeps the order
+        saved = []
+        for columns in (self.bullets, self.red_army, self.blue_army):
+            if columns.prev_x is None:
+                continue
+            saved.append((columns, columns.x, columns.y))
+            n = len(columns.prev_x)
+            columns.x = columns.x.copy()
+            columns.y = columns.y.copy()
+            columns.x[:n] = columns.prev_x + (columns.x[:n] - columns.prev_x) * alpha
+            columns.y[:n] = columns.prev_y + (columns.y[:n] - columns.prev_y) * alpha
+        return saved
+
+    def restore_positions(self, saved):
+        for columns, x, y in saved:
+            columns.x = x
+            columns.y = y
+
+    def memory_report(self):
+        # Column bytes per live entity; nothing here is pooled
+        report = {}
+        for name, groups in (('soldiers', (self.red_army, self.blue_army)),
+                             ('bullets', (self.bullets,))):
+            count = sum(len(group) for group in groups)
+            total = sum(getattr(group, column).nbytes
+                        for group in groups for column in group.COLUMNS)
+            report[name] = {
+                'count': count,
+                'bytes': total,
+                'bytes_per_entity': total / count if count else 0.0,
+            }
+        return report
+
+    def visible(self):
+        # Index arrays of the bullets, red and blue soldiers to draw; a plain
+        # slice of everything on a screen-sized field
+        if not self.scrolling:
+            return slice(None), slice(None), slice(None)
+        x0, y0, x1, y1 = self.view_bounds()
+        return tuple(np.flatnonzero((group.x >= x0) & (group.x < x1) &
+                                    (group.y >= y0) & (group.y < y1))
+                     for group in (self.bullets, self.red_army, self.blue_army))
+
+    def draw_entities(self, view):
+        screen = battle_game.screen
+        if self.sprites is not None:
+            self.draw_sprites(screen, view)
+            return
+        cx, cy = self.camera_x, self.camera_y
+        shown, red_shown, blue_shown = view
+
+        # Draw bullets
+        for x, y, team in zip(self.bullets.x[shown].tolist(), self.bullets.y[shown].tolist(),
+                              self.bullets.team[shown].tolist()):
+            color = RED if team == TEAM_CODES['red'] else BLUE
+            pygame.draw.circle(screen, color, (int(x) - cx, int(y) - cy), 3)
+
+        # Draw soldiers through one reusable Stickman per army
+        for army, enemies, shown in ((self.red_army, self.blue_army, red_shown),
+                                     (self.blue_army, self.red_army, blue_shown)):
+            soldier = Stickman(0, 0, army.team)
+            target = Stickman(0, 0, enemies.team)
+            for x, y, health, t in zip(army.x[shown].tolist(), army.y[shown].tolist(),
+                                       army.health[shown].tolist(),
+                                       army.target[shown].tolist()):
+                soldier.x, soldier.y, soldier.health = x, y, health
+                if t >= 0:
+                    target.x = enemies.x[t]
+                    target.y = enemies.y[t]
+                    soldier.target = target
+                else:
+                    soldier.target = None
+                soldier.draw(cx, cy)
+
+    def entity_rects(self, view):
+        cx, cy = self.camera_x, self.camera_y
+        size = BULLET_RADIUS * 2 + 1
+        w, h = STICKMAN_SPRITE_SIZE
+        ox, oy = STICKMAN_ORIGIN
+        shown = view[0]
+        rects = [pygame.Rect(x - BULLET_RADIUS - cx, y - BULLET_RADIUS - cy, size, size)
+                 for x, y in zip(self.bullets.x[shown].astype(int).tolist(),
+                                 self.bullets.y[shown].astype(int).tolist())]
+        for army, shown in ((self.red_army, view[1]), (self.blue_army, view[2])):
+            rects += [pygame.Rect(x - ox - cx, y - oy - cy, w, h)
+                      for x, y in zip(army.x[shown].astype(int).tolist(),
+                                      army.y[shown].astype(int).tolist())]
+        return rects
+
+    def draw_sprites(self, screen, view):
+        sprites = self.sprites
+        cx, cy = self.camera_x, self.camera_y
+        shown = view[0]
+        bullet_sprites = [sprites.get(('bullet', team)) for team in ('red', 'blue')]
+        screen.blits([(bullet_sprites[team], (x - BULLET_RADIUS - cx, y - BULLET_RADIUS - cy))
+                      for x, y, team in zip(self.bullets.x[shown].astype(int).tolist(),
+                                            self.bullets.y[shown].astype(int).tolist(),
+                                            self.bullets.team[shown].tolist())],
+                     doreturn=False)
+
+        # Gun angles for a whole army at once; no target aims right
+        ox, oy = STICKMAN_ORIGIN
+        for army, enemies, shown in ((self.red_army, self.blue_army, view[1]),
+                                     (self.blue_army, self.red_army, view[2])):
+            x = army.x[shown]
+            y = army.y[shown]
+            dx = np.ones(len(x))
+            dy = np.zeros(len(x))
+            if len(enemies):
+                aimed = army.target[shown] >= 0
+                target = np.where(aimed, army.target[shown], 0)
+                dx = np.where(aimed, enemies.x[target] - x, dx)
+                dy = np.where(aimed, enemies.y[target] - y, dy)
+            angles = np.arctan2(dy, dx)
+            screen.blits([(sprites.get(stickman_key(army.team, angle, health)),
+                           (x - ox - cx, y - oy - cy))
+                          for x, y, health, angle in zip(x.astype(int).tolist(),
+                                                         y.astype(int).tolist(),
+                                                         army.health[shown].tolist(),
+                                                         angles.tolist())],
+                         doreturn=False)
@@ -0,0 +1,390 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# Headless scaling benchmarks for the three games. Every scenario is run at
+# each entity count in its own fresh process (so peak memory is not shared
+# between runs), timed tick by tick, and written to a JSON results file.
+# Results are compared against a stored baseline: throughput, p90 latency
+# and peak memory per run, plus the scaling exponent of each scenario (the
+# slope of log tick time against log entity count between the two largest
+# counts). The exponent does not depend on the machine, so a path that
+# turns quadratic shows up even against a baseline taken elsewhere.
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+COUNTS = (10, 100, 1000, 10000)
+TICKS = 200  # Timed ticks per run, unless MAX_SECONDS runs out first
+MAX_SECONDS = 5.0
+WARMUP_TICKS = 3
+MEMORY_TICKS = 3  # Ticks run under tracemalloc for the memory peak
+
+# A run regresses when it is worse than the baseline by more than the
+# relative tolerance and by more than the absolute floor (which keeps
+# microsecond noise in the small runs from tripping it). Scale them up
+# with --tolerance-scale on a noisy machine rather than loosening them
+# here: at 50% a 10000-soldier battle could lose 40% and pass.
+TOLERANCES = {
+    'mean_ms': (0.3, 0.25),
+    'p90_ms': (0.5, 0.5),
+    'peak_memory_kb': (0.25, 64),
+}
+# The exponent may grow by this much; an exponent near 1.6 must not be
+# able to reach 2 (quadratic) and pass
+SCALING_TOLERANCE = 0.2
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'benchmark_baseline.json')
+
+
+def scatter(count, rng, x0, x1, y0, y1):
+    return ([rng.uniform(x0, x1) for _ in range(count)],
+            [rng.uniform(y0, y1) for _ in range(count)])
+
+
+def battle_game(count, backend='object', headless=True):
+    # count soldiers split between the armies, red on the left half of the
+    # screen and blue on the right, with no reinforcements
+    from battle_game import WIDTH, HEIGHT, make_game
+    rng = random.Random(0)
+    game = make_game(backend, headless=headless, spawn_delay=10 ** 9)
+    red = scatter(count // 2, rng, 0, WIDTH / 2, 0, HEIGHT)
+    blue = scatter(count - count // 2, rng, WIDTH / 2, WIDTH, 0, HEIGHT)
+    if backend == 'numpy':
+        from battle_numpy import Army
+        game.red_army = Army('red')
+        game.blue_army = Army('blue')
+        game.red_army.spawn(*red)
+        game.blue_army.spawn(*blue)
+        return game
+    for team, (xs, ys) in (('red', red), ('blue', blue)):
+        army = []
+        for x, y in zip(xs, ys):
+            soldier = game.spawn_soldier(team)
+            soldier.x = x
+            soldier.y = y
+            army.append(soldier)
+        if team == 'red':
+            game.red_army = army
+        else:
+            game.blue_army = army
+    return game
+
+
+def battle_update(count):
+    return battle_game(count).update
+
+
+def battle_update_numpy(count):
+    return battle_game(count, 'numpy').update
+
+
+def battle_draw(count):
+    return battle_game(count, headless=False).draw
+
+
+def ballbreaker_game(count, backend='object', **options):
+    # count balls over platforms that never break, so the load stays put
+    import game
+    random.seed(0)
+    rng = random.Random(0)
+    breaker = game.make_game(backend, **options)
+    for platform in breaker.platforms:
+        platform.health = platform.max_health = 10 ** 9
+    balls = [game.Ball(x, y) for x, y in
+             zip(*scatter(count, rng, 10, game.WIDTH - 10, 10, game.HEIGHT - 10))]
+    if backend == 'numpy':
+        breaker.balls.extend(balls)
+    else:
+        breaker.balls = balls
+    return breaker
+
+
+def ballbreaker_update(count):
+    return ballbreaker_game(count).update
+
+
+def ballbreaker_update_numpy(count):
+    return ballbreaker_game(count, 'numpy').update
+
+
+def ballbreaker_update_swept(count):
+    # Ten ticks of motion per update, as a fast-forward would run
+    return ballbreaker_game(count, 'swept', step_ticks=10).update
+
+
+def fighter_projectiles(count):
+    # count projectiles in flight between the two fighters, topped back up
+    # every tick as they hit or leave the screen
+    import rrr
+    rng = random.Random(0)
+    player1 = rrr.Fighter(200, rrr.HEIGHT - 100, rrr.RED, rrr.PLAYER1_CONTROLS)
+    player2 = rrr.Fighter(600, rrr.HEIGHT - 100, rrr.BLUE, rrr.PLAYER2_CONTROLS)
+    players = (player1, player2)
+
+    def refill():
+        for i, player in enumerate(players):
+            target = count // 2 if i == 0 else count - count // 2
+            while len(player.projectiles) < target:
+                player.projectiles.append(player.projectile_pool.acquire(
+                    rng.uniform(0, rrr.WIDTH), player.y - 10, rng.choice((-1, 1))))
+
+    def tick():
+        refill()
+        player1.move()
+        player2.move()
+        rrr.check_hits(player1, player2)
+        player1.health = player2.health = 100
+
+    return tick
+
+
+def fighter_rollback(count):
+    # A worst-case netplay frame with count projectiles in flight: restore
+    # the snapshot from MAX_ROLLBACK frames back and step forward again,
+    # taking a snapshot before each step as the session does
+    import netplay
+    import rrr
+    rng = random.Random(0)
+    player1, player2 = netplay.new_fight()
+    for i, player in enumerate((player1, player2)):
+        for _ in range(count // 2 if i == 0 else count - count // 2):
+            player.projectiles.append(player.projectile_pool.acquire(
+                rng.uniform(0, rrr.WIDTH), 0, rng.choice((-1, 1)), 0))
+    start = netplay.fight_state(player1, player2)
+    ring = netplay.SnapshotRing(netplay.MAX_ROLLBACK + 2)
+
+    def tick():
+        player1.restore(start[0])
+        player2.restore(start[1])
+        for frame in range(netplay.MAX_ROLLBACK):
+            ring.save(frame, netplay.fight_state(player1, player2))
+            rrr.step_fight(player1, player2, rrr.RIGHT, rrr.LEFT | rrr.UP)
+
+    return tick
+
+
+SCENARIOS = {
+    'battle_update': battle_update,
+    'battle_update_numpy': battle_update_numpy,
+    'battle_draw': battle_draw,
+    'ballbreaker_update': ballbreaker_update,
+    'ballbreaker_update_numpy': ballbreaker_update_numpy,
+    'ballbreaker_update_swept': ballbreaker_update_swept,
+    'fighter_projectiles': fighter_projectiles,
+    'fighter_rollback': fighter_rollback,
+}
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(job):
+    name, count, ticks, max_seconds = job
+    setup = SCENARIOS[name]
+    tick = setup(count)
+    for _ in range(WARMUP_TICKS):
+        tick()
+    latencies = []
+    start = time.perf_counter()
+    while not latencies or (len(latencies) < ticks and
+                            time.perf_counter() - start < max_seconds):
+        t0 = time.perf_counter()
+        tick()
+        latencies.append(time.perf_counter() - t0)
+
+    # Memory is measured on a fresh setup: tracemalloc would skew the timings
+    tracemalloc.start()
+    tick = setup(count)
+    for _ in range(MEMORY_TICKS):
+        tick()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'scenario': name,
+        'count': count,
+        'ticks': len(latencies),
+        'ticks_per_second': len(latencies) / total if total else 0.0,
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def scaling(runs):
+    # Exponent of tick time against entity count between the two largest
+    # counts of each scenario: ~1 for linear work, ~2 for quadratic. Kept
+    # with the counts it was measured between, since it is only comparable
+    # to an exponent over the same counts.
+    exponents = {}
+    by_scenario = {}
+    for run in runs:
+        by_scenario.setdefault(run['scenario'], []).append(run)
+    for name, scenario_runs in by_scenario.items():
+        scenario_runs.sort(key=lambda run: run['count'])
+        if len(scenario_runs) < 2:
+            continue
+        small, large = scenario_runs[-2], scenario_runs[-1]
+        if small['mean_ms'] > 0 and large['mean_ms'] > 0:
+            exponents[name] = {
+                'counts': [small['count'], large['count']],
+                'exponent': (math.log(large['mean_ms'] / small['mean_ms']) /
+                             math.log(large['count'] / small['count'])),
+            }
+    return exponents
+
+
+def machine():
+    import pygame
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def run_suite(scenarios=None, counts=COUNTS, ticks=TICKS, max_seconds=MAX_SECONDS,
+              report=None):
+    # report(run) is called as each run finishes
+    jobs = [(name, count, ticks, max_seconds)
+            for name in (scenarios or SCENARIOS) for count in counts]
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for job in jobs:
+            run = pool.apply(run_scenario, (job,))
+            runs.append(run)
+            if report:
+                report(run)
+    return {
+        'machine': machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': runs,
+        'scaling': scaling(runs),
+    }
+
+
+def compare(results, baseline, scale=1.0):
+    # Regressions of results against baseline, as readable strings. Runs
+    # the baseline has no numbers for are listed too: they are not checked
+    # at all until the baseline is saved with them.
+    regressions = []
+    previous = {(run['scenario'], run['count']): run for run in baseline['runs']}
+    known = {run['scenario'] for run in baseline['runs']}
+    for run in results['runs']:
+        old = previous.get((run['scenario'], run['count']))
+        if old is None:
+            if run['scenario'] in known:
+                regressions.append(f"{run['scenario']} x{run['count']}: not in the baseline")
+            continue
+        for metric, (tolerance, floor) in TOLERANCES.items():
+            new_value = run[metric]
+            old_value = old[metric]
+            if (new_value > old_value * (1 + tolerance * scale) and
+                    new_value - old_value > floor):
+                regressions.append(f"{run['scenario']} x{run['count']}: {metric} "
+                                   f"{old_value:.3f} -> {new_value:.3f}")
+    for name in sorted({run['scenario'] for run in results['runs']} - known):
+        regressions.append(f"{name}: not in the baseline")
+    for name, new in results['scaling'].items():
+        old = baseline['scaling'].get(name)
+        if old is None:
+            continue
+        if old['counts'] != new['counts']:
+            regressions.append(f"{name}: baseline scaling is over {old['counts']}, "
+                               f"not {new['counts']}")
+        elif new['exponent'] > old['exponent'] + SCALING_TOLERANCE * scale:
+            regressions.append(f"{name}: scaling exponent over {new['counts']} "
+                               f"{old['exponent']:.2f} -> {new['exponent']:.2f}")
+    return regressions
+
+
+def merge(baseline, results):
+    # The baseline with the runs of every scenario in results replaced, so
+    # one scenario can be re-measured without touching the others
+    ran = {run['scenario'] for run in results['runs']}
+    runs = [run for run in baseline['runs'] if run['scenario'] not in ran] + results['runs']
+    return dict(results, runs=runs, scaling=scaling(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless scaling benchmarks")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument('--counts', default=','.join(map(str, COUNTS)),
+                        help="comma-separated entity counts")
+    parser.add_argument('--ticks', type=int, default=TICKS)
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS,
+                        help="time limit per run; large counts stop early")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results in the baseline, replacing the runs "
+                             "of the scenarios run")
+    parser.add_argument('--tolerance-scale', type=float, default=1.0,
+                        help="multiply every regression tolerance, e.g. 2 on noisy machines")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.counts.split(',')]
+    print(f"{'scenario':<22}{'count':>7}{'ticks/s':>11}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'p99 ms':>9}{'peak KB':>10}")
+
+    def report(run):
+        print(f"{run['scenario']:<22}{run['count']:>7}"
+              f"{run['ticks_per_second']:>11.1f}{run['p50_ms']:>9.3f}"
+              f"{run['p90_ms']:>9.3f}{run['p99_ms']:>9.3f}"
+              f"{run['peak_memory_kb']:>10.0f}", flush=True)
+
+    results = run_suite(args.scenario, counts, args.ticks, args.max_seconds, report)
+    for name, scale in results['scaling'].items():
+        small, large = scale['counts']
+        print(f"{name}: time grows as count^{scale['exponent']:.2f} from {small} to {large}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                results = merge(json.load(f), results)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance_scale)
+    if regressions:
+        print(f"{len(regressions)} regression(s) or missing run(s) against {args.baseline}:")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+    print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
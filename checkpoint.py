@@ -0,0 +1,402 @@
+import argparse
+import gc
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from itertools import repeat
+from operator import attrgetter
+
+import numpy as np
+
+import battle_game
+from battle_game import Bullet, Stickman
+from battle_numpy import Army, ArrayGame, Bullets, NO_TARGET, TEAM_CODES
+
+# Checkpoints of a battle_game battle, so a long headless run can stop and
+# resume in another process. Either backend can save, and either can
+# resume from any checkpoint.
+#
+# The file is columnar: a small fixed header (tick, uid and spawn counters,
+# world size, table sizes), the RNG state, the per-team unit stats as JSON,
+# then three tables (red soldiers, blue soldiers, bullets), each stored a
+# whole column at a time. Every column is an array of fixed-width values
+# starting on an 8-byte boundary, so saving is one write per column and
+# loading maps the file and takes each column as an array without parsing
+# anything per entity. Only the object backend then builds Stickman and
+# Bullet objects from the columns.
+#
+# The numpy backend is the checkpoint path for big battles: its columns
+# go to and from the file as they are, in tens of milliseconds for a
+# million entities. The object backend has to visit every soldier and
+# bullet to fill the columns and allocate a Python object for each one
+# on loading, and that allocation is most of its cost: about a second
+# each way at a million entities, still a few times faster than pickling.
+#
+# What a soldier or bullet does not store comes from its team's unit stats,
+# as in Game.spawn_soldier and Game.add_bullet. A soldier's target is the
+# index of the enemy it was aimed at, NO_TARGET if that enemy has since
+# died. Cached targeting and squads keep state of their own and are not
+# covered.
+#
+# File layout:
+#   header    b'SMCP' version tick next_uid spawn_timer spawn_delay spawn_jitter
+#             world_width world_height red blue bullets stats_length
+#   rng       random.Random state: version, 625 words, gauss_next
+#   stats     JSON {'red': {...}, 'blue': {...}}, padded to 8 bytes
+#   tables    red soldiers, blue soldiers, bullets; column by column
+
+MAGIC = b'SMCP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHIIIIdIIIIII')
+RNG = struct.Struct('<B625I?d')
+ALIGN = 8
+
+SOLDIER_COLUMNS = (('uid', '<u4'), ('x', '<f8'), ('y', '<f8'), ('health', '<f8'),
+                   ('shoot_timer', '<i8'), ('target', '<i8'))
+BULLET_COLUMNS = (('uid', '<u4'), ('team', 'u1'), ('x', '<f8'), ('y', '<f8'),
+                  ('dx', '<f8'), ('dy', '<f8'))
+
+TEAMS = ('red', 'blue')
+
+
+def padding(size):
+    return -size % ALIGN
+
+
+def check_supported(game):
+    if getattr(game, 'targeting', None) is not None or getattr(game, 'squads', None) is not None:
+        raise ValueError("checkpoints cover the default targeting without squads")
+
+
+def unit_stats(game):
+    # The red_stats / blue_stats overrides the game was made with
+    if isinstance(game, ArrayGame):
+        return {army.team: army.stats for army in (game.red_army, game.blue_army)}
+    stats = {}
+    for team in TEAMS:
+        stats[team] = dict(game.soldier_stats[team])
+        for name, value in game.bullet_stats[team].items():
+            stats[team]['bullet_' + name] = value
+    return stats
+
+
+def enemy_indices(army, enemies):
+    # Index in enemies of each soldier's target, NO_TARGET for none or one
+    # no longer in the army; matched by id() in bulk, as a dict from
+    # objects to indices costs a cache miss per soldier
+    if not enemies:
+        return np.full(len(army), NO_TARGET, dtype=np.int64)
+    targets = np.fromiter(map(id, map(attrgetter('target'), army)), np.uint64, len(army))
+    ids = np.fromiter(map(id, enemies), np.uint64, len(enemies))
+    order = np.argsort(ids)
+    ids = ids[order]
+    found = np.minimum(np.searchsorted(ids, targets), len(ids) - 1)
+    return np.where(ids[found] == targets, order[found], NO_TARGET)
+
+
+def object_tables(game):
+    # Column arrays for the three tables of a battle_game.Game
+    tables = []
+    for army, enemies in ((game.red_army, game.blue_army), (game.blue_army, game.red_army)):
+        table = {name: np.fromiter(map(attrgetter(name), army), dtype, len(army))
+                 for name, dtype in SOLDIER_COLUMNS if name != 'target'}
+        table['target'] = enemy_indices(army, enemies)
+        tables.append(table)
+    bullets = game.bullets
+    table = {name: np.fromiter(map(attrgetter(name), bullets), dtype, len(bullets))
+             for name, dtype in BULLET_COLUMNS if name != 'team'}
+    table['team'] = np.fromiter(map(TEAM_CODES.__getitem__, map(attrgetter('team'), bullets)),
+                                np.uint8, len(bullets))
+    tables.append(table)
+    return tables
+
+
+def array_tables(game):
+    # The same from an ArrayGame's columns; it has no uids, so they are 0
+    tables = []
+    for army in (game.red_army, game.blue_army):
+        columns = {name: getattr(army, name) for name in Army.COLUMNS}
+        columns['uid'] = np.zeros(len(army), dtype=np.uint32)
+        tables.append(columns)
+    bullets = game.bullets
+    columns = {name: getattr(bullets, name) for name in Bullets.COLUMNS}
+    columns['uid'] = np.zeros(len(bullets), dtype=np.uint32)
+    tables.append(columns)
+    return tables
+
+
+def save(game, path):
+    # Written to a temporary file and renamed over path, so a crash leaves
+    # the previous checkpoint intact
+    check_supported(game)
+    if isinstance(game, ArrayGame):
+        tables = array_tables(game)
+        next_uid = 0
+    else:
+        tables = object_tables(game)
+        next_uid = game.next_uid
+    stats = json.dumps(unit_stats(game)).encode()
+    version, words, gauss_next = game.rng.getstate()
+    counts = [len(table['x']) for table in tables]
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, game.tick, next_uid, game.spawn_timer,
+                            game.spawn_delay, game.spawn_jitter, game.world_width,
+                            game.world_height, *counts, len(stats)))
+        f.write(RNG.pack(version, *words, gauss_next is not None, gauss_next or 0.0))
+        f.write(stats)
+        f.write(bytes(padding(HEADER.size + RNG.size + len(stats))))
+        for table, columns in zip(tables, (SOLDIER_COLUMNS, SOLDIER_COLUMNS, BULLET_COLUMNS)):
+            for name, dtype in columns:
+                column = np.ascontiguousarray(table[name], dtype=dtype)
+                f.write(memoryview(column).cast('B'))
+                f.write(bytes(padding(column.nbytes)))
+    os.replace(temporary, path)
+
+
+def read_table(data, offset, columns, count, convert):
+    # {name: convert(column)} for one table, and the offset after it; the
+    # columns are views of the mapping, so convert must copy them out
+    table = {}
+    for name, dtype in columns:
+        column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        table[name] = convert(column)
+        offset += column.nbytes + padding(column.nbytes)
+    return table, offset
+
+
+def load(path, backend='object', **options):
+    # A game of the given backend (see battle_game.make_game) that carries
+    # on exactly where the saved one stopped. Other options go to its
+    # constructor; the world, spawning and unit stats are the saved ones.
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        (magic, version, tick, next_uid, spawn_timer, spawn_delay, spawn_jitter,
+         world_width, world_height, red, blue, bullets, stats_length) = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} battle checkpoint")
+        rng = RNG.unpack_from(data, HEADER.size)
+        offset = HEADER.size + RNG.size
+        stats = json.loads(bytes(data[offset:offset + stats_length]))
+        offset += stats_length + padding(offset + stats_length)
+
+        options.update(spawn_jitter=spawn_jitter, spawn_delay=spawn_delay,
+                       red_stats=stats['red'], blue_stats=stats['blue'],
+                       world_size=(world_width, world_height))
+        game = battle_game.make_game(backend, **options)
+        check_supported(game)
+        convert = np.copy if isinstance(game, ArrayGame) else np.ndarray.tolist
+        tables = []
+        for columns, count in ((SOLDIER_COLUMNS, red), (SOLDIER_COLUMNS, blue),
+                               (BULLET_COLUMNS, bullets)):
+            table, offset = read_table(data, offset, columns, count, convert)
+            tables.append(table)
+
+    game.tick = tick
+    game.spawn_timer = spawn_timer
+    game.rng.setstate((rng[0], tuple(rng[1:626]), rng[627] if rng[626] else None))
+    if isinstance(game, ArrayGame):
+        restore_arrays(game, tables)
+    else:
+        restore_objects(game, tables, next_uid)
+    return game
+
+
+def restore_arrays(game, tables):
+    for army, table in zip((game.red_army, game.blue_army), tables):
+        for name in Army.COLUMNS:
+            setattr(army, name, table[name])
+        army.prev_x = army.prev_y = None
+    bullets = game.bullets
+    table = tables[2]
+    for name in ('x', 'y', 'dx', 'dy'):
+        setattr(bullets, name, table[name])
+    bullets.team = table['team'].astype(np.int8)
+    bullets.prev_x = bullets.prev_y = None
+
+
+def restore_objects(game, tables, next_uid):
+    # Millions of objects are built here and none of them can be garbage
+    # yet, so the collector is kept from scanning them over and over
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        game.next_uid = next_uid
+        armies = []
+        for team, table in zip(TEAMS, tables):
+            uids = table['uid']
+            if not next_uid:
+                # Saved by the array backend, which has no uids
+                uids = [game.new_uid() for _ in uids]
+            stats = game.soldier_stats[team].items()
+            army = list(map(Stickman, table['x'], table['y'], repeat(team)))
+            for soldier, uid, health, shoot_timer in zip(army, uids, table['health'],
+                                                         table['shoot_timer']):
+                for name, value in stats:
+                    setattr(soldier, name, value)
+                soldier.health = health
+                soldier.shoot_timer = shoot_timer
+                soldier.uid = uid
+            armies.append(army)
+        for army, enemies, table in zip(armies, armies[::-1], tables):
+            for soldier, target in zip(army, table['target']):
+                if target != NO_TARGET:
+                    soldier.target = enemies[target]
+        game.red_army[:], game.blue_army[:] = armies
+
+        table = tables[2]
+        uids = table['uid']
+        if not next_uid:
+            uids = [game.new_uid() for _ in uids]
+        bullets = list(map(Bullet, table['x'], table['y'], table['dx'], table['dy'],
+                           map(TEAMS.__getitem__, table['team'])))
+        for bullet, uid in zip(bullets, uids):
+            bullet.uid = uid
+        for team in TEAMS:
+            for name, value in game.bullet_stats[team].items():
+                for bullet in bullets:
+                    if bullet.team == team:
+                        setattr(bullet, name, value)
+        game.bullets[:] = bullets
+    finally:
+        if collecting:
+            gc.enable()
+
+    # update() rebuilds the grids before it uses them; until then they
+    # only need to let go of the soldiers the constructor made
+    game.previous_positions = {}
+    game.red_grid.rebuild([])
+    game.blue_grid.rebuild([])
+
+
+def state(game):
+    # What a checkpoint of game would hold, as plain values for comparing
+    tables = array_tables(game) if isinstance(game, ArrayGame) else object_tables(game)
+    return (game.tick, game.spawn_timer, game.rng.getstate(),
+            [{name: np.asarray(column).tolist() for name, column in table.items()}
+             for table in tables])
+
+
+def big_game(backend, entities, seed=None):
+    # A headless game holding `entities` soldiers and bullets, half of them
+    # soldiers split between the armies, each aimed at an enemy
+    rng = np.random.default_rng(seed)
+    game = battle_game.make_game(backend, headless=True, seed=seed)
+    per_army = entities // 4
+    bullets = entities - 2 * per_army
+    x = rng.uniform(0, game.world_width, entities)
+    y = rng.uniform(0, game.world_height, entities)
+    angle = rng.uniform(0, 2 * np.pi, bullets)
+    target = rng.integers(0, per_army, 2 * per_army)
+    if isinstance(game, ArrayGame):
+        for number, army in enumerate((game.red_army, game.blue_army)):
+            part = slice(number * per_army, (number + 1) * per_army)
+            army.x, army.y, army.health, army.shoot_timer, army.target = (
+                np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64))
+            army.spawn(x[part], y[part])
+            army.target = target[part]
+        game.bullets.append(x[-bullets:], y[-bullets:], np.cos(angle), np.sin(angle), 'red')
+        return game
+
+    collecting = gc.isenabled()
+    gc.disable()
+    armies = []
+    for number, team in enumerate(TEAMS):
+        part = slice(number * per_army, (number + 1) * per_army)
+        army = []
+        for sx, sy in zip(x[part].tolist(), y[part].tolist()):
+            soldier = Stickman(sx, sy, team)
+            soldier.uid = game.new_uid()
+            army.append(soldier)
+        armies.append(army)
+    for number, (army, enemies) in enumerate(zip(armies, armies[::-1])):
+        for soldier, index in zip(army, target[number * per_army:(number + 1) * per_army].tolist()):
+            soldier.target = enemies[index]
+    game.red_army[:], game.blue_army[:] = armies
+    game.bullets[:] = []
+    for bx, by, dx, dy in zip(x[-bullets:].tolist(), y[-bullets:].tolist(),
+                              np.cos(angle).tolist(), np.sin(angle).tolist()):
+        game.add_bullet(Bullet(bx, by, dx, dy, 'red'))
+    if collecting:
+        gc.enable()
+    return game
+
+
+def check(ticks, entities, seed=None, path='checkpoint_check.smcp'):
+    # For each backend: a battle saved halfway and resumed must end exactly
+    # like the one left running, and a big state must save and load fast
+    ok = True
+    for backend in ('object', 'numpy'):
+        game = battle_game.make_game(backend, headless=True, seed=seed, spawn_jitter=20,
+                                     spawn_delay=30)
+        for _ in range(ticks):
+            game.update()
+        save(game, path)
+        resumed = load(path, backend, headless=True)
+        for _ in range(ticks):
+            game.update()
+            resumed.update()
+        same = state(resumed) == state(game)
+        ok = ok and same
+        red, blue = game.army_sizes()
+        print(f"{backend}: resumed at tick {ticks} of {2 * ticks} with {red} red, {blue} blue "
+              f"and {len(game.bullets)} bullets: {'identical' if same else 'DIFFERENT'}")
+
+        game = big_game(backend, entities, seed)
+        start = time.perf_counter()
+        save(game, path)
+        saved = time.perf_counter()
+        resumed = load(path, backend, headless=True)
+        loaded = time.perf_counter()
+        same = state(resumed) == state(game)
+        ok = ok and same
+        del resumed
+        line = (f"{backend}: {entities} entities in {os.path.getsize(path) / 2 ** 20:.1f} MB, "
+                f"save {(saved - start) * 1000:.0f} ms, load {(loaded - saved) * 1000:.0f} ms, "
+                f"{'identical' if same else 'DIFFERENT'}")
+        if backend == 'object':
+            # Chains of targets recurse past the pickler's limit, so the
+            # comparison pickles the objects without them
+            soldiers = game.red_army + game.blue_army
+            targets = [soldier.target for soldier in soldiers]
+            for soldier in soldiers:
+                soldier.target = None
+            start = time.perf_counter()
+            pickled = pickle.dumps((game.red_army, game.blue_army, game.bullets),
+                                   pickle.HIGHEST_PROTOCOL)
+            dumped = time.perf_counter()
+            pickle.loads(pickled)
+            for soldier, target in zip(soldiers, targets):
+                soldier.target = target
+            line += (f" (pickle without targets: {len(pickled) / 2 ** 20:.1f} MB, "
+                     f"dump {(dumped - start) * 1000:.0f} ms, "
+                     f"load {(time.perf_counter() - dumped) * 1000:.0f} ms)")
+        print(line)
+        del game
+    os.remove(path)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that battle checkpoints resume exactly, and time them. "
+                    "Use the numpy backend to checkpoint big battles: the object "
+                    "backend builds a Python object per soldier and bullet, and takes "
+                    "about a second to save or load a million of them.")
+    parser.add_argument('--ticks', type=int, default=1500,
+                        help="ticks before and after the checkpoint in the resume check")
+    parser.add_argument('--entities', type=int, default=1000000,
+                        help="soldiers and bullets in the timed checkpoint")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not check(args.ticks, args.entities, args.seed):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
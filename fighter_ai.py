@@ -0,0 +1,217 @@
+import argparse
+import math
+import random
+import sys
+import time
+
+import rrr
+from netplay import new_fight, fight_state
+from rrr import WIDTH, LEFT, RIGHT, UP, SLIDE, KICK, PROJECTILE, PUNCH
+
+# CPU opponent for Stickman Fighter. Every ACTION_FRAMES frames it picks
+# its next action by Monte Carlo search: each candidate action is tried
+# in rollouts that play it and then random actions for both fighters for
+# ROLLOUT_DEPTH more actions, and a UCB1 bandit over the candidates
+# decides which one the next rollout tries. When the time budget runs
+# out, the candidate with the best average outcome is played. How strong
+# it plays comes down to how many rollouts fit in the budget.
+#
+# Rollouts run rrr.step_fight itself, on a scratch pair of fighters that
+# each rollout resets from snapshots of the real fight, the way netplay
+# rolls back. The search therefore always plays by the game's own rules.
+# `fighter_ai.py --check` makes sure a restored fight steps exactly like
+# the one it was taken from, which is what rollouts rely on.
+
+THINK_BUDGET = 0.008  # Seconds of search per decision
+ACTION_FRAMES = 6  # Frames each chosen action is held
+ROLLOUT_DEPTH = 8  # Actions per side in a rollout after the first
+EXPLORATION = 0.5  # UCB1 exploration weight; rewards are around -1..1
+HEALTH_SCALE = 40.0  # Health swing that counts as a reward of 1
+DISTANCE_WEIGHT = 0.1  # Small pull towards the other fighter
+
+# (name, input on the action's first frame, input on the rest)
+ACTIONS = (
+    ('idle', 0, 0),
+    ('left', LEFT, LEFT),
+    ('right', RIGHT, RIGHT),
+    ('jump', UP, 0),
+    ('jump left', UP | LEFT, LEFT),
+    ('jump right', UP | RIGHT, RIGHT),
+    ('punch', PUNCH, 0),
+    ('kick', KICK, 0),
+    ('slide', SLIDE, 0),
+    ('projectile', PROJECTILE, 0),
+)
+
+
+class FighterAI:
+    def __init__(self, index, budget=THINK_BUDGET, action_frames=ACTION_FRAMES,
+                 depth=ROLLOUT_DEPTH, seed=None):
+        # index is 0 to play player1, 1 to play player2
+        self.index = index
+        self.budget = budget
+        self.action_frames = action_frames
+        self.depth = depth
+        self.random = random.Random(seed)
+        self.fighters = new_fight()  # Scratch fight the rollouts play out on
+        # Each action's inputs over the frames it is held
+        self.sequences = [(first,) + (rest,) * (action_frames - 1) for _, first, rest in ACTIONS]
+        self.action = ACTIONS[0]
+        self.frames_left = 0
+        self.decisions = 0
+        self.rollouts = 0
+        self.simulated_frames = 0
+        self.think_time = 0.0
+
+    def buttons(self, player1, player2):
+        # Input bits for this frame, searching for a new action when the
+        # current one has been held long enough
+        if self.frames_left == 0:
+            self.action = self.search(fight_state(player1, player2))
+            self.frames_left = self.action_frames
+        self.frames_left -= 1
+        _, first, rest = self.action
+        return first if self.frames_left == self.action_frames - 1 else rest
+
+    def search(self, root):
+        start = time.perf_counter()
+        deadline = start + self.budget
+        count = len(ACTIONS)
+        visits = [0] * count
+        totals = [0.0] * count
+        tried = 0
+        while tried < count or time.perf_counter() < deadline:
+            if tried < count:
+                choice = tried
+            else:
+                log_tried = math.log(tried)
+                choice = max(range(count), key=lambda i: totals[i] / visits[i] +
+                             EXPLORATION * math.sqrt(log_tried / visits[i]))
+            totals[choice] += self.rollout(root, choice)
+            visits[choice] += 1
+            tried += 1
+        self.decisions += 1
+        self.rollouts += tried
+        self.think_time += time.perf_counter() - start
+        best = max(range(count), key=lambda i: totals[i] / visits[i])
+        return ACTIONS[best]
+
+    def rollout(self, root, choice):
+        # Reward for playing ACTIONS[choice] now, from one random playout
+        index = self.index
+        player1, player2 = fighters = self.fighters
+        player1.restore(root[0])
+        player2.restore(root[1])
+        me = fighters[index]
+        them = fighters[1 - index]
+        before = me.health - them.health
+        rng = self.random
+        sequences = self.sequences
+        step_fight = rrr.step_fight
+        mine = sequences[choice]
+        for depth in range(self.depth + 1):
+            if depth:
+                mine = rng.choice(sequences)
+            theirs = rng.choice(sequences)
+            inputs1, inputs2 = (mine, theirs) if index == 0 else (theirs, mine)
+            for input1, input2 in zip(inputs1, inputs2):
+                step_fight(player1, player2, input1, input2)
+            self.simulated_frames += self.action_frames
+            if player1.health <= 0 or player2.health <= 0:
+                break
+        swing = (me.health - them.health) - before
+        return swing / HEALTH_SCALE - DISTANCE_WEIGHT * abs(me.x - them.x) / WIDTH
+
+    def stats(self):
+        think = self.think_time or 1e-9
+        return {
+            'decisions': self.decisions,
+            'rollouts': self.rollouts,
+            'rollouts_per_decision': self.rollouts / self.decisions if self.decisions else 0.0,
+            'rollouts_per_second': self.rollouts / think,
+            'frames_per_second': self.simulated_frames / think,
+        }
+
+
+def random_inputs(rng):
+    buttons = rng.choice((0, LEFT, RIGHT, UP, LEFT | UP, RIGHT | UP))
+    if rng.random() < 0.1:
+        buttons |= rng.choice((SLIDE, KICK, PROJECTILE, PUNCH))
+    return buttons
+
+
+def check(frames, seed=None):
+    # Play a fight on random inputs and, every frame, restore a second
+    # fight from its snapshot and step both the same way, comparing the
+    # results; returns (first differing frame or None, restore and step
+    # frames/s)
+    rng = random.Random(seed)
+    inputs = [(random_inputs(rng), random_inputs(rng)) for _ in range(frames)]
+    player1, player2 = new_fight()
+    copy1, copy2 = new_fight()
+    for frame, (input1, input2) in enumerate(inputs):
+        state = fight_state(player1, player2)
+        copy1.restore(state[0])
+        copy2.restore(state[1])
+        rrr.step_fight(player1, player2, input1, input2)
+        rrr.step_fight(copy1, copy2, input1, input2)
+        if fight_state(copy1, copy2) != fight_state(player1, player2):
+            return frame, 0.0
+        if player1.health <= 0 or player2.health <= 0:
+            player1.health = player2.health = 100
+
+    start = time.perf_counter()
+    copy1.restore(state[0])
+    copy2.restore(state[1])
+    for input1, input2 in inputs:
+        rrr.step_fight(copy1, copy2, input1, input2)
+    return None, frames / (time.perf_counter() - start)
+
+
+def play_out(ai, seed=None, max_frames=60 * 60):
+    # One fight of the CPU (player2) against random inputs; True if it wins
+    rng = random.Random(seed)
+    player1, player2 = new_fight()
+    held = 0
+    for frame in range(max_frames):
+        if frame % ACTION_FRAMES == 0:
+            held = random_inputs(rng)
+        rrr.step_fight(player1, player2, held, ai.buttons(player1, player2))
+        held &= rrr.HELD_MASK
+        if player1.health <= 0 or player2.health <= 0:
+            break
+    return player2.health > player1.health
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stickman Fighter CPU opponent")
+    parser.add_argument('--check', type=int, metavar='FRAMES', default=0,
+                        help="check that fights restored from snapshots step like the "
+                             "originals; exits 1 if they differ")
+    parser.add_argument('--games', type=int, default=0,
+                        help="fights against a random player, with rollout rates")
+    parser.add_argument('--budget', type=float, default=THINK_BUDGET * 1000,
+                        help="milliseconds of search per decision")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.check:
+        frame, rate = check(args.check, args.seed)
+        if frame is not None:
+            print(f"restored fight differs from the original at frame {frame}")
+            sys.exit(1)
+        print(f"{args.check} frames identical; rrr.step_fight {rate:.0f} frames/s")
+
+    if args.games:
+        ai = FighterAI(1, budget=args.budget / 1000, seed=args.seed)
+        wins = sum(play_out(ai, None if args.seed is None else args.seed + game)
+                   for game in range(args.games))
+        stats = ai.stats()
+        print(f"won {wins}/{args.games} against random inputs; "
+              f"{stats['rollouts_per_second']:.0f} rollouts/s "
+              f"({stats['rollouts_per_decision']:.1f} per decision, "
+              f"{stats['frames_per_second']:.0f} simulated frames/s)")
+
+
+if __name__ == "__main__":
+    main()
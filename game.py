@@ -1,15 +1,17 @@
 import pygame
 import random
 import math
+import argparse
 
-# Initialize Pygame
-pygame.init()
+from gameloop import GameLoop
+from profiler import Profiler
+from spatial import StaticGrid
+from sprites import SpriteCache
 
 # Set up the display
 WIDTH = 800
 HEIGHT = 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Ball Breaker")
+screen = None
 
 # Colors
 WHITE = (255, 255, 255)
@@ -20,9 +22,40 @@ GREEN = (0, 255, 0)
 YELLOW = (255, 255, 0)
 GRAY = (128, 128, 128)
 
-# Font
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
+# Fonts, loaded with the display
+font = None
+small_font = None
+
+def init_display():
+    # Open the window and load the fonts on first draw, so games that are
+    # only stepped (offline progress, benchmarks) never touch the display
+    global screen, font, small_font
+    if screen is None:
+        pygame.display.init()
+        pygame.font.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Ball Breaker")
+        font = pygame.font.Font(None, 36)
+        small_font = pygame.font.Font(None, 24)
+    return screen
+
+# Profiler columns for Game.update and Game.draw
+PROFILE_PHASES = ('balls', 'draw')
+PROFILE_COUNTERS = ('balls', 'platforms', 'collision_checks')
+
+BALL_RADIUS = 8
+PLATFORM_CELL_SIZE = 64
+
+INSTRUCTIONS = (
+    "Click SPACE to buy a ball",
+    "Balls spawn in center and move randomly",
+    "Destroy platforms to earn money and score!"
+)
+
+def render_text(key):
+    # Text surfaces for the HUD cache, keyed by ('large' or 'small', text, color)
+    size, text, color = key
+    return (font if size == 'large' else small_font).render(text, True, color)
 
 class Ball:
     def __init__(self, x, y):
@@ -31,7 +64,9 @@ class Ball:
         angle = random.uniform(0, 2 * math.pi)
         self.dx = math.cos(angle) * 3
         self.dy = math.sin(angle) * 3
-        self.radius = 8
+        self.prev_x = x  # Position before the last step, for interpolation
+        self.prev_y = y
+        self.radius = BALL_RADIUS
         self.color = (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
         self.last_collided_platform = None
         self.collision_cooldown = 0
@@ -50,8 +85,10 @@ class Ball:
             self.dy *= -1
             self.y = max(self.radius, min(HEIGHT - self.radius, self.y))
 
-    def draw(self):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
+    def draw(self, alpha=1.0):
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+        pygame.draw.circle(screen, self.color, (int(x), int(y)), self.radius)
 
     def check_collision(self, platform):
         closest_x = max(platform.x, min(self.x, platform.x + platform.width))
@@ -83,16 +120,29 @@ class Platform:
     def is_destroyed(self):
         return self.health <= 0
 
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
+        pygame.draw.rect(surface, self.color, (self.x, self.y, self.width, self.height))
         health_width = (self.width * self.health) / self.max_health
-        pygame.draw.rect(screen, BLACK, (self.x, self.y - 10, self.width, 5))
-        pygame.draw.rect(screen, GREEN, (self.x, self.y - 10, health_width, 5))
+        pygame.draw.rect(surface, BLACK, (self.x, self.y - 10, self.width, 5))
+        pygame.draw.rect(surface, GREEN, (self.x, self.y - 10, health_width, 5))
 
 class Game:
-    def __init__(self):
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.tick = 0
         self.balls = []
         self.platforms = []
+        # Platforms by cell, grown by a ball radius so each ball only tests
+        # the platforms listed in the cell under its centre
+        self.platform_grid = StaticGrid(PLATFORM_CELL_SIZE, BALL_RADIUS)
+        # Retained drawing: the background with every platform on it, patched
+        # where a platform was damaged or destroyed, and HUD text rendered
+        # once per distinct string
+        self.platform_layer = None
+        self.changed_platforms = set()
+        self.texts = SpriteCache(render_text)
         self.money = 100
         self.ball_cost = 20
         self.score = 0
@@ -111,7 +161,12 @@ class Game:
             (550, 380, 100, 20, 6),
         ]
         for x, y, w, h, health in platform_configs:
-            self.platforms.append(Platform(x, y, w, h, health))
+            self.add_platform(Platform(x, y, w, h, health))
+
+    def add_platform(self, platform):
+        self.platforms.append(platform)
+        self.platform_grid.insert(platform)
+        self.changed_platforms.add(platform)
 
     def buy_ball(self):
         if self.money >= self.ball_cost:
@@ -120,65 +175,163 @@ class Game:
             return True
         return False
 
+    def step(self):
+        # Fixed-timestep update that keeps the previous ball positions
+        for ball in self.balls:
+            ball.prev_x = ball.x
+            ball.prev_y = ball.y
+        self.update()
+
     def update(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(self.tick + 1)
+        self.tick += 1
+        checks = 0
         for ball in self.balls:
             ball.move()
+            checks += self.collide(ball)
+        if profiler:
+            profiler.lap('balls')
+            profiler.count('balls', len(self.balls))
+            profiler.count('platforms', len(self.platforms))
+            profiler.count('collision_checks', checks)
+
+    def collide(self, ball):
+        # Bounce the ball off the first platform it touches and damage that
+        # platform; returns how many platforms were tested
+        checks = 0
+        for platform in self.platform_grid.query(ball.x, ball.y):
+            if platform == ball.last_collided_platform and ball.collision_cooldown > 0:
+                continue
+            checks += 1
+            if ball.check_collision(platform):
+                # 判断反弹方向
+                overlap_x = min(abs(ball.x - platform.x), abs(ball.x - (platform.x + platform.width)))
+                overlap_y = min(abs(ball.y - platform.y), abs(ball.y - (platform.y + platform.height)))
+                if overlap_x < overlap_y:
+                    ball.dx *= -1
+                else:
+                    ball.dy *= -1
+
+                ball.last_collided_platform = platform
+                ball.collision_cooldown = 10
+
+                self.damage_platform(platform)
+                break
+        return checks
+
+    def damage_platform(self, platform):
+        # One hit on the platform; a destroyed one is removed and paid for
+        self.changed_platforms.add(platform)
+        if platform.take_damage():
+            if platform.is_destroyed():
+                self.platforms.remove(platform)
+                self.platform_grid.remove(platform)
+                self.score += 10
+                self.money += 5
+
+    def draw(self, alpha=1.0):
+        init_display()
+        if self.profiler:
+            self.profiler.start()
+        self.update_platform_layer()
+        screen.blit(self.platform_layer, (0, 0))
+        self.draw_balls(alpha)
+        for key, position in self.hud():
+            screen.blit(self.texts.get(key), position)
+        if self.profiler:
+            self.profiler.draw_overlay(screen, 10, 130)
+            self.profiler.lap('draw')
+
+    def update_platform_layer(self):
+        # Redraw the layer under each changed platform (health bar included),
+        # with whatever platforms overlap that area
+        layer = self.platform_layer
+        if layer is None:
+            layer = self.platform_layer = pygame.Surface((WIDTH, HEIGHT)).convert()
+            areas = [layer.get_rect()]
+        else:
+            areas = [pygame.Rect(p.x, p.y - 10, p.width, p.height + 10)
+                     for p in self.changed_platforms]
+        self.changed_platforms.clear()
+        for area in areas:
+            layer.set_clip(area)
+            layer.fill(BLACK)
             for platform in self.platforms:
-                if platform == ball.last_collided_platform and ball.collision_cooldown > 0:
-                    continue
-                if ball.check_collision(platform):
-                    # 判断反弹方向
-                    overlap_x = min(abs(ball.x - platform.x), abs(ball.x - (platform.x + platform.width)))
-                    overlap_y = min(abs(ball.y - platform.y), abs(ball.y - (platform.y + platform.height)))
-                    if overlap_x < overlap_y:
-                        ball.dx *= -1
-                    else:
-                        ball.dy *= -1
-
-                    ball.last_collided_platform = platform
-                    ball.collision_cooldown = 10
-
-                    if platform.take_damage():
-                        if platform.is_destroyed():
-                            self.platforms.remove(platform)
-                            self.score += 10
-                            self.money += 5
-                    break
-
-    def draw(self):
-        screen.fill(BLACK)
-        for platform in self.platforms:
-            platform.draw()
-        for ball in self.balls:
-            ball.draw()
-        screen.blit(font.render(f"Money: ${self.money}", True, WHITE), (10, 10))
-        screen.blit(font.render(f"Score: {self.score}", True, WHITE), (10, 50))
-        screen.blit(small_font.render(f"Ball Cost: ${self.ball_cost}", True, WHITE), (10, 90))
-        instructions = [
-            "Click SPACE to buy a ball",
-            "Balls spawn in center and move randomly",
-            "Destroy platforms to earn money and score!"
+                if area.colliderect((platform.x, platform.y - 10, platform.width,
+                                     platform.height + 10)):
+                    platform.draw(layer)
+        layer.set_clip(None)
+
+    def hud(self):
+        # (text cache key, position) for every HUD line, in drawing order
+        lines = [
+            (('large', f"Money: ${self.money}", WHITE), (10, 10)),
+            (('large', f"Score: {self.score}", WHITE), (10, 50)),
+            (('small', f"Ball Cost: ${self.ball_cost}", WHITE), (10, 90)),
+        ]
+        lines += [(('small', inst, GRAY), (10, HEIGHT - 80 + i * 20))
+                  for i, inst in enumerate(INSTRUCTIONS)]
+        lines += [
+            (('small', f"Active Balls: {len(self.balls)}", WHITE), (WIDTH - 150, 10)),
+            (('small', f"Platforms: {len(self.platforms)}", WHITE), (WIDTH - 150, 30)),
         ]
-        for i, inst in enumerate(instructions):
-            screen.blit(small_font.render(inst, True, GRAY), (10, HEIGHT - 80 + i * 20))
-        screen.blit(small_font.render(f"Active Balls: {len(self.balls)}", True, WHITE), (WIDTH - 150, 10))
-        screen.blit(small_font.render(f"Platforms: {len(self.platforms)}", True, WHITE), (WIDTH - 150, 30))
+        return lines
+
+    def draw_balls(self, alpha=1.0):
+        for ball in self.balls:
+            ball.draw(alpha)
+
+def make_game(backend='object', **kwargs):
+    # 'object' moves Ball objects one at a time, 'numpy' all balls as arrays,
+    # 'swept' Ball objects with continuous collision (step_ticks per update)
+    if backend == 'numpy':
+        from game_numpy import ArrayGame
+        return ArrayGame(**kwargs)
+    if backend == 'swept':
+        from swept import SweptGame
+        return SweptGame(**kwargs)
+    return Game(**kwargs)
 
 def main():
-    clock = pygame.time.Clock()
-    game = Game()
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                if not game.buy_ball():
-                    print("Not enough money!")
-        game.update()
-        game.draw()
+    parser = argparse.ArgumentParser(description="Ball Breaker")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each phase of a tick; F3 toggles the overlay")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="write per-tick profile records (.csv, otherwise JSON lines)")
+    parser.add_argument('--backend', choices=('object', 'numpy', 'swept'), default='object',
+                        help="ball physics backend")
+    parser.add_argument('--speed', type=int, default=1,
+                        help="ticks of motion per step (fast-forward; swept backend only)")
+    args = parser.parse_args()
+    options = {}
+    if args.speed != 1:
+        if args.backend != 'swept':
+            parser.error("--speed needs --backend swept")
+        options['step_ticks'] = args.speed
+
+    profiler = None
+    if args.profile or args.trace:
+        profiler = Profiler(PROFILE_PHASES, PROFILE_COUNTERS, args.trace)
+        profiler.overlay = args.profile
+    init_display()
+    game = make_game(args.backend, profiler=profiler, **options)
+
+    def handle_event(event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+            if not game.buy_ball():
+                print("Not enough money!")
+        elif profiler:
+            profiler.handle_event(event)
+
+    def render(alpha):
+        game.draw(alpha)
         pygame.display.flip()
-        clock.tick(60)
+
+    GameLoop(game.step, render, handle_event, caption="Ball Breaker").run()
+    if profiler:
+        profiler.close()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+import numpy as np
+import pygame
+
+import game
+from game import WIDTH, HEIGHT, BALL_RADIUS, Ball, Game
+
+# Structure-of-arrays backend for Ball Breaker. Balls live in NumPy
+# columns and a tick runs as batch steps over all of them: integration,
+# wall bounces, circle-vs-rect tests against every platform, bounce axes
+# and cooldowns. The object game handles balls one at a time, and a ball
+# that destroys a platform removes it for every ball after it in the same
+# tick; update() reproduces that exactly, so both backends stay in step.
+
+NO_PLATFORM = -1
+COOLDOWN = 10  # Ticks a ball ignores the platform it last bounced off
+
+# Ball-platform pairs tested per batch, to bound the temporaries
+PAIR_BUDGET = 1 << 16
+
+
+def square(v):
+    # float_power squares through C pow(), like Python's ** 2, so the
+    # distances round the same way as Ball.check_collision's
+    return np.float_power(v, 2)
+
+
+class Balls:
+    COLUMNS = ('x', 'y', 'dx', 'dy', 'prev_x', 'prev_y', 'color', 'last_platform',
+               'cooldown')
+
+    def __init__(self):
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.dx = np.empty(0)
+        self.dy = np.empty(0)
+        self.prev_x = np.empty(0)
+        self.prev_y = np.empty(0)
+        self.color = np.empty((0, 3), dtype=np.uint8)
+        self.last_platform = np.empty(0, dtype=np.int64)
+        self.cooldown = np.empty(0, dtype=np.int64)
+        self.radius = BALL_RADIUS
+
+    def __len__(self):
+        return len(self.x)
+
+    def extend(self, balls):
+        # Takes Ball objects, so new balls draw from `random` exactly as the
+        # object game's do
+        columns = {
+            'x': [ball.x for ball in balls],
+            'y': [ball.y for ball in balls],
+            'dx': [ball.dx for ball in balls],
+            'dy': [ball.dy for ball in balls],
+            'prev_x': [ball.prev_x for ball in balls],
+            'prev_y': [ball.prev_y for ball in balls],
+        }
+        for name, values in columns.items():
+            setattr(self, name, np.concatenate((getattr(self, name),
+                                                np.asarray(values, dtype=float))))
+        self.color = np.concatenate((self.color, np.asarray([ball.color for ball in balls],
+                                                            dtype=np.uint8).reshape(-1, 3)))
+        self.last_platform = np.concatenate((self.last_platform,
+                                             np.full(len(balls), NO_PLATFORM, dtype=np.int64)))
+        self.cooldown = np.concatenate((self.cooldown,
+                                        np.asarray([ball.collision_cooldown for ball in balls],
+                                                   dtype=np.int64)))
+
+    def save_positions(self):
+        self.prev_x = self.x.copy()
+        self.prev_y = self.y.copy()
+
+    def move(self):
+        # Ball.move for every ball; the clamp is a no-op for balls that did
+        # not reach a wall, so it is applied to all of them
+        r = self.radius
+        self.cooldown -= self.cooldown > 0
+        self.x = self.x + self.dx
+        self.dx = np.where((self.x <= r) | (self.x >= WIDTH - r), -self.dx, self.dx)
+        self.x = np.maximum(r, np.minimum(WIDTH - r, self.x))
+        self.y = self.y + self.dy
+        self.dy = np.where((self.y <= r) | (self.y >= HEIGHT - r), -self.dy, self.dy)
+        self.y = np.maximum(r, np.minimum(HEIGHT - r, self.y))
+
+
+def touching(balls, left, top, right, bottom):
+    # (balls, platforms) matrix of Ball.check_collision, ignoring cooldowns
+    n = len(balls)
+    result = np.empty((n, len(left)), dtype=bool)
+    chunk = max(1, PAIR_BUDGET // max(1, len(left)))
+    for start in range(0, n, chunk):
+        x = balls.x[start:start + chunk, None]
+        y = balls.y[start:start + chunk, None]
+        offset_x = x - np.maximum(left, np.minimum(x, right))
+        offset_y = y - np.maximum(top, np.minimum(y, bottom))
+        # The exact (and slow) distance only for pairs within the radius on
+        # both axes; anything else is out of reach
+        near = (np.abs(offset_x) <= balls.radius) & (np.abs(offset_y) <= balls.radius)
+        close = np.nonzero(near)
+        distance = np.sqrt(square(offset_x[close]) + square(offset_y[close]))
+        near[close] = distance <= balls.radius
+        result[start:start + chunk] = near
+    return result
+
+
+def first_hits(candidates, needed):
+    # Platform each ball hits, or NO_PLATFORM, with balls taking turns in
+    # index order and each hit costing its platform one health: once a
+    # platform has taken `needed` hits it is gone for every later ball,
+    # which then falls through to its next candidate. Removing a platform
+    # only ever moves later balls onto later platforms, so the ball that
+    # destroys each platform can only move earlier and this settles.
+    n, count = candidates.shape
+    result = np.full(n, NO_PLATFORM, dtype=np.int64)
+    ball_index = np.flatnonzero(candidates.any(axis=1))  # Only balls touching something
+    candidates = candidates[ball_index]
+    last_ball = np.full(count, n, dtype=np.int64)  # Last ball that sees each platform
+    while True:
+        available = candidates & (ball_index[:, None] <= last_ball)
+        hit = np.where(available.any(axis=1), available.argmax(axis=1), NO_PLATFORM)
+        hitters = np.flatnonzero(hit >= 0)
+        platform = hit[hitters]
+        order = np.argsort(platform, kind='stable')  # Ball order within each platform
+        hitters = ball_index[hitters[order]]
+        platform = platform[order]
+        starts = np.searchsorted(platform, np.arange(count))
+        hits = np.bincount(platform, minlength=count)
+        destroyed = hits >= needed
+        new_last = last_ball.copy()
+        new_last[destroyed] = hitters[starts[destroyed] + needed[destroyed] - 1]
+        if np.array_equal(new_last, last_ball):
+            result[ball_index] = hit
+            return result
+        last_ball = new_last
+
+
+class ArrayGame(Game):
+    def __init__(self, profiler=None):
+        Game.__init__(self, profiler)
+        self.balls = Balls()
+
+    def buy_ball(self):
+        if self.money >= self.ball_cost:
+            self.money -= self.ball_cost
+            self.balls.extend([Ball(WIDTH // 2, HEIGHT // 2)])
+            return True
+        return False
+
+    def step(self):
+        self.balls.save_positions()
+        self.update()
+
+    def update(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(self.tick + 1)
+        self.tick += 1
+        balls = self.balls
+        platforms = self.platforms
+        balls.move()
+
+        if len(balls) and platforms:
+            left = np.array([p.x for p in platforms], dtype=float)
+            top = np.array([p.y for p in platforms], dtype=float)
+            right = np.array([p.x + p.width for p in platforms], dtype=float)
+            bottom = np.array([p.y + p.height for p in platforms], dtype=float)
+            needed = np.maximum(1, np.ceil([p.health for p in platforms])).astype(np.int64)
+
+            candidates = touching(balls, left, top, right, bottom)
+            cooling = np.flatnonzero((balls.cooldown > 0) & (balls.last_platform >= 0))
+            candidates[cooling, balls.last_platform[cooling]] = False
+            hit = first_hits(candidates, needed)
+
+            # Bounce off the side of least overlap, as in Game.update
+            hitters = np.flatnonzero(hit >= 0)
+            platform = hit[hitters]
+            x = balls.x[hitters]
+            y = balls.y[hitters]
+            overlap_x = np.minimum(np.abs(x - left[platform]), np.abs(x - right[platform]))
+            overlap_y = np.minimum(np.abs(y - top[platform]), np.abs(y - bottom[platform]))
+            flip_x = overlap_x < overlap_y
+            balls.dx[hitters[flip_x]] *= -1
+            balls.dy[hitters[~flip_x]] *= -1
+            balls.last_platform[hitters] = platform
+            balls.cooldown[hitters] = COOLDOWN
+
+            damage = np.zeros(len(platforms), dtype=np.int64)
+            np.add.at(damage, platform, 1)
+            self.apply_damage(damage)
+        if profiler:
+            profiler.lap('balls')
+            profiler.count('balls', len(balls))
+            profiler.count('platforms', len(platforms))
+            profiler.count('collision_checks', len(balls) * len(platforms))
+
+    def apply_damage(self, damage):
+        # Damage the platforms, drop the destroyed ones and renumber the
+        # balls' last platforms to match
+        survivors = []
+        remap = np.full(len(self.platforms), NO_PLATFORM, dtype=np.int64)
+        for index, (platform, hits) in enumerate(zip(self.platforms, damage.tolist())):
+            if hits:
+                platform.take_damage(hits)
+                self.changed_platforms.add(platform)
+            if platform.is_destroyed():
+                self.platform_grid.remove(platform)
+                self.score += 10
+                self.money += 5
+                continue
+            remap[index] = len(survivors)
+            survivors.append(platform)
+        if len(survivors) < len(self.platforms):
+            self.platforms[:] = survivors
+            last = self.balls.last_platform
+            self.balls.last_platform = np.where(last >= 0, remap[np.maximum(last, 0)],
+                                                NO_PLATFORM)
+
+    def draw_balls(self, alpha=1.0):
+        balls = self.balls
+        x = balls.prev_x + (balls.x - balls.prev_x) * alpha
+        y = balls.prev_y + (balls.y - balls.prev_y) * alpha
+        radius = balls.radius
+        for bx, by, color in zip(x.astype(int).tolist(), y.astype(int).tolist(),
+                                 balls.color.tolist()):
+            pygame.draw.circle(game.screen, color, (bx, by), radius)
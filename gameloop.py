@@ -0,0 +1,99 @@
+import time
+
+import pygame
+
+# Fixed-timestep main loop shared by the games. The simulation advances in
+# steps of exactly 1/step_rate seconds however fast frames are drawn. Each
+# frame runs as many steps as real time calls for, at most max_steps; past
+# that the backlog is dropped rather than chased, so one slow frame cannot
+# snowball into ever longer catch-ups. The frame is then rendered with the
+# fraction of a step left over, which the game uses to interpolate between
+# its last two simulation states.
+
+STEP_RATE = 60  # Simulation steps per second
+MAX_STEPS_PER_FRAME = 5
+MAX_FPS = 120  # 0 renders as fast as possible
+REPORT_INTERVAL = 1.0  # Seconds between rate updates
+
+
+class GameLoop:
+    def __init__(self, step, render, handle_event=None, step_rate=STEP_RATE,
+                 max_steps=MAX_STEPS_PER_FRAME, max_fps=MAX_FPS, caption=None):
+        # step() advances the simulation one step and may return False to end
+        # the loop; render(alpha) draws alpha of the way from the previous
+        # state to the current one; handle_event(event) gets every event but
+        # QUIT. With a caption the window title shows both rates.
+        self.step = step
+        self.render = render
+        self.handle_event = handle_event
+        self.step_rate = step_rate
+        self.max_steps = max_steps
+        self.max_fps = max_fps
+        self.caption = caption
+        self.running = False
+        self.steps = 0
+        self.frames = 0
+        self.dropped_steps = 0
+        self.sim_rate = 0.0
+        self.render_rate = 0.0
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        clock = pygame.time.Clock()
+        step_time = 1.0 / self.step_rate
+        lag = 0.0
+        last = report_start = time.perf_counter()
+        report_steps = self.steps
+        report_frames = self.frames
+        self.running = True
+
+        while self.running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif self.handle_event:
+                    self.handle_event(event)
+
+            now = time.perf_counter()
+            lag += now - last
+            last = now
+
+            steps = 0
+            while lag >= step_time and steps < self.max_steps and self.running:
+                if self.step() is False:
+                    self.running = False
+                lag -= step_time
+                steps += 1
+            self.steps += steps
+            if lag >= step_time:
+                # Still behind after max_steps: give up on the lost time
+                self.dropped_steps += int(lag / step_time)
+                lag %= step_time
+
+            self.render(lag / step_time)
+            self.frames += 1
+
+            if now - report_start >= REPORT_INTERVAL:
+                elapsed = now - report_start
+                self.sim_rate = (self.steps - report_steps) / elapsed
+                self.render_rate = (self.frames - report_frames) / elapsed
+                report_start = now
+                report_steps = self.steps
+                report_frames = self.frames
+                if self.caption:
+                    pygame.display.set_caption(f"{self.caption}  sim {self.sim_rate:.0f} Hz  "
+                                               f"render {self.render_rate:.0f} fps")
+
+            if self.max_fps:
+                clock.tick(self.max_fps)
+
+    def rates(self):
+        return {
+            'sim_rate': self.sim_rate,
+            'render_rate': self.render_rate,
+            'steps': self.steps,
+            'frames': self.frames,
+            'dropped_steps': self.dropped_steps,
+        }
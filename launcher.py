@@ -0,0 +1,59 @@
+import importlib
+import sys
+import time
+
+# One entry point for the three games:
+#
+#   python launcher.py battle [battle_game options]
+#   python launcher.py ballbreaker [game options]
+#   python launcher.py fighter [rrr options]
+#
+# Only the chosen game's module is imported, and pygame with it, so
+# `launcher.py --help` and an unknown mode answer at once. The game then
+# starts the pygame modules it needs when it opens its window (display,
+# plus fonts for Ball Breaker) rather than all of them. With --timings
+# the launcher prints how long the import and the window took before
+# handing over to the game's own main().
+
+MODES = {
+    'battle': 'battle_game',
+    'ballbreaker': 'game',
+    'fighter': 'rrr',
+}
+
+
+def usage():
+    return (f"usage: launcher.py [--timings] {{{','.join(MODES)}}} [game options]\n"
+            "       launcher.py MODE --help   lists a game's own options")
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    timings = '--timings' in argv
+    if timings:
+        argv.remove('--timings')
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    mode = argv[0]
+    if mode not in MODES:
+        print(f"launcher.py: unknown mode {mode!r}\n{usage()}", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    module = importlib.import_module(MODES[mode])
+    imported = time.perf_counter()
+    sys.argv = [f"launcher.py {mode}"] + argv[1:]
+    if timings and '-h' not in argv and '--help' not in argv and '--headless' not in argv:
+        module.init_display()
+        opened = time.perf_counter()
+        print(f"{mode}: import {(imported - start) * 1000:.0f} ms, "
+              f"display {(opened - imported) * 1000:.0f} ms")
+    elif timings:
+        print(f"{mode}: import {(imported - start) * 1000:.0f} ms")
+    module.main()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
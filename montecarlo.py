@@ -0,0 +1,206 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+from battle_game import make_game
+from squads import SquadLOD
+
+# Runs many headless battles across a process pool and aggregates the
+# outcomes. Every battle gets its own seed derived from the batch seed and
+# its index, so a batch gives the same result however many workers run it.
+
+DEFAULT_JITTER = 20
+DEFAULT_MAX_TICKS = 60 * 60 * 10  # Ten minutes of game time
+
+
+def battle_seed(seed, index):
+    return (seed << 32) | index
+
+
+def run_battle(job):
+    index, seed, backend, max_ticks, squads, game_options = job
+    if squads:
+        # A SquadLOD keeps its battle's squads, so every battle needs its own
+        game_options = dict(game_options, squads=SquadLOD())
+    game = make_game(backend, headless=True, seed=seed, **game_options)
+    result = game.run_until_winner(max_ticks)
+    return index, {
+        'winner': result['winner'],
+        'ticks': result['ticks'],
+        'peak_red': result['peak_red'],
+        'peak_blue': result['peak_blue'],
+    }
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class BattleStats:
+    def __init__(self):
+        self.results = {}
+
+    def add(self, index, result):
+        self.results[index] = result
+
+    def summary(self):
+        # Built from the results in battle order, so the numbers do not depend
+        # on the order in which workers finished
+        results = [self.results[index] for index in sorted(self.results)]
+        count = len(results)
+        outcomes = {'red': 0, 'blue': 0, 'draw': 0, None: 0}
+        for result in results:
+            outcomes[result['winner']] += 1
+        win_ticks = sorted(r['ticks'] for r in results if r['winner'] is not None)
+        peak_red = sorted(r['peak_red'] for r in results)
+        peak_blue = sorted(r['peak_blue'] for r in results)
+        return {
+            'battles': count,
+            'red_win_rate': outcomes['red'] / count if count else 0.0,
+            'blue_win_rate': outcomes['blue'] / count if count else 0.0,
+            'draw_rate': outcomes['draw'] / count if count else 0.0,
+            'timeout_rate': outcomes[None] / count if count else 0.0,
+            'time_to_win': {
+                'mean': sum(win_ticks) / len(win_ticks) if win_ticks else None,
+                'p10': percentile(win_ticks, 0.1),
+                'p50': percentile(win_ticks, 0.5),
+                'p90': percentile(win_ticks, 0.9),
+                'max': win_ticks[-1] if win_ticks else None,
+            },
+            'peak_red': {'mean': sum(peak_red) / count if count else None,
+                         'max': peak_red[-1] if peak_red else None},
+            'peak_blue': {'mean': sum(peak_blue) / count if count else None,
+                          'max': peak_blue[-1] if peak_blue else None},
+        }
+
+
+def iter_batch(battles, seed=0, workers=None, backend='object',
+               max_ticks=DEFAULT_MAX_TICKS, squads=False, **game_options):
+    # Yields the running BattleStats after every finished battle; squads
+    # runs them with squads.SquadLOD
+    game_options.setdefault('spawn_jitter', DEFAULT_JITTER)
+    jobs = [(index, battle_seed(seed, index), backend, max_ticks, squads, game_options)
+            for index in range(battles)]
+    stats = BattleStats()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            stats.add(*run_battle(job))
+            yield stats
+        return
+    chunksize = max(1, battles // (workers * 8))
+    with multiprocessing.Pool(workers) as pool:
+        for index, result in pool.imap_unordered(run_battle, jobs, chunksize):
+            stats.add(index, result)
+            yield stats
+
+
+def run_batch(battles, **options):
+    stats = BattleStats()
+    for stats in iter_batch(battles, **options):
+        pass
+    return stats.summary()
+
+
+def compare_outcomes(full, approximate):
+    # How far an approximate batch's summary (say with squads) is from the
+    # full simulation's: win rate differences, and win tick percentiles
+    # relative to the full ones
+    difference = {outcome: approximate[outcome] - full[outcome]
+                  for outcome in ('red_win_rate', 'blue_win_rate', 'draw_rate', 'timeout_rate')}
+    for name in ('p10', 'p50', 'p90'):
+        ticks = full['time_to_win'][name]
+        other = approximate['time_to_win'][name]
+        difference['ticks_' + name] = (other - ticks) / ticks if ticks and other else None
+    return difference
+
+
+def parse_stats(pairs):
+    stats = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        try:
+            stats[name] = int(value)
+        except ValueError:
+            stats[name] = float(value)
+    return stats
+
+
+def print_summary(summary, elapsed):
+    print(f"battles: {summary['battles']} in {elapsed:.1f}s "
+          f"({summary['battles'] / elapsed:.1f} battles/s)")
+    print(f"red wins: {summary['red_win_rate']:.1%}  blue wins: {summary['blue_win_rate']:.1%}  "
+          f"draws: {summary['draw_rate']:.1%}  timeouts: {summary['timeout_rate']:.1%}")
+    ttw = summary['time_to_win']
+    if ttw['mean'] is not None:
+        print(f"ticks to win: mean {ttw['mean']:.0f}  p10 {ttw['p10']}  "
+              f"p50 {ttw['p50']}  p90 {ttw['p90']}  max {ttw['max']}")
+    print(f"peak red: mean {summary['peak_red']['mean']:.1f} max {summary['peak_red']['max']}  "
+          f"peak blue: mean {summary['peak_blue']['mean']:.1f} max {summary['peak_blue']['max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo battle runner")
+    parser.add_argument('battles', type=int, help="number of battles to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--backend', choices=('object', 'numpy'), default='object')
+    parser.add_argument('--max-ticks', type=int, default=DEFAULT_MAX_TICKS)
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER,
+                        help="spawn position jitter in pixels")
+    parser.add_argument('--spawn-delay', type=int, default=180)
+    parser.add_argument('--world', metavar='WxH',
+                        help="battlefield size, e.g. 4000x1200")
+    parser.add_argument('--squads', action='store_true',
+                        help="simulate soldiers far from the fighting as squads "
+                             "(object backend only)")
+    parser.add_argument('--compare', action='store_true',
+                        help="run the batch with and without --squads and compare the "
+                             "outcome distributions (object backend only)")
+    parser.add_argument('--red', action='append', metavar='STAT=VALUE',
+                        help="red unit override, e.g. shoot_delay=45 or bullet_damage=25")
+    parser.add_argument('--blue', action='append', metavar='STAT=VALUE',
+                        help="blue unit override")
+    args = parser.parse_args()
+
+    if (args.squads or args.compare) and args.backend != 'object':
+        parser.error("--squads and --compare need --backend object")
+    options = {}
+    if args.world:
+        options['world_size'] = tuple(int(size) for size in args.world.lower().split('x'))
+
+    def batch(squads):
+        start = time.perf_counter()
+        step = max(1, args.battles // 10)
+        stats = BattleStats()
+        for stats in iter_batch(args.battles, seed=args.seed, workers=args.workers,
+                                backend=args.backend, max_ticks=args.max_ticks, squads=squads,
+                                spawn_jitter=args.jitter, spawn_delay=args.spawn_delay,
+                                red_stats=parse_stats(args.red),
+                                blue_stats=parse_stats(args.blue), **options):
+            done = len(stats.results)
+            if done % step == 0 and done < args.battles:
+                summary = stats.summary()
+                print(f"{done}/{args.battles}  red {summary['red_win_rate']:.1%}  "
+                      f"blue {summary['blue_win_rate']:.1%}")
+        summary = stats.summary()
+        print_summary(summary, time.perf_counter() - start)
+        return summary
+
+    if not args.compare:
+        batch(args.squads)
+        return
+    print("full simulation:")
+    full = batch(False)
+    print("squads:")
+    difference = compare_outcomes(full, batch(True))
+    print("squads - full: " + "  ".join(
+        f"{name} {value:+.1%}" for name, value in difference.items() if value is not None))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import random
+import socket
+import struct
+import sys
+import time
+
+import pygame
+
+import rrr
+from gameloop import GameLoop
+from rrr import HEIGHT, RED, BLUE, PLAYER1_CONTROLS, PLAYER2_CONTROLS, HELD_MASK, Fighter
+
+# Rollback netcode for Stickman Fighter over UDP. Each peer simulates
+# both fighters. It steps every frame at once with its own input and a
+# prediction of the remote one: the remote's held buttons carry on, and
+# no attack is pressed. Each peer sends the other every input the other
+# has not acknowledged yet, so a lost datagram is covered by the next
+# one. When a remote input arrives that differs from what was predicted
+# for its frame, the session restores the snapshot taken at the start of
+# that frame and simulates forward again with the real input. A peer
+# that gets max_rollback frames ahead of the last input it has from the
+# other side waits for it instead, so a rollback never re-simulates more
+# than that.
+#
+# rrr.step_fight only depends on the fight state and the two inputs, so
+# both peers end up with identical fights once every input has arrived.
+#
+# Datagram layout:
+#   INPUTS   first_frame, ack, count, then `count` input bytes
+# where ack is the number of inputs received from the other side so far.
+
+MAX_ROLLBACK = 8
+INPUT_DELAY = 1  # Frames between reading a local input and stepping it
+PORTS = (7801, 7802)
+
+INPUTS = struct.Struct('<IIH')
+
+
+def new_fight():
+    return (Fighter(200, HEIGHT - 100, RED, PLAYER1_CONTROLS),
+            Fighter(600, HEIGHT - 100, BLUE, PLAYER2_CONTROLS))
+
+
+def fight_state(player1, player2):
+    return player1.snapshot(), player2.snapshot()
+
+
+class SnapshotRing:
+    # The last `size` frame states, each stored under the frame it starts
+    def __init__(self, size):
+        self.frames = [None] * size
+        self.states = [None] * size
+
+    def save(self, frame, state):
+        slot = frame % len(self.frames)
+        self.frames[slot] = frame
+        self.states[slot] = state
+
+    def load(self, frame):
+        slot = frame % len(self.frames)
+        if self.frames[slot] != frame:
+            raise KeyError(f"frame {frame} is no longer in the snapshot ring")
+        return self.states[slot]
+
+
+class UdpTransport:
+    def __init__(self, port, remote, host='127.0.0.1'):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.remote = remote
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.remote)
+        except OSError:
+            pass  # Nobody listening yet; the next datagram repeats this one
+
+    def receive(self):
+        # Every datagram waiting, without blocking
+        datagrams = []
+        while True:
+            try:
+                data, _ = self.socket.recvfrom(65536)
+            except (BlockingIOError, ConnectionError):
+                return datagrams
+            datagrams.append(data)
+
+    def close(self):
+        self.socket.close()
+
+
+class LaggyTransport:
+    # Wraps a transport to hold outgoing datagrams for `delay` frames, give
+    # or take `jitter`, and drop a `loss` fraction of them. A frame is one
+    # receive() call, which a session makes once per frame.
+    def __init__(self, transport, delay, jitter=0, loss=0.0, seed=None):
+        self.transport = transport
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.frame = 0
+        self.held = []
+
+    def send(self, data):
+        if self.random.random() < self.loss:
+            return
+        due = self.frame + self.delay + self.random.randint(-self.jitter, self.jitter)
+        self.held.append((due, data))
+
+    def receive(self):
+        self.frame += 1
+        due = [data for when, data in self.held if when <= self.frame]
+        self.held = [(when, data) for when, data in self.held if when > self.frame]
+        for data in due:
+            self.transport.send(data)
+        return self.transport.receive()
+
+    def close(self):
+        self.transport.close()
+
+
+class RollbackSession:
+    def __init__(self, player1, player2, local, transport, max_rollback=MAX_ROLLBACK,
+                 input_delay=INPUT_DELAY):
+        # local is 0 when this peer plays player1, 1 for player2
+        self.fighters = (player1, player2)
+        self.local = local
+        self.transport = transport
+        self.max_rollback = max_rollback
+        self.frame = 0  # Next frame to simulate
+        self.local_inputs = bytearray(input_delay)
+        self.remote_inputs = bytearray()  # Confirmed, from frame 0 on
+        self.remote_ack = 0  # How many of our inputs the remote has
+        self.used_remote = bytearray()  # Remote input each frame was simulated with
+        self.snapshots = SnapshotRing(max_rollback + 2)
+        self.rollbacks = 0
+        self.rollback_frames = 0
+        self.max_rollback_seen = 0
+        self.stalls = 0
+
+    def advance(self, buttons):
+        # Step one frame with this peer's input bits; False when too far
+        # ahead of the remote peer to step without risking a longer rollback
+        self.poll()
+        if self.frame - len(self.remote_inputs) >= self.max_rollback:
+            self.stalls += 1
+            self.send()
+            return False
+        self.local_inputs.append(buttons)
+        self.simulate(self.frame)
+        self.frame += 1
+        self.send()
+        return True
+
+    def poll(self):
+        # Take in the remote inputs that have arrived and roll back to the
+        # first one that was mispredicted
+        confirmed = len(self.remote_inputs)
+        for data in self.transport.receive():
+            first, ack, count = INPUTS.unpack_from(data)
+            self.remote_ack = max(self.remote_ack, ack)
+            end = first + count
+            if first <= len(self.remote_inputs) < end:
+                start = INPUTS.size + len(self.remote_inputs) - first
+                self.remote_inputs += data[start:INPUTS.size + count]
+        checked = min(len(self.remote_inputs), self.frame)
+        for frame in range(confirmed, checked):
+            if self.remote_inputs[frame] != self.used_remote[frame]:
+                self.rollback(frame)
+                break
+
+    def rollback(self, frame):
+        player1, player2 = self.fighters
+        state1, state2 = self.snapshots.load(frame)
+        player1.restore(state1)
+        player2.restore(state2)
+        replayed = self.frame - frame
+        for again in range(frame, self.frame):
+            self.simulate(again)
+        self.rollbacks += 1
+        self.rollback_frames += replayed
+        self.max_rollback_seen = max(self.max_rollback_seen, replayed)
+
+    def simulate(self, frame):
+        player1, player2 = self.fighters
+        self.snapshots.save(frame, fight_state(player1, player2))
+        if frame < len(self.remote_inputs):
+            remote = self.remote_inputs[frame]
+        elif self.remote_inputs:
+            remote = self.remote_inputs[-1] & HELD_MASK  # Keep holding, no new attacks
+        else:
+            remote = 0
+        if frame < len(self.used_remote):
+            self.used_remote[frame] = remote
+        else:
+            self.used_remote.append(remote)
+        local = self.local_inputs[frame]
+        if self.local == 0:
+            rrr.step_fight(player1, player2, local, remote)
+        else:
+            rrr.step_fight(player1, player2, remote, local)
+
+    def send(self):
+        # Every local input the remote has not acknowledged yet
+        first = self.remote_ack
+        pending = self.local_inputs[first:]
+        self.transport.send(INPUTS.pack(first, len(self.remote_inputs), len(pending)) +
+                            pending)
+
+    def synced(self, frame):
+        # Whether every input up to frame is known, so the fight is final
+        return len(self.remote_inputs) >= frame and self.frame >= frame
+
+    def stats(self):
+        return {
+            'frame': self.frame,
+            'confirmed': len(self.remote_inputs),
+            'rollbacks': self.rollbacks,
+            'rollback_frames': self.rollback_frames,
+            'max_rollback': self.max_rollback_seen,
+            'stalls': self.stalls,
+        }
+
+
+def scripted_inputs(count, rng):
+    # A player's inputs for `count` frames: held buttons that change every
+    # few frames, and the odd attack
+    inputs = bytearray()
+    held = 0
+    while len(inputs) < count:
+        held = rng.choice((0, rrr.LEFT, rrr.RIGHT, rrr.UP, rrr.LEFT | rrr.UP, rrr.RIGHT | rrr.UP))
+        for _ in range(rng.randint(5, 30)):
+            attack = (rng.choice((rrr.SLIDE, rrr.KICK, rrr.PROJECTILE, rrr.PUNCH))
+                      if rng.random() < 0.05 else 0)
+            inputs.append(held | attack)
+    return inputs[:count]
+
+
+def loopback(frames, latency, jitter=0, loss=0.0, seed=None, max_rollback=MAX_ROLLBACK,
+             input_delay=INPUT_DELAY):
+    # Both peers in one process, over localhost UDP with `latency` frames
+    # injected each way, playing scripted inputs. Afterwards the fights are
+    # checked against a plain run of the same inputs. Returns a report.
+    rng = random.Random(seed)
+    transports = [UdpTransport(0, None), UdpTransport(0, None)]
+    transports[0].remote = transports[1].socket.getsockname()
+    transports[1].remote = transports[0].socket.getsockname()
+    sessions = []
+    for local in (0, 1):
+        laggy = LaggyTransport(transports[local], latency, jitter, loss, rng.random())
+        sessions.append(RollbackSession(*new_fight(), local, laggy, max_rollback, input_delay))
+    scripts = [scripted_inputs(frames + input_delay, rng) for _ in sessions]
+
+    worst = 0.0
+    while any(session.frame < frames for session in sessions):
+        for session, script in zip(sessions, scripts):
+            if session.frame < frames:
+                start = time.perf_counter()
+                session.advance(script[len(session.local_inputs)])
+                worst = max(worst, time.perf_counter() - start)
+            else:
+                session.poll()  # Done, but the other peer still needs our inputs
+                session.send()
+
+    # Let the last inputs arrive
+    for _ in range(10000):
+        if all(session.synced(frames) for session in sessions):
+            break
+        for session in sessions:
+            session.poll()
+            session.send()
+
+    player1, player2 = new_fight()
+    for frame in range(frames):
+        rrr.step_fight(player1, player2, sessions[0].local_inputs[frame],
+                       sessions[1].local_inputs[frame])
+    expected = fight_state(player1, player2)
+    for transport in transports:
+        transport.close()
+    return {
+        'sessions': [session.stats() for session in sessions],
+        'worst_frame_ms': worst * 1000,
+        'identical': all(fight_state(*session.fighters) == expected for session in sessions),
+    }
+
+
+def play(player, port, remote, max_rollback=MAX_ROLLBACK, input_delay=INPUT_DELAY):
+    rrr.init_display()
+    player1, player2 = new_fight()
+    local = player - 1
+    controls = (player1, player2)[local].controls
+    session = RollbackSession(player1, player2, local, UdpTransport(port, remote),
+                              max_rollback, input_delay)
+    attacks = 0  # Attack bits pressed since the last step
+
+    def handle_event(event):
+        nonlocal attacks
+        if event.type == pygame.KEYDOWN:
+            attacks |= rrr.attack_button(controls, event.key)
+
+    def step():
+        nonlocal attacks
+        buttons = rrr.held_buttons(controls, pygame.key.get_pressed()) | attacks
+        if session.advance(buttons):
+            attacks = 0
+        return player1.health > 0 and player2.health > 0
+
+    def render(alpha):
+        rrr.draw_fight(player1, player2, alpha)
+        pygame.display.flip()
+
+    GameLoop(step, render, handle_event, caption=f"Stickman Fighter (player {player})").run()
+    session.transport.close()
+    print(session.stats())
+    pygame.quit()
+
+
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stickman Fighter rollback netplay")
+    sub = parser.add_subparsers(dest='command', required=True)
+    game = sub.add_parser('play', help="play one side of a networked fight")
+    game.add_argument('--player', type=int, choices=(1, 2), default=1)
+    game.add_argument('--port', type=int, default=None,
+                      help=f"local UDP port (default {PORTS[0]} for player 1, {PORTS[1]} for 2)")
+    game.add_argument('--remote', type=parse_address, default=None,
+                      help="HOST:PORT of the other player (default the other local port)")
+    test = sub.add_parser('loopback', help="check two peers over localhost with injected lag; "
+                                      "exits 1 if their fights differ")
+    test.add_argument('--frames', type=int, default=3600)
+    test.add_argument('--latency', type=int, default=6, help="frames of lag each way")
+    test.add_argument('--jitter', type=int, default=2, help="frames of lag variation")
+    test.add_argument('--loss', type=float, default=0.05, help="fraction of datagrams dropped")
+    test.add_argument('--seed', type=int, default=None)
+    for command in (game, test):
+        command.add_argument('--max-rollback', type=int, default=MAX_ROLLBACK)
+        command.add_argument('--input-delay', type=int, default=INPUT_DELAY)
+    args = parser.parse_args()
+
+    if args.command == 'play':
+        port = args.port if args.port is not None else PORTS[args.player - 1]
+        remote = args.remote or ('127.0.0.1', PORTS[2 - args.player])
+        play(args.player, port, remote, args.max_rollback, args.input_delay)
+        return
+
+    report = loopback(args.frames, args.latency, args.jitter, args.loss, args.seed,
+                      args.max_rollback, args.input_delay)
+    for player, stats in enumerate(report['sessions'], 1):
+        print(f"player {player}: {stats['rollbacks']} rollbacks re-simulating "
+              f"{stats['rollback_frames']} frames (longest {stats['max_rollback']}), "
+              f"{stats['stalls']} stalls")
+    print(f"worst frame {report['worst_frame_ms']:.2f} ms (budget {1000 / 60:.1f} ms), "
+          f"{'identical' if report['identical'] else 'DIFFERENT'} fights")
+    if not report['identical']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
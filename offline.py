@@ -0,0 +1,286 @@
+import argparse
+import heapq
+import math
+import random
+import sys
+import time
+
+from gameloop import STEP_RATE
+from game import WIDTH, HEIGHT, Game
+
+# Event-driven time skip for Ball Breaker, for "while you were away"
+# progress. Between impacts a ball moves in a straight line, so instead of
+# stepping every ball every tick the simulator works out the tick of each
+# ball's next wall or platform impact, keeps those in a priority queue and
+# jumps from one to the next. An impact tick is then run exactly as
+# Game.update runs it (Ball.move, then Game.collide), so bounces, cooldowns
+# and the ball order that decides which ball destroys a platform are the
+# frame-stepped ones.
+#
+# Positions between impacts must be the ones Ball.move builds up by adding
+# the velocity once per tick, not x + n * velocity: the two round
+# differently, and a ball that frame stepping lands exactly on a wall
+# would otherwise bounce a tick apart. slide() gets the repeated sum in
+# closed form. While a coordinate stays within one power-of-two range,
+# every float there is a whole multiple of the same unit, so each addition
+# moves it by the same rounded number of units. A slide is then one
+# multiplication per range crossed. Impact ticks are estimated from the
+# straight line and then checked against slide() positions, which settles
+# which tick the rounded steps reach the wall or the platform on. The
+# tolerance is therefore zero: platform destructions, score, money and ball
+# states come out as frame stepping gives them, at a cost per impact
+# rather than per tick.
+
+NO_EVENT = math.inf
+INDESTRUCTIBLE = 10 ** 9  # Platform health for --indestructible
+
+
+def slide(position, velocity, ticks):
+    # `ticks` plain Ball.move steps along one axis, each rounded as it is
+    # taken, for a position inside the walls (so above zero)
+    if ticks <= 16:
+        for _ in range(ticks):  # Cheaper to just take a few steps
+            position += velocity
+        return position
+    while ticks > 0:
+        unit = math.ulp(position)  # Float spacing up to the next power of two
+        units = velocity / unit
+        if units % 1 == 0.5 or position <= 0:
+            # A rounding tie goes to the even neighbour, which depends on
+            # the position, so take the step as it is
+            position += velocity
+            ticks -= 1
+            continue
+        step = round(units)
+        start = int(position / unit)
+        # Steps whose results stay strictly inside this range all round by
+        # the same amount
+        if step > 0:
+            steps = (2 ** 53 - 1 - start) // step
+        elif step < 0:
+            steps = (start - 2 ** 52 - 1) // -step
+        else:
+            return position  # Too slow to move it at all
+        if steps <= 0:
+            position += velocity  # This step leaves the range
+            ticks -= 1
+            continue
+        steps = min(steps, ticks)
+        position = (start + steps * step) * unit
+        ticks -= steps
+    return position
+
+
+def wall_ticks(position, velocity, low, high):
+    # Ticks until Ball.move next clamps this coordinate at a wall
+    if velocity == 0:
+        return NO_EVENT
+    bound = high if velocity > 0 else low
+    ticks = max(1, math.ceil((bound - position) / velocity))
+    # The rounded steps may reach the wall a tick either side of the line
+    before = slide(position, velocity, ticks - 1)
+    while ticks > 1 and not low < before < high:
+        ticks -= 1
+        before = slide(position, velocity, ticks - 1)
+    while low < before + velocity < high:
+        before += velocity
+        ticks += 1
+    return ticks
+
+
+def coast(position, velocity, ticks, low, high):
+    # Position and velocity along one axis after `ticks` ticks of wall
+    # bounces alone. Every bounce clamps the ball onto the wall, so after
+    # the first one the motion repeats with a fixed period.
+    periodic = False
+    while True:
+        k = wall_ticks(position, velocity, low, high)
+        if k > ticks:
+            return slide(position, velocity, ticks), velocity
+        ticks -= k
+        position = high if velocity > 0 else low
+        velocity = -velocity
+        if not periodic:
+            periodic = True
+            there = wall_ticks(position, velocity, low, high)
+            back = wall_ticks(low if velocity < 0 else high, -velocity, low, high)
+            ticks %= there + back
+
+
+def touches(x, y, radius, platform):
+    # Ball.check_collision at (x, y)
+    closest_x = max(platform.x, min(x, platform.x + platform.width))
+    closest_y = max(platform.y, min(y, platform.y + platform.height))
+    return math.sqrt((x - closest_x)**2 + (y - closest_y)**2) <= radius
+
+
+def entry_interval(x, dx, low, high):
+    # Range of t for which x + t * dx lies in [low, high], padded by a tick
+    # since the caller tests the exact positions of whole ticks anyway
+    if dx == 0:
+        return (-math.inf, math.inf) if low <= x <= high else (math.inf, -math.inf)
+    t0 = (low - x) / dx
+    t1 = (high - x) / dx
+    if t0 > t1:
+        t0, t1 = t1, t0
+    return t0 - 1, t1 + 1
+
+
+class EventSimulator:
+    def __init__(self, game):
+        # Works on the object game: game.balls holds Ball objects
+        self.game = game
+        self.events = 0
+
+    def next_impact(self, ball, before):
+        # First tick before `before` at which the ball touches a platform it
+        # would collide with, or None. Each platform is only tested on the
+        # few ticks the ball's line spends within a radius of it.
+        best = before
+        r = ball.radius
+        x, y, dx, dy = ball.x, ball.y, ball.dx, ball.dy
+        for platform in self.game.platforms:
+            t0, t1 = entry_interval(x, dx, platform.x - r, platform.x + platform.width + r)
+            if t1 < 1 or t0 >= best:
+                continue
+            u0, u1 = entry_interval(y, dy, platform.y - r, platform.y + platform.height + r)
+            first = max(1, math.ceil(max(t0, u0)))
+            if (platform is ball.last_collided_platform and
+                    first < ball.collision_cooldown):
+                first = ball.collision_cooldown  # Ignored until its cooldown runs out
+            last = min(math.floor(min(t1, u1)), best - 1)
+            if first > last:
+                continue
+            px = slide(x, dx, first)
+            py = slide(y, dy, first)
+            for k in range(first, last + 1):
+                if touches(px, py, r, platform):
+                    best = k
+                    break
+                px += dx
+                py += dy
+        return best if best < before else None
+
+    def next_event(self, ball):
+        # Ticks to the ball's next wall or platform impact; the impact tick
+        # itself is left to Ball.move and Game.collide
+        r = ball.radius
+        walls = min(wall_ticks(ball.x, ball.dx, r, WIDTH - r),
+                    wall_ticks(ball.y, ball.dy, r, HEIGHT - r))
+        impact = self.next_impact(ball, walls)
+        return walls if impact is None else impact
+
+    def advance(self, ticks):
+        # Move the game `ticks` ticks on; returns what happened meanwhile
+        game = self.game
+        start = game.tick
+        end = start + ticks
+        score, money, platforms = game.score, game.money, len(game.platforms)
+
+        # (tick of next event, ball index); equal ticks run in ball order,
+        # as in update()
+        last_tick = [start] * len(game.balls)
+        queue = []
+        if game.platforms:
+            for index, ball in enumerate(game.balls):
+                queue.append((start + self.next_event(ball), index))
+            heapq.heapify(queue)
+
+        while queue and game.platforms:
+            tick, index = heapq.heappop(queue)
+            if tick > end:
+                break
+            ball = game.balls[index]
+            skipped = tick - last_tick[index] - 1
+            if skipped:
+                ball.x = slide(ball.x, ball.dx, skipped)
+                ball.y = slide(ball.y, ball.dy, skipped)
+                ball.collision_cooldown = max(0, ball.collision_cooldown - skipped)
+            ball.move()
+            game.collide(ball)
+            last_tick[index] = tick
+            self.events += 1
+            heapq.heappush(queue, (tick + self.next_event(ball), index))
+
+        # Nothing left to hit (or no more impacts before the end): the rest
+        # is wall bounces, which need no queue
+        for index, ball in enumerate(game.balls):
+            remaining = end - last_tick[index]
+            r = ball.radius
+            ball.collision_cooldown = max(0, ball.collision_cooldown - remaining)
+            ball.x, ball.dx = coast(ball.x, ball.dx, remaining, r, WIDTH - r)
+            ball.y, ball.dy = coast(ball.y, ball.dy, remaining, r, HEIGHT - r)
+            ball.prev_x = ball.x
+            ball.prev_y = ball.y
+        game.tick = end
+        return {
+            'ticks': ticks,
+            'events': self.events,
+            'platforms_destroyed': platforms - len(game.platforms),
+            'score': game.score - score,
+            'money': game.money - money,
+        }
+
+
+def make_game(balls, seed=None, indestructible=False):
+    random.seed(seed)
+    game = Game()
+    if indestructible:
+        for platform in game.platforms:
+            platform.health = platform.max_health = INDESTRUCTIBLE
+    game.money = game.ball_cost * balls
+    for _ in range(balls):
+        game.buy_ball()
+    return game
+
+
+def game_state(game):
+    # Everything the event simulator has to get exactly right
+    return (game.score, game.money,
+            [(p.x, p.y, p.health) for p in game.platforms],
+            [(b.x, b.y, b.dx, b.dy, b.collision_cooldown,
+              game.platforms.index(b.last_collided_platform)
+              if b.last_collided_platform in game.platforms else None)
+             for b in game.balls])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ball Breaker offline progress")
+    parser.add_argument('--minutes', type=float, default=8 * 60,
+                        help="time away, in minutes of play")
+    parser.add_argument('--balls', type=int, default=3, help="balls in play")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--check', action='store_true',
+                        help="also frame-step the same game and compare; exits 1 if they differ")
+    parser.add_argument('--indestructible', action='store_true',
+                        help="platforms that never break, so the balls keep hitting them")
+    args = parser.parse_args()
+
+    ticks = int(args.minutes * 60 * STEP_RATE)
+
+    def new_game():
+        return make_game(args.balls, args.seed, args.indestructible)
+
+    game = new_game()
+    start = time.perf_counter()
+    result = EventSimulator(game).advance(ticks)
+    elapsed = time.perf_counter() - start
+    print(f"{args.minutes:g} minutes ({ticks} ticks) in {elapsed:.3f}s: "
+          f"{result['events']} events, {result['platforms_destroyed']} platforms destroyed, "
+          f"score +{result['score']}, money +{result['money']}")
+
+    if args.check:
+        stepped = new_game()
+        start = time.perf_counter()
+        for _ in range(ticks):
+            stepped.step()
+        elapsed = time.perf_counter() - start
+        same = game_state(stepped) == game_state(game)
+        print(f"frame stepping: {elapsed:.3f}s, score {stepped.score}, money {stepped.money}, "
+              f"{'identical' if same else 'DIFFERENT'} end state")
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import sys
+
+# Free-list pools for short-lived entities (bullets, projectiles). Dead
+# entities go back on the free list and acquire() re-runs __init__ on one
+# instead of allocating, so a steady stream of shots stops churning the
+# allocator and the garbage collector.
+
+MAX_FREE = 100000  # Free entities kept beyond this are left to the GC
+
+
+class Pool:
+    def __init__(self, cls, max_free=MAX_FREE):
+        self.cls = cls
+        self.max_free = max_free
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, *args):
+        if self.free:
+            entity = self.free.pop()
+            entity.__init__(*args)
+            self.reused += 1
+            return entity
+        self.created += 1
+        return self.cls(*args)
+
+    def release(self, entity):
+        if len(self.free) < self.max_free:
+            self.free.append(entity)
+
+    def release_all(self, entities):
+        room = self.max_free - len(self.free)
+        if room > 0:
+            self.free.extend(entities[:room])
+
+    def stats(self):
+        return {'free': len(self.free), 'created': self.created, 'reused': self.reused}
+
+
+def entity_bytes(entity):
+    # The object itself, its __dict__ if it has one and the floats it holds
+    # (the ints and strings entities carry are small cached or interned ones)
+    size = sys.getsizeof(entity)
+    if isinstance(entity, dict):
+        values = entity.values()
+    elif hasattr(entity, '__dict__'):
+        size += sys.getsizeof(entity.__dict__)
+        values = entity.__dict__.values()
+    else:
+        values = [getattr(entity, name) for name in type(entity).__slots__
+                  if hasattr(entity, name)]
+    return size + sum(sys.getsizeof(value) for value in values
+                      if isinstance(value, float))
+
+
+def memory_report(groups):
+    # {name: entities} -> {name: {'count', 'bytes', 'bytes_per_entity'}}; the
+    # 8-byte list slot holding each entity is counted too
+    report = {}
+    for name, entities in groups.items():
+        count = len(entities)
+        total = sum(entity_bytes(entity) + 8 for entity in entities)
+        report[name] = {
+            'count': count,
+            'bytes': total,
+            'bytes_per_entity': total / count if count else 0.0,
+        }
+    return report
@@ -0,0 +1,117 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+# Per-tick phase timings and counters for the game loops. A game calls
+# begin() at the top of a tick, lap(phase) as each phase finishes and
+# count(name, n) for whatever it wants tallied; draw time lands in the
+# record of the tick it shows. Games hold None instead of a Profiler when
+# profiling is off, so the cost when disabled is one truth test per phase.
+#
+# Records go to an optional trace file, one row per tick: CSV when the
+# path ends in .csv, JSON lines otherwise. Columns are fixed by the phases
+# and counters given up front, so traces from two builds line up for diffing.
+
+WINDOW = 60  # Ticks averaged by summary() and the overlay
+OVERLAY_KEY = pygame.K_F3
+
+
+class Profiler:
+    def __init__(self, phases, counters=(), trace_path=None, window=WINDOW):
+        self.phases = tuple(phases)
+        self.counters = tuple(counters)
+        self.columns = (('tick',) + tuple(f'{phase}_ms' for phase in self.phases)
+                        + self.counters)
+        self.history = deque(maxlen=window)
+        self.overlay = False
+        self.font = None
+        self.record = None
+        self.last = 0.0
+
+        self.trace_file = None
+        self.writer = None
+        if trace_path:
+            self.trace_file = open(trace_path, 'w', newline='')
+            if trace_path.endswith('.csv'):
+                self.writer = csv.writer(self.trace_file)
+                self.writer.writerow(self.columns)
+
+    def begin(self, tick):
+        self.flush()
+        self.record = dict.fromkeys(self.columns, 0)
+        self.record['tick'] = tick
+        self.last = time.perf_counter()
+
+    def start(self):
+        # Restart the lap clock, for phases that run outside update()
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        if self.record is not None:
+            self.record[phase + '_ms'] += (now - self.last) * 1000
+        self.last = now
+
+    def count(self, name, value=1):
+        if self.record is not None:
+            self.record[name] += value
+
+    def flush(self):
+        record = self.record
+        if record is None:
+            return
+        self.record = None
+        self.history.append(record)
+        if self.trace_file is not None:
+            # Microsecond resolution is plenty and keeps traces small
+            record = {name: round(value, 3) if isinstance(value, float) else value
+                      for name, value in record.items()}
+        if self.writer is not None:
+            self.writer.writerow([record[column] for column in self.columns])
+        elif self.trace_file is not None:
+            self.trace_file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.flush()
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+    def summary(self):
+        # Mean of every column over the last `window` ticks
+        if not self.history:
+            return {}
+        count = len(self.history)
+        return {column: sum(r[column] for r in self.history) / count
+                for column in self.columns[1:]}
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key == OVERLAY_KEY:
+            self.toggle_overlay()
+
+    def draw_overlay(self, surface, x=10, y=10):
+        # Returns the area drawn over, or None when the overlay is hidden
+        if not self.overlay:
+            return None
+        if self.font is None:
+            pygame.font.init()  # The games only start the font module if they draw text
+            self.font = pygame.font.Font(None, 20)
+        summary = self.summary()
+        lines = [f"{phase:>14} {summary.get(phase + '_ms', 0):7.3f} ms"
+                 for phase in self.phases]
+        lines += [f"{name:>14} {summary.get(name, 0):9.1f}" for name in self.counters]
+        width = max(self.font.size(line)[0] for line in lines) + 10
+        height = len(lines) * 16 + 8
+        panel = pygame.Surface((width, height))
+        panel.set_alpha(200)
+        panel.fill((0, 0, 0))
+        area = surface.blit(panel, (x, y))
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, (255, 255, 255)), (x + 5, y + 4 + i * 16))
+        return area
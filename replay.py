@@ -0,0 +1,381 @@
+import argparse
+import bisect
+import struct
+import zlib
+
+import pygame
+
+import battle_game
+from battle_game import WIDTH, HEIGHT, WHITE, RED, BLUE, Stickman
+
+# Binary battle replays. Every tick is stored as a delta against the tick
+# before it (spawns, removals, quantized moves and health changes), and every
+# keyframe_interval ticks a full keyframe starts a new zlib-compressed block.
+# An index of block offsets at the end of the file lets playback jump to any
+# tick by decompressing one block and applying at most one interval of deltas.
+#
+# File layout:
+#   header   b'SMRP' version scale keyframe_interval
+#   blocks   u32 length, zlib(keyframe frame, delta frame, delta frame, ...)
+#   index    u32 count, (u32 first_tick, u64 offset) per block
+#   footer   u64 index offset, b'SMRX'
+
+MAGIC = b'SMRP'
+INDEX_MAGIC = b'SMRX'
+VERSION = 1
+SCALE = 16  # Positions are stored in 1/16 px
+
+HEADER = struct.Struct('<4sHHH')
+FOOTER = struct.Struct('<Q4s')
+BLOCK_LENGTH = struct.Struct('<I')
+INDEX_ENTRY = struct.Struct('<IQ')
+COUNT = struct.Struct('<I')
+COUNTS = struct.Struct('<IIIIIII')
+SOLDIER = struct.Struct('<IBiih')  # uid, team, x, y, health
+BULLET = struct.Struct('<IBii')    # uid, team, x, y
+MOVE = struct.Struct('<Ihh')       # uid, dx, dy
+HEALTH = struct.Struct('<Ih')      # uid, health
+UID = struct.Struct('<I')
+
+TEAMS = ('red', 'blue')
+TEAM_CODES = {'red': 0, 'blue': 1}
+DELTA_LIMIT = 32767
+
+
+def quantize(value):
+    return int(round(value * SCALE))
+
+
+def clamp_health(health):
+    return max(-32768, min(32767, int(round(health))))
+
+
+def pack_records(record, rows):
+    return b''.join(record.pack(*row) for row in rows)
+
+
+def unpack_records(record, data, offset, count):
+    end = offset + record.size * count
+    return list(record.iter_unpack(data[offset:end])), end
+
+
+def capture(game):
+    # Quantized view of a battle_game.Game: {uid: (team, x, y, health)} for
+    # soldiers and {uid: (team, x, y)} for bullets
+    soldiers = {}
+    for army in (game.red_army, game.blue_army):
+        for soldier in army:
+            soldiers[soldier.uid] = (TEAM_CODES[soldier.team], quantize(soldier.x),
+                                     quantize(soldier.y), clamp_health(soldier.health))
+    bullets = {}
+    for bullet in game.bullets:
+        bullets[bullet.uid] = (TEAM_CODES[bullet.team], quantize(bullet.x), quantize(bullet.y))
+    return soldiers, bullets
+
+
+def encode_keyframe(tick, soldiers, bullets):
+    return b''.join((
+        COUNT.pack(tick),
+        COUNT.pack(len(soldiers)),
+        pack_records(SOLDIER, ((uid,) + s for uid, s in soldiers.items())),
+        COUNT.pack(len(bullets)),
+        pack_records(BULLET, ((uid,) + b for uid, b in bullets.items())),
+    ))
+
+
+def diff(previous, current, with_health):
+    # Spawned records, removed uids, moves and (for soldiers) health changes.
+    # A move too large for an int16 is sent as a removal plus a respawn.
+    spawned = []
+    removed = [uid for uid in previous if uid not in current]
+    moved = []
+    healed = []
+    for uid, state in current.items():
+        old = previous.get(uid)
+        if old is None:
+            spawned.append((uid,) + state)
+            continue
+        dx = state[1] - old[1]
+        dy = state[2] - old[2]
+        if abs(dx) > DELTA_LIMIT or abs(dy) > DELTA_LIMIT:
+            removed.append(uid)
+            spawned.append((uid,) + state)
+            continue
+        if dx or dy:
+            moved.append((uid, dx, dy))
+        if with_health and state[3] != old[3]:
+            healed.append((uid, state[3]))
+    return spawned, removed, moved, healed
+
+
+def encode_delta(tick, previous, current):
+    s_spawned, s_removed, s_moved, s_health = diff(previous[0], current[0], True)
+    b_spawned, b_removed, b_moved, _ = diff(previous[1], current[1], False)
+    return b''.join((
+        COUNT.pack(tick),
+        COUNTS.pack(len(s_spawned), len(s_removed), len(s_moved), len(s_health),
+                    len(b_spawned), len(b_removed), len(b_moved)),
+        pack_records(SOLDIER, s_spawned),
+        pack_records(UID, ((uid,) for uid in s_removed)),
+        pack_records(MOVE, s_moved),
+        pack_records(HEALTH, s_health),
+        pack_records(BULLET, b_spawned),
+        pack_records(UID, ((uid,) for uid in b_removed)),
+        pack_records(MOVE, b_moved),
+    ))
+
+
+def read_count(data, offset):
+    return COUNT.unpack_from(data, offset)[0], offset + COUNT.size
+
+
+def decode_keyframe(data, offset):
+    tick, offset = read_count(data, offset)
+    count, offset = read_count(data, offset)
+    rows, offset = unpack_records(SOLDIER, data, offset, count)
+    soldiers = {row[0]: row[1:] for row in rows}
+    count, offset = read_count(data, offset)
+    rows, offset = unpack_records(BULLET, data, offset, count)
+    bullets = {row[0]: row[1:] for row in rows}
+    return tick, soldiers, bullets, offset
+
+
+def to_pixels(soldiers, bullets, scale=SCALE):
+    # Quantized (soldiers, bullets) back to team names and pixel positions
+    return ({uid: (TEAMS[t], x / scale, y / scale, health)
+             for uid, (t, x, y, health) in soldiers.items()},
+            {uid: (TEAMS[t], x / scale, y / scale)
+             for uid, (t, x, y) in bullets.items()})
+
+
+def apply_moves(entities, moves):
+    for uid, dx, dy in moves:
+        state = entities[uid]
+        entities[uid] = (state[0], state[1] + dx, state[2] + dy) + state[3:]
+
+
+def decode_delta(data, offset, soldiers, bullets):
+    # Applies one delta frame in place and returns (tick, next offset)
+    tick, offset = read_count(data, offset)
+    counts = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+    s_spawned, offset = unpack_records(SOLDIER, data, offset, counts[0])
+    s_removed, offset = unpack_records(UID, data, offset, counts[1])
+    s_moved, offset = unpack_records(MOVE, data, offset, counts[2])
+    s_health, offset = unpack_records(HEALTH, data, offset, counts[3])
+    b_spawned, offset = unpack_records(BULLET, data, offset, counts[4])
+    b_removed, offset = unpack_records(UID, data, offset, counts[5])
+    b_moved, offset = unpack_records(MOVE, data, offset, counts[6])
+
+    for (uid,) in s_removed:
+        del soldiers[uid]
+    for row in s_spawned:
+        soldiers[row[0]] = row[1:]
+    apply_moves(soldiers, s_moved)
+    for uid, health in s_health:
+        team, x, y, _ = soldiers[uid]
+        soldiers[uid] = (team, x, y, health)
+
+    for (uid,) in b_removed:
+        del bullets[uid]
+    for row in b_spawned:
+        bullets[row[0]] = row[1:]
+    apply_moves(bullets, b_moved)
+    return tick, offset
+
+
+class ReplayRecorder:
+    def __init__(self, path, keyframe_interval=300):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, SCALE, keyframe_interval))
+        self.keyframe_interval = keyframe_interval
+        self.index = []
+        self.frames = []
+        self.first_tick = None
+        self.previous = None
+
+    def record(self, game):
+        # Call once per tick, after game.update()
+        current = capture(game)
+        if self.previous is None or len(self.frames) >= self.keyframe_interval:
+            self.flush()
+            self.first_tick = game.tick
+            self.frames.append(encode_keyframe(game.tick, *current))
+        else:
+            self.frames.append(encode_delta(game.tick, self.previous, current))
+        self.previous = current
+
+    def flush(self):
+        if not self.frames:
+            return
+        block = zlib.compress(COUNT.pack(len(self.frames)) + b''.join(self.frames))
+        self.index.append((self.first_tick, self.file.tell()))
+        self.file.write(BLOCK_LENGTH.pack(len(block)))
+        self.file.write(block)
+        self.frames = []
+
+    def close(self):
+        self.flush()
+        index_offset = self.file.tell()
+        self.file.write(COUNT.pack(len(self.index)))
+        self.file.write(pack_records(INDEX_ENTRY, self.index))
+        self.file.write(FOOTER.pack(index_offset, INDEX_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        magic, version, self.scale, self.keyframe_interval = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} battle replay")
+        index_offset, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} has no block index (recording not closed?)")
+        count, offset = read_count(self.data, index_offset)
+        entries, _ = unpack_records(INDEX_ENTRY, self.data, offset, count)
+        self.block_ticks = [tick for tick, _ in entries]
+        self.block_offsets = [offset for _, offset in entries]
+        self.cached_block = None
+        self.cached_frames = None
+
+    @property
+    def first_tick(self):
+        return self.block_ticks[0] if self.block_ticks else 0
+
+    @property
+    def last_tick(self):
+        if not self.block_ticks:
+            return 0
+        _, frames = self.block(len(self.block_ticks) - 1)
+        return self.block_ticks[-1] + frames - 1
+
+    def block(self, number):
+        # Decompressed bytes and frame count of one block; the last one is cached
+        if self.cached_block != number:
+            offset = self.block_offsets[number]
+            (length,) = BLOCK_LENGTH.unpack_from(self.data, offset)
+            start = offset + BLOCK_LENGTH.size
+            self.cached_frames = zlib.decompress(self.data[start:start + length])
+            self.cached_block = number
+        frames, _ = read_count(self.cached_frames, 0)
+        return self.cached_frames, frames
+
+    def state_at(self, tick):
+        # (soldiers, bullets) at the given tick, rebuilt from the keyframe
+        # that starts its block; positions are in pixels
+        number = max(0, bisect.bisect_right(self.block_ticks, tick) - 1)
+        data, frames = self.block(number)
+        at, soldiers, bullets, offset = decode_keyframe(data, COUNT.size)
+        for _ in range(frames - 1):
+            if at >= tick:
+                break
+            at, offset = decode_delta(data, offset, soldiers, bullets)
+        return to_pixels(soldiers, bullets, self.scale)
+
+    def play_from(self, tick):
+        # Yields (tick, soldiers, bullets) for `tick` and every tick after
+        # it. Only the first block is decoded from its keyframe up to
+        # `tick`; from there each tick applies one delta to a running state,
+        # which is updated in place and stays quantized (see to_pixels).
+        first = max(0, bisect.bisect_right(self.block_ticks, tick) - 1)
+        for number in range(first, len(self.block_ticks)):
+            data, frames = self.block(number)
+            at, soldiers, bullets, offset = decode_keyframe(data, COUNT.size)
+            for frame in range(frames):
+                if frame:
+                    at, offset = decode_delta(data, offset, soldiers, bullets)
+                if at >= tick:
+                    yield at, soldiers, bullets
+
+
+def record(path, ticks, keyframe_interval=300, **game_options):
+    game = battle_game.Game(headless=True, **game_options)
+    with ReplayRecorder(path, keyframe_interval) as recorder:
+        for _ in range(ticks):
+            game.update()
+            recorder.record(game)
+            if game.winner():
+                break
+    return game
+
+
+def draw_state(soldiers, bullets):
+    screen = battle_game.screen
+    screen.fill(WHITE)
+    pygame.draw.rect(screen, RED, (100 - 30, HEIGHT - 80, 60, 60))
+    pygame.draw.rect(screen, BLUE, (WIDTH - 100 - 30, HEIGHT - 80, 60, 60))
+    for team, x, y in bullets.values():
+        pygame.draw.circle(screen, RED if team == 'red' else BLUE, (int(x), int(y)), 3)
+    stickmen = {team: Stickman(0, 0, team) for team in TEAMS}
+    for team, x, y, health in soldiers.values():
+        soldier = stickmen[team]
+        soldier.x, soldier.y, soldier.health = x, y, health
+        soldier.draw()
+
+
+def play(path):
+    # Space pauses, left/right jump 5 seconds, up/down jump a minute
+    replay = Replay(path)
+    battle_game.init_display()
+    pygame.display.set_caption(f"Replay: {path}")
+    clock = pygame.time.Clock()
+    last = replay.last_tick
+    frames = replay.play_from(replay.first_tick)
+    tick, soldiers, bullets = next(frames)
+    paused = False
+    jumps = {pygame.K_LEFT: -300, pygame.K_RIGHT: 300,
+             pygame.K_DOWN: -3600, pygame.K_UP: 3600}
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in jumps:
+                    # Seeking is the only time a block is decoded from its keyframe
+                    frames = replay.play_from(
+                        max(replay.first_tick, min(last, tick + jumps[event.key])))
+                    tick, soldiers, bullets = next(frames)
+
+        draw_state(*to_pixels(soldiers, bullets, replay.scale))
+        pygame.display.flip()
+        if not paused and tick < last:
+            tick, soldiers, bullets = next(frames)
+        clock.tick(60)
+
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and play battle replays")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record', help="record a headless battle")
+    rec.add_argument('path')
+    rec.add_argument('--ticks', type=int, default=60 * 60 * 10)
+    rec.add_argument('--seed', type=int, default=None)
+    rec.add_argument('--jitter', type=float, default=0)
+    rec.add_argument('--keyframe-interval', type=int, default=300)
+    show = sub.add_parser('play', help="play a replay")
+    show.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        game = record(args.path, args.ticks, args.keyframe_interval,
+                      seed=args.seed, spawn_jitter=args.jitter)
+        print(f"recorded {game.tick} ticks to {args.path} (winner: {game.winner()})")
+    else:
+        play(args.path)
+
+
+if __name__ == "__main__":
+    main()
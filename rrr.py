@@ -1,14 +1,25 @@
 import pygame
 import math
+import argparse
 
-# Initialize Pygame
-pygame.init()
+from gameloop import GameLoop
+from pools import Pool
+from profiler import Profiler
 
 # Set up the display
 WIDTH = 800
 HEIGHT = 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Stickman Fighter")
+screen = None
+
+def init_display():
+    # Open the window on first draw; fights stepped without drawing (netplay
+    # checks, the CPU's rollouts, benchmarks) never touch the display
+    global screen
+    if screen is None:
+        pygame.display.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Stickman Fighter")
+    return screen
 
 # Colors
 WHITE = (255, 255, 255)
@@ -17,10 +28,77 @@ RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 
+# Profiler columns for the per-step work in main()
+PROFILE_PHASES = ('input', 'move', 'collisions', 'draw')
+PROFILE_COUNTERS = ('projectiles',)
+
+# Update player1 controls with new attacks
+PLAYER1_CONTROLS = {
+    'left': pygame.K_a,
+    'right': pygame.K_d,
+    'up': pygame.K_w,
+    'slide': pygame.K_s,
+    'kick': pygame.K_q,
+    'projectile': pygame.K_z
+}
+
+# Updated Player 2 controls with new attacks
+PLAYER2_CONTROLS = {
+    'left': pygame.K_LEFT,
+    'right': pygame.K_RIGHT,
+    'up': pygame.K_UP,
+    'slide': pygame.K_DOWN,
+    'kick': pygame.K_SLASH,
+    'projectile': pygame.K_QUOTE
+}
+
+# Input bits for one player and one step: buttons held down, then attacks
+# pressed since the previous step. Fighter.move and Fighter.act only see
+# these, so a step depends on nothing but the fight state and both inputs.
+LEFT = 1
+RIGHT = 2
+UP = 4
+SLIDE = 8
+KICK = 16
+PROJECTILE = 32
+PUNCH = 64  # No key by default; the CPU opponent uses it
+HELD_BUTTONS = (('left', LEFT), ('right', RIGHT), ('up', UP))
+ATTACK_BUTTONS = (('slide', SLIDE), ('kick', KICK), ('projectile', PROJECTILE),
+                  ('punch', PUNCH))
+HELD_MASK = LEFT | RIGHT | UP
+
+def held_buttons(controls, keys):
+    # Input bits for the movement keys down in pygame.key.get_pressed()
+    buttons = 0
+    for name, bit in HELD_BUTTONS:
+        if keys[controls[name]]:
+            buttons |= bit
+    return buttons
+
+def attack_button(controls, key):
+    # Input bit for an attack key press, 0 for any other key
+    for name, bit in ATTACK_BUTTONS:
+        if key == controls.get(name):
+            return bit
+    return 0
+
+class Projectile:
+    # Fire/ice ball: slotted, and recycled through the owner's pool
+    __slots__ = ('x', 'prev_x', 'y', 'direction', 'speed')
+
+    def __init__(self, x, y, direction, speed=8):
+        self.x = x
+        self.prev_x = x  # Position before the last step, for interpolation
+        self.y = y
+        self.direction = direction
+        self.speed = speed
+
 class Fighter:
     def __init__(self, x, y, color, controls):
         self.x = x
         self.y = y
+        self.prev_x = x  # Position before the last step, for interpolation
+        self.prev_y = y
         self.color = color
         self.controls = controls  # Dictionary of control keys
         self.health = 100
@@ -34,24 +112,68 @@ class Fighter:
             'projectile': 0  # Generic name for fire/ice balls
         }
         self.projectiles = []  # Store active projectiles
+        self.projectile_pool = Pool(Projectile)  # Spent projectiles, reused
         self.sliding = False
         self.slide_speed = 0
         self.projectile_type = 'fire' if color == RED else 'ice'  # Determine projectile type by player
         
-    def move(self):
+    def save_position(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+        for projectile in self.projectiles:
+            projectile.prev_x = projectile.x
+
+    def snapshot(self):
+        # Everything a step reads or changes, as one flat tuple; projectiles
+        # go in as (x, prev_x, y, direction, speed)
+        cooldowns = self.attack_cooldowns
+        return (self.x, self.y, self.prev_x, self.prev_y, self.health, self.velocity_y,
+                self.is_jumping, self.facing_right, self.punch_cooldown,
+                cooldowns['slide'], cooldowns['kick'], cooldowns['projectile'],
+                self.sliding, self.slide_speed,
+                tuple([(p.x, p.prev_x, p.y, p.direction, p.speed) for p in self.projectiles]))
+
+    def restore(self, state):
+        (self.x, self.y, self.prev_x, self.prev_y, self.health, self.velocity_y,
+         self.is_jumping, self.facing_right, self.punch_cooldown,
+         slide, kick, projectile, self.sliding, self.slide_speed, projectiles) = state
+        cooldowns = self.attack_cooldowns
+        cooldowns['slide'] = slide
+        cooldowns['kick'] = kick
+        cooldowns['projectile'] = projectile
+        pool = self.projectile_pool
+        pool.release_all(self.projectiles)
+        restored = []
+        for x, prev_x, y, direction, speed in projectiles:
+            projectile = pool.acquire(x, y, direction, speed)
+            projectile.prev_x = prev_x
+            restored.append(projectile)
+        self.projectiles[:] = restored
+
+    def act(self, buttons, other):
+        # The attacks pressed in this step's input
+        if buttons & SLIDE:
+            self.slide()
+        if buttons & KICK:
+            self.kick(other)
+        if buttons & PROJECTILE:
+            self.launch_projectile()
+        if buttons & PUNCH:
+            self.punch(other)
+
+    def move(self, buttons=0):
         speed = 5
-        keys = pygame.key.get_pressed()
         
         # Horizontal movement
-        if keys[self.controls['left']]:
+        if buttons & LEFT:
             self.x -= speed
             self.facing_right = False
-        if keys[self.controls['right']]:
+        if buttons & RIGHT:
             self.x += speed
             self.facing_right = True
             
         # Jumping
-        if keys[self.controls['up']] and not self.is_jumping:
+        if buttons & UP and not self.is_jumping:
             self.velocity_y = -15
             self.is_jumping = True
             
@@ -86,11 +208,15 @@ class Fighter:
                 self.attack_cooldowns[attack] -= 1
                 
         # Update projectiles
-        for projectile in self.projectiles[:]:
-            projectile['x'] += projectile['speed'] * projectile['direction']
+        kept = []
+        for projectile in self.projectiles:
+            projectile.x += projectile.speed * projectile.direction
             # Remove projectiles that go off screen
-            if projectile['x'] < 0 or projectile['x'] > WIDTH:
-                self.projectiles.remove(projectile)
+            if projectile.x < 0 or projectile.x > WIDTH:
+                self.projectile_pool.release(projectile)
+            else:
+                kept.append(projectile)
+        self.projectiles[:] = kept
     
     def punch(self, other):
         if self.punch_cooldown == 0:
@@ -123,157 +249,197 @@ class Fighter:
     def launch_projectile(self):
         if self.attack_cooldowns['projectile'] == 0:
             direction = 1 if self.facing_right else -1
-            self.projectiles.append({
-                'x': self.x,
-                'y': self.y - 10,
-                'direction': direction,
-                'speed': 8
-            })
+            self.projectiles.append(
+                self.projectile_pool.acquire(self.x, self.y - 10, direction, 8))
             self.attack_cooldowns['projectile'] = 60
             return True
         return False
     
-    def draw(self):
+    def draw(self, alpha=1.0):
+        # Drawn alpha of the way from the position before the last step
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+
         # Draw body
-        pygame.draw.line(screen, self.color, (self.x, self.y - 20), (self.x, self.y + 20), 2)
+        pygame.draw.line(screen, self.color, (x, y - 20), (x, y + 20), 2)
         
         # Draw head
-        pygame.draw.circle(screen, self.color, (self.x, self.y - 30), 10)
+        pygame.draw.circle(screen, self.color, (x, y - 30), 10)
         
         # Draw arms (with punching animation)
         arm_angle = 45 if self.punch_cooldown > 15 else 0
         if self.facing_right:
             pygame.draw.line(screen, self.color, 
-                           (self.x, self.y - 10),
-                           (self.x + 15 * math.cos(math.radians(arm_angle)), 
-                            self.y - 10 + 15 * math.sin(math.radians(arm_angle))), 2)
+                           (x, y - 10),
+                           (x + 15 * math.cos(math.radians(arm_angle)), 
+                            y - 10 + 15 * math.sin(math.radians(arm_angle))), 2)
         else:
             pygame.draw.line(screen, self.color, 
-                           (self.x, self.y - 10),
-                           (self.x - 15 * math.cos(math.radians(arm_angle)), 
-                            self.y - 10 + 15 * math.sin(math.radians(arm_angle))), 2)
+                           (x, y - 10),
+                           (x - 15 * math.cos(math.radians(arm_angle)), 
+                            y - 10 + 15 * math.sin(math.radians(arm_angle))), 2)
         
         # Draw legs
-        pygame.draw.line(screen, self.color, (self.x, self.y + 20), (self.x - 15, self.y + 40), 2)
-        pygame.draw.line(screen, self.color, (self.x, self.y + 20), (self.x + 15, self.y + 40), 2)
+        pygame.draw.line(screen, self.color, (x, y + 20), (x - 15, y + 40), 2)
+        pygame.draw.line(screen, self.color, (x, y + 20), (x + 15, y + 40), 2)
         
         # Draw health bar
-        pygame.draw.rect(screen, BLACK, (self.x - 25, self.y - 50, 50, 5))
-        pygame.draw.rect(screen, GREEN, (self.x - 25, self.y - 50, 50 * (self.health/100), 5))
+        pygame.draw.rect(screen, BLACK, (x - 25, y - 50, 50, 5))
+        pygame.draw.rect(screen, GREEN, (x - 25, y - 50, 50 * (self.health/100), 5))
         
         # Draw projectiles
         for projectile in self.projectiles:
-            self.draw_projectile(projectile)
+            self.draw_projectile(projectile, alpha)
     
-    def draw_projectile(self, projectile):
+    def draw_projectile(self, projectile, alpha=1.0):
+        x = projectile.prev_x + (projectile.x - projectile.prev_x) * alpha
         if self.projectile_type == 'fire':
             # Fire ball (orange/red)
             pygame.draw.circle(screen, (255, 165, 0), 
-                            (int(projectile['x']), int(projectile['y'])), 8)
+                            (int(x), int(projectile.y)), 8)
             pygame.draw.circle(screen, (255, 69, 0), 
-                            (int(projectile['x'] - projectile['direction'] * 5), 
-                             int(projectile['y'])), 6)
+                            (int(x - projectile.direction * 5), 
+                             int(projectile.y)), 6)
         else:
             # Ice ball (light blue/white)
             pygame.draw.circle(screen, (135, 206, 235), 
-                            (int(projectile['x']), int(projectile['y'])), 8)
+                            (int(x), int(projectile.y)), 8)
             pygame.draw.circle(screen, (255, 255, 255), 
-                            (int(projectile['x'] - projectile['direction'] * 5), 
-                             int(projectile['y'])), 6)
+                            (int(x - projectile.direction * 5), 
+                             int(projectile.y)), 6)
 
-def main():
-    clock = pygame.time.Clock()
-    running = True
-    
-    # Update player1 controls with new attacks
-    player1 = Fighter(200, HEIGHT - 100, RED, {
-        'left': pygame.K_a,
-        'right': pygame.K_d,
-        'up': pygame.K_w,
-        'slide': pygame.K_s,
-        'kick': pygame.K_q,
-        'projectile': pygame.K_z
-    })
-    
-    # Updated Player 2 controls with new attacks
-    player2 = Fighter(600, HEIGHT - 100, BLUE, {
-        'left': pygame.K_LEFT,
-        'right': pygame.K_RIGHT,
-        'up': pygame.K_UP,
-        'slide': pygame.K_DOWN,
-        'kick': pygame.K_SLASH,
-        'projectile': pygame.K_QUOTE
-    })
-
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            
-            if event.type == pygame.KEYDOWN:
-                # Handle Player 1 attacks
-                if event.key == player1.controls['slide']:
-                    player1.slide()
-                if event.key == player1.controls['kick']:
-                    player1.kick(player2)
-                if event.key == player1.controls['projectile']:
-                    player1.launch_projectile()
-                
-                # Handle Player 2 attacks
-                if event.key == player2.controls['slide']:
-                    player2.slide()
-                if event.key == player2.controls['kick']:
-                    player2.kick(player1)
-                if event.key == player2.controls['projectile']:
-                    player2.launch_projectile()
-        
-        # Update
-        player1.move()
-        player2.move()
-        
-        # Check Player 1's fireball collisions
-        for projectile in player1.projectiles[:]:
-            if (abs(projectile['x'] - player2.x) < 20 and 
-                abs(projectile['y'] - player2.y) < 30):
-                player2.health -= 20
-                player1.projectiles.remove(projectile)
+def check_hits(player1, player2):
+    # Check Player 1's fireball collisions
+    kept = []
+    for projectile in player1.projectiles:
+        if (abs(projectile.x - player2.x) < 20 and 
+            abs(projectile.y - player2.y) < 30):
+            player2.health -= 20
+            player1.projectile_pool.release(projectile)
+        else:
+            kept.append(projectile)
+    player1.projectiles[:] = kept
         
-        # Check Player 2's iceball collisions
-        for projectile in player2.projectiles[:]:
-            if (abs(projectile['x'] - player1.x) < 20 and 
-                abs(projectile['y'] - player1.y) < 30):
-                player1.health -= 20
-                # Ice effect: Slow down player1 briefly
-                player1.speed = 2  # Temporary slow effect
-                player2.projectiles.remove(projectile)
+    # Check Player 2's iceball collisions
+    kept = []
+    for projectile in player2.projectiles:
+        if (abs(projectile.x - player1.x) < 20 and 
+            abs(projectile.y - player1.y) < 30):
+            player1.health -= 20
+            # Ice effect: Slow down player1 briefly
+            player1.speed = 2  # Temporary slow effect
+            player2.projectile_pool.release(projectile)
+        else:
+            kept.append(projectile)
+    player2.projectiles[:] = kept
         
-        # Check slide collisions for both players
-        if player1.sliding:
-            if (abs(player1.x - player2.x) < 30 and 
-                abs(player1.y - player2.y) < 40):
-                player2.health -= 15
-                player2.x += 30 if player1.facing_right else -30
-                player1.sliding = False
+    # Check slide collisions for both players
+    if player1.sliding:
+        if (abs(player1.x - player2.x) < 30 and 
+            abs(player1.y - player2.y) < 40):
+            player2.health -= 15
+            player2.x += 30 if player1.facing_right else -30
+            player1.sliding = False
                 
-        if player2.sliding:
-            if (abs(player2.x - player1.x) < 30 and 
-                abs(player2.y - player1.y) < 40):
-                player1.health -= 15
-                player1.x += 30 if player2.facing_right else -30
-                player2.sliding = False
-        
+    if player2.sliding:
+        if (abs(player2.x - player1.x) < 30 and 
+            abs(player2.y - player1.y) < 40):
+            player1.health -= 15
+            player1.x += 30 if player2.facing_right else -30
+            player2.sliding = False
+
+def step_fight(player1, player2, input1, input2, profiler=None):
+    # One step of the fight from both players' input bits
+    player1.save_position()
+    player2.save_position()
+    player1.act(input1, player2)
+    player2.act(input2, player1)
+    player1.move(input1)
+    player2.move(input2)
+    if profiler:
+        profiler.lap('move')
+
+    check_hits(player1, player2)
+    if profiler:
+        profiler.lap('collisions')
+        profiler.count('projectiles', len(player1.projectiles) + len(player2.projectiles))
+
+def draw_fight(player1, player2, alpha=1.0):
+    init_display()
+    screen.fill(WHITE)
+    pygame.draw.line(screen, BLACK, (0, HEIGHT - 60), (WIDTH, HEIGHT - 60), 2)  # Ground line
+    player1.draw(alpha)
+    player2.draw(alpha)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stickman Fighter")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each phase of a step; F3 toggles the overlay")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="write per-step profile records (.csv, otherwise JSON lines)")
+    parser.add_argument('--cpu', action='store_true',
+                        help="player 2 is the computer (fighter_ai)")
+    parser.add_argument('--cpu-budget', type=float, default=8.0,
+                        help="milliseconds the computer may think per decision")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile or args.trace:
+        profiler = Profiler(PROFILE_PHASES, PROFILE_COUNTERS, args.trace)
+        profiler.overlay = args.profile
+    steps = 0
+
+    init_display()
+    player1 = Fighter(200, HEIGHT - 100, RED, PLAYER1_CONTROLS)
+    player2 = Fighter(600, HEIGHT - 100, BLUE, PLAYER2_CONTROLS)
+    attacks = [0, 0]  # Attack bits pressed since the last step, per player
+    cpu = None
+    if args.cpu:
+        from fighter_ai import FighterAI
+        cpu = FighterAI(1, budget=args.cpu_budget / 1000)
+
+    def handle_event(event):
+        if profiler:
+            profiler.handle_event(event)
+        if event.type == pygame.KEYDOWN:
+            attacks[0] |= attack_button(player1.controls, event.key)
+            attacks[1] |= attack_button(player2.controls, event.key)
+
+    def step():
+        nonlocal steps
+        steps += 1
+        if profiler:
+            profiler.begin(steps)
+        keys = pygame.key.get_pressed()
+        input1 = held_buttons(player1.controls, keys) | attacks[0]
+        if cpu:
+            input2 = cpu.buttons(player1, player2)
+        else:
+            input2 = held_buttons(player2.controls, keys) | attacks[1]
+        attacks[0] = attacks[1] = 0
+        if profiler:
+            profiler.lap('input')
+        step_fight(player1, player2, input1, input2, profiler)
+
         # Check for game over
-        if player1.health <= 0 or player2.health <= 0:
-            running = False
-        
-        # Draw
-        screen.fill(WHITE)
-        pygame.draw.line(screen, BLACK, (0, HEIGHT - 60), (WIDTH, HEIGHT - 60), 2)  # Ground line
-        player1.draw()
-        player2.draw()
+        return player1.health > 0 and player2.health > 0
+
+    def render(alpha):
+        if profiler:
+            profiler.start()
+        draw_fight(player1, player2, alpha)
+        if profiler:
+            profiler.draw_overlay(screen)
+            profiler.lap('draw')
         pygame.display.flip()
-        
-        clock.tick(60)
+
+    GameLoop(step, render, handle_event, caption="Stickman Fighter").run()
+    if profiler:
+        profiler.close()
+    if cpu:
+        stats = cpu.stats()
+        print(f"computer: {stats['rollouts_per_second']:.0f} rollouts/s, "
+              f"{stats['rollouts_per_decision']:.1f} per decision")
 
     pygame.quit()
 
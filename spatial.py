@@ -0,0 +1,208 @@
+import math
+
+# Uniform grid used to answer nearest-enemy queries without scanning a whole army
+CELL_SIZE = 64
+
+# Below this many entities a plain scan is cheaper than walking grid rings
+SCAN_THRESHOLD = 16
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.entities = []
+        self.min_cx = self.max_cx = 0
+        self.min_cy = self.max_cy = 0
+        self.checks = 0  # Candidates examined by queries, for profiling
+
+    def rebuild(self, entities):
+        # Cells hold (index, entity) pairs in list order, so ties can be
+        # broken the same way a front-to-back scan would break them
+        size = self.cell_size
+        cells = {}
+        min_cx = min_cy = math.inf
+        max_cx = max_cy = -math.inf
+        for index, entity in enumerate(entities):
+            cx = int(entity.x // size)
+            cy = int(entity.y // size)
+            key = (cx, cy)
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [(index, entity)]
+                if cx < min_cx:
+                    min_cx = cx
+                if cx > max_cx:
+                    max_cx = cx
+                if cy < min_cy:
+                    min_cy = cy
+                if cy > max_cy:
+                    max_cy = cy
+            else:
+                cell.append((index, entity))
+        self.cells = cells
+        self.entities = entities
+        if cells:
+            self.min_cx, self.max_cx = min_cx, max_cx
+            self.min_cy, self.max_cy = min_cy, max_cy
+
+    def ring(self, cx, cy, r):
+        # Keys of the occupied-area cells at Chebyshev distance r from (cx, cy)
+        x0 = max(cx - r, self.min_cx)
+        x1 = min(cx + r, self.max_cx)
+        if x0 > x1:
+            return
+        if r == 0:
+            yield (cx, cy)
+            return
+        if self.min_cy <= cy - r <= self.max_cy:
+            for x in range(x0, x1 + 1):
+                yield (x, cy - r)
+        if self.min_cy <= cy + r <= self.max_cy:
+            for x in range(x0, x1 + 1):
+                yield (x, cy + r)
+        y0 = max(cy - r + 1, self.min_cy)
+        y1 = min(cy + r - 1, self.max_cy)
+        for y in range(y0, y1 + 1):
+            if self.min_cx <= cx - r:
+                yield (cx - r, y)
+            if cx + r <= self.max_cx:
+                yield (cx + r, y)
+
+    def nearest(self, x, y):
+        # Same answer as scanning the list with a strict '<' on the distance:
+        # the closest entity, and the earliest one in list order on a tie
+        if len(self.entities) <= SCAN_THRESHOLD:
+            self.checks += len(self.entities)
+            nearest = None
+            min_dist = float('inf')
+            for entity in self.entities:
+                dist = math.sqrt((entity.x - x)**2 + (entity.y - y)**2)
+                if dist < min_dist:
+                    min_dist = dist
+                    nearest = entity
+            return nearest
+
+        size = self.cell_size
+        cells = self.cells
+        cx = int(x // size)
+        cy = int(y // size)
+        max_r = max(cx - self.min_cx, self.max_cx - cx,
+                    cy - self.min_cy, self.max_cy - cy)
+        nearest = None
+        best_index = -1
+        min_dist = float('inf')
+        checks = 0
+        r = 0
+        while r <= max_r:
+            for key in self.ring(cx, cy, r):
+                cell = cells.get(key)
+                if cell is None:
+                    continue
+                checks += len(cell)
+                for index, entity in cell:
+                    dist = math.sqrt((entity.x - x)**2 + (entity.y - y)**2)
+                    if dist < min_dist or (dist == min_dist and index < best_index):
+                        min_dist = dist
+                        nearest = entity
+                        best_index = index
+            # Anything in ring r + 1 or beyond is more than r cells away;
+            # leave a hair of slack for rounding so ties are never skipped
+            if nearest is not None and min_dist < r * size - 1e-6:
+                break
+            r += 1
+        self.checks += checks
+        return nearest
+
+    def first_within(self, x, y, half_width, half_height):
+        # Earliest entity in list order whose centre lies strictly inside the
+        # box around (x, y), matching a front-to-back abs(dx)/abs(dy) scan
+        size = self.cell_size
+        cells = self.cells
+        hit = None
+        hit_index = -1
+        checks = 0
+        for cx in range(int((x - half_width) // size), int((x + half_width) // size) + 1):
+            for cy in range(int((y - half_height) // size), int((y + half_height) // size) + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    continue
+                checks += len(cell)
+                for index, entity in cell:
+                    if hit is not None and index >= hit_index:
+                        break
+                    if (abs(x - entity.x) < half_width and
+                        abs(y - entity.y) < half_height):
+                        hit = entity
+                        hit_index = index
+                        break
+        self.checks += checks
+        return hit
+
+    def query_rect(self, x0, y0, x1, y1):
+        # Entities of the cells overlapping the rectangle, in list order. The
+        # caller filters on exact position: cells hold where entities were
+        # at the last rebuild.
+        size = self.cell_size
+        cells = self.cells
+        found = []
+        for cx in range(max(int(x0 // size), self.min_cx), min(int(x1 // size), self.max_cx) + 1):
+            for cy in range(max(int(y0 // size), self.min_cy), min(int(y1 // size), self.max_cy) + 1):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    found.extend(cell)
+        found.sort(key=lambda pair: pair[0])
+        return [entity for _, entity in found]
+
+
+class StaticGrid:
+    # Uniform grid over rectangles that never move (x, y, width, height),
+    # for point queries. Each rectangle is listed in every cell it overlaps
+    # once grown by margin, so a query only needs the cell under the point
+    # to find every rectangle within margin of it. Cells keep insertion
+    # order and removal preserves it.
+
+    def __init__(self, cell_size=CELL_SIZE, margin=0):
+        self.cell_size = cell_size
+        self.margin = margin
+        self.cells = {}
+        self.checks = 0  # Candidates handed out by queries, for profiling
+
+    def cell_keys(self, rect):
+        size = self.cell_size
+        margin = self.margin
+        for cx in range(int((rect.x - margin) // size),
+                        int((rect.x + rect.width + margin) // size) + 1):
+            for cy in range(int((rect.y - margin) // size),
+                            int((rect.y + rect.height + margin) // size) + 1):
+                yield (cx, cy)
+
+    def insert(self, rect):
+        for key in self.cell_keys(rect):
+            self.cells.setdefault(key, []).append(rect)
+
+    def remove(self, rect):
+        for key in self.cell_keys(rect):
+            cell = self.cells[key]
+            cell.remove(rect)
+            if not cell:
+                del self.cells[key]
+
+    def query(self, x, y):
+        # Rectangles that may lie within margin of (x, y), in insertion order
+        size = self.cell_size
+        cell = self.cells.get((int(x // size), int(y // size)), ())
+        self.checks += len(cell)
+        return cell
+
+    def query_box(self, left, top, right, bottom):
+        # Rectangles that may lie within margin of the box, each once, in
+        # the order of the cells that list them
+        size = self.cell_size
+        found = {}
+        for cx in range(int(left // size), int(right // size) + 1):
+            for cy in range(int(top // size), int(bottom // size) + 1):
+                for rect in self.cells.get((cx, cy), ()):
+                    found[id(rect)] = rect
+        self.checks += len(found)
+        return list(found.values())
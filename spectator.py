@@ -0,0 +1,461 @@
+import argparse
+import asyncio
+import random
+import struct
+import sys
+import time
+import zlib
+
+import pygame
+
+import battle_game
+from replay import (capture, encode_keyframe, encode_delta, decode_keyframe, decode_delta,
+                    to_pixels, draw_state)
+
+# Live spectating for battle_game over UDP. The server steps the battle and,
+# after every tick, sends each spectator that tick's state as a replay
+# delta (spawns, removals, quantized moves and health changes, see replay.py)
+# against the latest tick that spectator acknowledged. A spectator that
+# misses frames simply acknowledges an older tick, and gets a larger delta
+# from there. One whose acknowledged tick has dropped out of the server's
+# last `history` ticks, or a new one, can only be sent a keyframe. It gets
+# the keyframe shared by every such spectator, sent on ticks that are
+# multiples of keyframe_interval, and nothing in between.
+#
+# A tick's frames are encoded once per distinct base tick, not once per
+# spectator: spectators that are keeping up all acknowledged the previous
+# tick and share the same datagrams. Encoding work is bounded by the
+# history whatever the audience, a spectator's bandwidth does not depend
+# on how many others there are, and what each extra spectator costs the
+# server is its sendto() calls. publish() never waits on a socket and
+# acknowledgements are only read between ticks, so the network cannot
+# hold up Game.update().
+#
+# Datagram layout:
+#   FRAME  tick, base tick (NO_TICK for a keyframe), part, parts, then one
+#          slice of the zlib-compressed replay frame
+#   ACK    latest tick the spectator has (NO_TICK to join)
+# A frame is split into parts of at most MAX_PAYLOAD bytes and is lost if
+# any part is.
+
+PORT = 7810
+TICK_RATE = 60
+HISTORY = 60  # Ticks of state kept as delta bases
+KEYFRAME_INTERVAL = 30
+MAX_PAYLOAD = 1200
+CLIENT_TIMEOUT = 5.0  # Seconds without an ACK before a spectator is dropped
+KEEPALIVE = 1.0  # Seconds between repeated ACKs from a spectator
+NO_TICK = 0xFFFFFFFF
+
+FRAME = struct.Struct('<IIHH')
+ACK = struct.Struct('<I')
+
+
+def split_frame(tick, base, payload):
+    count = max(1, -(-len(payload) // MAX_PAYLOAD))
+    return [FRAME.pack(tick, base, part, count) +
+            payload[part * MAX_PAYLOAD:(part + 1) * MAX_PAYLOAD]
+            for part in range(count)]
+
+
+class Viewer:
+    # The server's record of one spectator
+    def __init__(self, now):
+        self.acked = None  # Latest tick the spectator has, None before its first
+        self.heard = now
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+
+
+class SpectatorServer(asyncio.DatagramProtocol):
+    def __init__(self, history=HISTORY, keyframe_interval=KEYFRAME_INTERVAL,
+                 timeout=CLIENT_TIMEOUT):
+        self.history = history
+        self.keyframe_interval = keyframe_interval
+        self.timeout = timeout
+        self.transport = None
+        self.viewers = {}  # address -> Viewer
+        self.states = {}  # tick -> capture(), the last `history` published ticks
+        self.publishes = 0
+        self.encodes = 0
+        self.sends = 0
+        self.publish_seconds = 0.0
+        self.worst_publish = 0.0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if len(data) != ACK.size:
+            return
+        (tick,) = ACK.unpack(data)
+        now = time.monotonic()
+        viewer = self.viewers.get(address)
+        if viewer is None:
+            viewer = self.viewers[address] = Viewer(now)
+        viewer.heard = now
+        if tick in self.states and (viewer.acked is None or tick > viewer.acked):
+            viewer.acked = tick
+
+    def publish(self, game):
+        # Call once per tick, after game.update()
+        start = time.perf_counter()
+        tick = game.tick
+        current = capture(game)
+        states = self.states
+        states[tick] = current
+        while len(states) > self.history:
+            del states[next(iter(states))]
+
+        now = time.monotonic()
+        frames = {}  # Base tick -> datagrams, shared by every viewer on that base
+        sendto = self.transport.sendto
+        for address, viewer in list(self.viewers.items()):
+            if now - viewer.heard > self.timeout:
+                del self.viewers[address]
+                continue
+            base = viewer.acked
+            if base not in states:
+                if tick % self.keyframe_interval:
+                    continue  # Lagging: wait for the next shared keyframe
+                base = NO_TICK
+                viewer.keyframes += 1
+            datagrams = frames.get(base)
+            if datagrams is None:
+                datagrams = frames[base] = self.encode(tick, base, current)
+            for datagram in datagrams:
+                sendto(datagram, address)
+                viewer.bytes += len(datagram)
+            viewer.frames += 1
+            self.sends += len(datagrams)
+
+        elapsed = time.perf_counter() - start
+        self.publishes += 1
+        self.encodes += len(frames)
+        self.publish_seconds += elapsed
+        self.worst_publish = max(self.worst_publish, elapsed)
+
+    def encode(self, tick, base, current):
+        if base == NO_TICK:
+            frame = encode_keyframe(tick, *current)
+        else:
+            frame = encode_delta(tick, self.states[base], current)
+        return split_frame(tick, base, zlib.compress(frame))
+
+    def stats(self):
+        publishes = max(1, self.publishes)
+        return {
+            'viewers': len(self.viewers),
+            'publish_ms': self.publish_seconds / publishes * 1000,
+            'worst_publish_ms': self.worst_publish * 1000,
+            'encodes_per_tick': self.encodes / publishes,
+            'datagrams_per_tick': self.sends / publishes,
+        }
+
+
+class SpectatorClient(asyncio.DatagramProtocol):
+    # A headless spectator. With decode=False it reassembles and
+    # acknowledges frames without rebuilding the battle, which is all the
+    # server can tell about a spectator.
+    def __init__(self, decode=True, history=HISTORY):
+        self.decode = decode
+        self.history = history
+        self.transport = None
+        self.timer = None
+        self.tick = None  # Latest complete tick
+        self.states = {}  # tick -> quantized (soldiers, bullets), None without decode
+        self.partial = {}  # tick -> (base, parts)
+        self.frames = 0
+        self.keyframes = 0
+        self.unusable = 0  # Deltas against a tick this spectator does not have
+        self.bytes = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.keepalive()
+
+    def connection_lost(self, exc):
+        if self.timer:
+            self.timer.cancel()
+
+    def keepalive(self):
+        # Joins, and keeps the server from timing us out while frames are lost
+        self.ack()
+        self.timer = asyncio.get_running_loop().call_later(KEEPALIVE, self.keepalive)
+
+    def ack(self):
+        self.transport.sendto(ACK.pack(NO_TICK if self.tick is None else self.tick))
+
+    def datagram_received(self, data, address):
+        self.bytes += len(data)
+        tick, base, part, count = FRAME.unpack_from(data)
+        if self.tick is not None and tick <= self.tick:
+            return  # Late or repeated
+        if count == 1:
+            payload = data[FRAME.size:]
+        else:
+            entry = self.partial.get(tick)
+            if entry is None:
+                entry = self.partial[tick] = (base, [None] * count)
+            parts = entry[1]
+            parts[part] = data[FRAME.size:]
+            if None in parts:
+                return
+            payload = b''.join(parts)
+        if self.partial:
+            self.partial = {t: p for t, p in self.partial.items() if t > tick}
+        self.receive(tick, base, payload)
+
+    def receive(self, tick, base, payload):
+        if base == NO_TICK:
+            self.keyframes += 1
+            state = None
+            if self.decode:
+                _, soldiers, bullets, _ = decode_keyframe(zlib.decompress(payload), 0)
+                state = soldiers, bullets
+        elif base not in self.states:
+            self.unusable += 1
+            return
+        else:
+            state = None
+            if self.decode:
+                soldiers, bullets = self.states[base]
+                soldiers, bullets = dict(soldiers), dict(bullets)
+                decode_delta(zlib.decompress(payload), 0, soldiers, bullets)
+                state = soldiers, bullets
+        states = self.states
+        states[tick] = state
+        while next(iter(states)) <= tick - self.history:
+            del states[next(iter(states))]
+        self.tick = tick
+        self.frames += 1
+        self.ack()
+
+    def state(self):
+        # (soldiers, bullets) in pixels at the latest tick, as Replay.state_at
+        return to_pixels(*self.states[self.tick])
+
+
+class LaggyViewer(SpectatorClient):
+    # Loses a `loss` fraction of datagrams, and once, after a random number
+    # of frames, stops taking any in for `stall` seconds
+    def __init__(self, decode=True, loss=0.0, stall=0.0, seed=None):
+        SpectatorClient.__init__(self, decode)
+        self.random = random.Random(seed)
+        self.loss = loss
+        self.stall = stall
+        self.stall_at = self.random.randint(30, 120)
+        self.stalled_until = 0.0
+
+    def datagram_received(self, data, address):
+        if self.frames == self.stall_at and self.stall:
+            self.stall_at = None
+            self.stalled_until = time.monotonic() + self.stall
+        if time.monotonic() < self.stalled_until or self.random.random() < self.loss:
+            return
+        SpectatorClient.datagram_received(self, data, address)
+
+
+async def run_battle(game, server, ticks=None, rate=TICK_RATE):
+    # Steps the battle in real time, publishing every tick, until a winner
+    # or `ticks` ticks. Returns update timings; ticks that started late are
+    # counted and their lost time dropped, like GameLoop.
+    loop = asyncio.get_running_loop()
+    interval = 1 / rate
+    deadline = loop.time()
+    steps = 0
+    update_seconds = 0.0
+    worst_update = 0.0
+    late = 0
+    while (ticks is None or steps < ticks) and not game.winner():
+        start = time.perf_counter()
+        game.update()
+        elapsed = time.perf_counter() - start
+        update_seconds += elapsed
+        worst_update = max(worst_update, elapsed)
+        server.publish(game)
+        steps += 1
+        deadline += interval
+        delay = deadline - loop.time()
+        if delay < 0:
+            late += 1
+            deadline = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
+    return {
+        'ticks': steps,
+        'update_ms': update_seconds / max(1, steps) * 1000,
+        'worst_update_ms': worst_update * 1000,
+        'late_ticks': late,
+    }
+
+
+async def serve(host, port, ticks=None, **game_options):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(SpectatorServer,
+                                                            local_addr=(host, port))
+    game = battle_game.Game(headless=True, **game_options)
+
+    async def report():
+        while True:
+            await asyncio.sleep(5)
+            print(f"tick {game.tick}: " + "  ".join(f"{key} {value:.3g}" for key, value
+                                                   in server.stats().items()))
+
+    print(f"serving a battle on {host}:{port}")
+    reporter = asyncio.ensure_future(report())
+    timings = await run_battle(game, server, ticks)
+    reporter.cancel()
+    transport.close()
+    print(f"winner: {game.winner()}  " + "  ".join(f"{key} {value:.3g}" for key, value
+                                                  in timings.items()))
+
+
+async def watch(address, window=False, seconds=None):
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(SpectatorClient,
+                                                            remote_addr=address)
+    if window:
+        battle_game.init_display()
+        pygame.display.set_caption(f"Spectating {address[0]}:{address[1]}")
+    start = report_start = loop.time()
+    report_bytes = 0
+    running = True
+    while running and (seconds is None or loop.time() - start < seconds):
+        if window:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+            if client.tick is not None:
+                draw_state(*client.state())
+                pygame.display.flip()
+        now = loop.time()
+        if now - report_start >= 1:
+            entities = 0
+            if client.tick is not None:
+                entities = sum(len(group) for group in client.states[client.tick])
+            print(f"tick {client.tick}  entities {entities}  "
+                  f"{(client.bytes - report_bytes) / (now - report_start) / 1024:.1f} kB/s  "
+                  f"keyframes {client.keyframes}  unusable {client.unusable}")
+            report_start, report_bytes = now, client.bytes
+        await asyncio.sleep(1 / TICK_RATE)
+    transport.close()
+    if window:
+        pygame.quit()
+
+
+async def load_test(viewers, ticks, lagging=0.1, loss=0.05, stall=2.0, verify=10, seed=None,
+                    **game_options):
+    # One server and `viewers` spectators on localhost, in this process. A
+    # `lagging` fraction lose datagrams and stall once, longer than the
+    # server's history, to exercise the keyframe fallback; the first
+    # `verify` spectators rebuild the battle and are checked against the
+    # server's own state at the end; one that cannot be checked, having
+    # fallen out of the server's history, counts as failed.
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    transport, server = await loop.create_datagram_endpoint(SpectatorServer,
+                                                            local_addr=('127.0.0.1', 0))
+    address = transport.get_extra_info('sockname')
+    clients = []
+    laggy = 0
+    for number in range(viewers):
+        decode = number < verify
+        if rng.random() < lagging:
+            laggy += 1
+            client_seed = rng.random()
+            factory = lambda: LaggyViewer(decode, loss, stall, client_seed)
+        else:
+            factory = lambda: SpectatorClient(decode)
+        clients.append(await loop.create_datagram_endpoint(factory, remote_addr=address))
+    await asyncio.sleep(0.1)  # Let the joins arrive
+
+    game = battle_game.Game(headless=True, seed=seed, **game_options)
+    start = time.perf_counter()
+    timings = await run_battle(game, server, ticks)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.1)  # And the last frames
+
+    spectators = [client for _, client in clients]
+    checked = [client for client in spectators if client.decode]
+    identical = sum(client.tick in server.states and
+                    client.states[client.tick] == server.states[client.tick]
+                    for client in checked)
+    report = dict(server.stats())
+    report.update(timings)
+    report.update({
+        'viewers': viewers,
+        'lagging': laggy,
+        'kB_per_viewer_s': sum(c.bytes for c in spectators) / viewers / elapsed / 1024,
+        'keyframes_per_viewer': sum(c.keyframes for c in spectators) / viewers,
+        'behind': sum(client.tick != game.tick for client in spectators),
+        'verified': f"{identical}/{len(checked)}",
+        'failed': len(checked) - identical,
+    })
+    for client_transport, _ in clients:
+        client_transport.close()
+    transport.close()
+    return report
+
+
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live battle spectating over UDP")
+    sub = parser.add_subparsers(dest='command', required=True)
+    host = sub.add_parser('serve', help="run a battle and stream it to spectators")
+    host.add_argument('--host', default='127.0.0.1')
+    host.add_argument('--port', type=int, default=PORT)
+    host.add_argument('--ticks', type=int, default=None)
+    viewer = sub.add_parser('watch', help="spectate a served battle")
+    viewer.add_argument('--server', type=parse_address, default=('127.0.0.1', PORT),
+                        help="HOST:PORT of the server")
+    viewer.add_argument('--window', action='store_true', help="draw the battle")
+    viewer.add_argument('--seconds', type=float, default=None)
+    load = sub.add_parser('load', help="load test with many spectators on localhost; "
+                                       "exits 1 if any of them fails verification")
+    load.add_argument('--viewers', default='50,100,200,400',
+                      help="comma-separated audience sizes, one run each")
+    load.add_argument('--ticks', type=int, default=300)
+    load.add_argument('--lagging', type=float, default=0.1,
+                      help="fraction of spectators that lose datagrams and stall")
+    load.add_argument('--loss', type=float, default=0.05)
+    load.add_argument('--stall', type=float, default=2.0, help="seconds each lagging one stalls")
+    load.add_argument('--verify', type=int, default=10,
+                      help="spectators that rebuild the battle and are checked")
+    for command in (host, load):
+        command.add_argument('--seed', type=int, default=None)
+        command.add_argument('--jitter', type=float, default=0)
+        command.add_argument('--spawn-delay', type=int, default=180)
+    args = parser.parse_args()
+
+    if args.command == 'watch':
+        asyncio.run(watch(args.server, args.window, args.seconds))
+        return
+    options = {'spawn_jitter': args.jitter, 'spawn_delay': args.spawn_delay}
+    if args.command == 'serve':
+        asyncio.run(serve(args.host, args.port, args.ticks, seed=args.seed, **options))
+        return
+
+    failed = 0
+    for viewers in (int(count) for count in args.viewers.split(',')):
+        report = asyncio.run(load_test(viewers, args.ticks, args.lagging, args.loss, args.stall,
+                                       args.verify, args.seed, **options))
+        print(f"{viewers} viewers ({report['lagging']} lagging): "
+              f"{report['kB_per_viewer_s']:.1f} kB/s each, "
+              f"{report['keyframes_per_viewer']:.1f} keyframes each, "
+              f"publish {report['publish_ms']:.2f} ms (worst {report['worst_publish_ms']:.2f}), "
+              f"{report['encodes_per_tick']:.1f} encodes/tick, "
+              f"update {report['update_ms']:.2f} ms, {report['late_ticks']} late ticks, "
+              f"{report['behind']} behind at the end, verified {report['verified']}")
+        failed += report['failed']
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
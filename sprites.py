@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import pygame
+
+# Cache of pre-rendered surfaces. Callers quantize whatever drives their
+# drawing (team, gun angle, health, ...) into a hashable key and pass a
+# render function that draws the surface for a key on a miss. Past
+# max_entries the least recently used surface is dropped.
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+class SpriteCache:
+    def __init__(self, render, max_entries=DEFAULT_MAX_ENTRIES):
+        self.render = render
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.render(key)
+        if pygame.display.get_surface() is not None:
+            # Match the display format so blits skip per-pixel conversion
+            if surface.get_flags() & pygame.SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def memory_bytes(self):
+        return sum(s.get_bytesize() * s.get_width() * s.get_height()
+                   for s in self.surfaces.values())
+
+    def stats(self):
+        return {
+            'entries': len(self.surfaces),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes': self.memory_bytes(),
+        }
+
+
+def quantize(value, low, high, steps):
+    # Index of the nearest of `steps + 1` evenly spaced values from low to high
+    step = round((value - low) / (high - low) * steps)
+    return max(0, min(steps, step))
@@ -0,0 +1,195 @@
+import math
+
+from battle_game import Stickman
+
+# Level-of-detail simulation for battle_game. Soldiers whose target is far
+# away are merged with their neighbours into squads, and a squad is then
+# simulated as one unit: one nearest-enemy search and one step for the
+# whole formation, and its members' fire as a damage rate, the shots due
+# each tick looked up by the tick instead of counted down on every
+# member's timer. A member still fires from its place in the formation at
+# the enemy nearest to it, so a squad costs one soldier's tick plus a
+# search per shot, whatever its size.
+#
+# Members stay in their army list, skipped by the army loops, so bullets
+# hit them where they stand, and enemies target them, draw them and count
+# them, as before; a squad that stood in for them in the list, with a
+# single hit box, let fire through that would have struck its ranks and
+# drifted from the full simulation. A squad's health is its members'
+# pooled, and the first drop in it breaks the squad up, as does an enemy
+# within split_distance: bullets fly any distance, so taking fire means
+# the fighting has reached it, and that is left to the full simulation.
+# Game(squads=None) simulates every soldier on its own.
+#
+# The merge distance is larger than the split distance so squads do not
+# form and break up again at the edge of the engagement range.
+
+MERGE_DISTANCE = 450.0  # Soldiers this far from their target may merge
+SPLIT_DISTANCE = 300.0  # Squads split with an enemy this close
+SQUAD_CELL = 150  # Soldiers in the same cell of this size form a squad
+MIN_SQUAD = 3
+REGROUP_INTERVAL = 30  # Ticks between merge passes
+
+
+class Squad:
+    def __init__(self, members):
+        self.team = members[0].team
+        self.members = members
+        count = len(members)
+        self.x = sum(member.x for member in members) / count
+        self.y = sum(member.y for member in members) / count
+        self.offsets = [(member.x - self.x, member.y - self.y) for member in members]
+        self.health = sum(member.health for member in members)
+        self.live = count
+        leader = members[0]
+        self.speed = leader.speed
+        self.attack_range = leader.attack_range
+        self.shoot_delay = leader.shoot_delay
+        self.ticks = 0  # Ticks the squad has moved and fired for
+        # Members by the tick of their shots, counted modulo shoot_delay
+        self.volleys = {}
+        for index, member in enumerate(members):
+            self.volleys.setdefault(-member.shoot_timer % self.shoot_delay, []).append(index)
+        self.target = None
+        for member in members:
+            member.squad = self
+
+    def wounded(self):
+        # Pools the members' health again; True if it dropped since
+        health = 0
+        live = 0
+        for member in self.members:
+            if member.health > 0:
+                health += member.health
+                live += 1
+        wounded = health < self.health
+        self.health = health
+        self.live = live
+        return wounded
+
+    def move_towards(self, target):
+        # One step for the whole formation
+        Stickman.move_towards(self, target)
+        x, y = self.x, self.y
+        for member, (dx, dy) in zip(self.members, self.offsets):
+            member.x = x + dx
+            member.y = y + dy
+            member.target = target
+
+    def fire(self, aim):
+        # One tick of the members' shot timers; the bullets due, each at
+        # the enemy aim(member) picks for it
+        self.ticks += 1
+        due = self.volleys.get(self.ticks % self.shoot_delay)
+        if not due:
+            return []
+        bullets = []
+        for index in due:
+            member = self.members[index]
+            if member.health <= 0:
+                continue
+            bullet = aim(member)
+            if bullet:
+                bullets.append(bullet)
+        return bullets
+
+    def break_up(self):
+        # The members back on their own, their shot timers where the squad's
+        # ticks have brought them
+        for member in self.members:
+            member.squad = None
+            member.target = None
+            member.shoot_timer = (member.shoot_timer + self.ticks) % self.shoot_delay
+
+
+class SquadLOD:
+    def __init__(self, merge_distance=MERGE_DISTANCE, split_distance=SPLIT_DISTANCE,
+                 cell=SQUAD_CELL, min_size=MIN_SQUAD, regroup_interval=REGROUP_INTERVAL):
+        self.merge_distance = merge_distance
+        self.split_distance = split_distance
+        self.cell = cell
+        self.min_size = min_size
+        self.regroup_interval = regroup_interval
+        self.squads = []
+        self.merges = 0
+        self.splits = 0
+        self.squad_ticks = 0
+        self.member_ticks = 0
+
+    def update(self, game):
+        # Runs after the bullet pass, while both army grids are current
+        if game.tick % self.regroup_interval == 0:
+            self.regroup(game.red_army)
+            self.regroup(game.blue_army)
+
+        squads = []
+        for squad in self.squads:
+            wounded = squad.wounded()
+            if squad.health <= 0:
+                continue  # Shot down; the army loops drop the members
+            if squad.team == 'red':
+                enemies, grid = game.blue_army, game.blue_grid
+            else:
+                enemies, grid = game.red_army, game.red_grid
+            target = game.find_nearest(squad, enemies, grid)
+            if target is None:
+                squads.append(squad)
+                continue
+            distance = math.sqrt((target.x - squad.x)**2 + (target.y - squad.y)**2)
+            if wounded or distance < self.split_distance:
+                squad.break_up()
+                self.splits += 1
+                continue
+            self.advance(game, squad, target, enemies, grid)
+            squads.append(squad)
+        self.squads = squads
+
+    def regroup(self, army):
+        # Bucket the ungrouped soldiers whose target is far by cell; a full
+        # enough bucket becomes a squad
+        buckets = {}
+        cell = self.cell
+        merge_squared = self.merge_distance ** 2
+        for soldier in army:
+            target = soldier.target
+            if soldier.squad is not None or soldier.health <= 0:
+                continue
+            if target is None or target.health <= 0:
+                continue
+            if (target.x - soldier.x)**2 + (target.y - soldier.y)**2 < merge_squared:
+                continue
+            key = (int(soldier.x // cell), int(soldier.y // cell))
+            buckets.setdefault(key, []).append(soldier)
+        for members in buckets.values():
+            if len(members) >= self.min_size:
+                self.squads.append(Squad(members))
+                self.merges += 1
+
+    def advance(self, game, squad, target, enemies, grid):
+        # One soldier's move towards the target, for the whole squad, and
+        # the shots of the members whose timers run out
+        squad.target = target
+        squad.move_towards(target)
+
+        def aim(member):
+            # Each member shoots at the enemy nearest to it, as on its own
+            return member.shoot(game.find_nearest(member, enemies, grid), game.bullet_pool)
+
+        for bullet in squad.fire(aim):
+            game.add_bullet(bullet)
+        self.squad_ticks += 1
+        self.member_ticks += squad.live
+
+    def grouped(self):
+        return sum(squad.live for squad in self.squads)
+
+    def stats(self):
+        return {
+            'squads': len(self.squads),
+            'grouped': self.grouped(),
+            'pooled_health': sum(squad.health for squad in self.squads),
+            'merges': self.merges,
+            'splits': self.splits,
+            'members_per_update': (self.member_ticks / self.squad_ticks
+                                   if self.squad_ticks else 0.0),
+        }
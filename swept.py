@@ -0,0 +1,163 @@
+import math
+
+from game import WIDTH, HEIGHT, Game
+
+# Continuous collision for Ball Breaker. Game.update moves a ball a whole
+# step and then tests for overlap, which only works while a step is
+# shorter than a platform is thick, and needs a cooldown to stop the same
+# platform being hit again on the next few ticks. Here each ball's motion
+# over a step is swept instead: the earliest time of impact against the
+# walls and the platforms along its path is found, the ball is moved to
+# the contact point and reflected, and the rest of the step goes on from
+# there, up to MAX_BOUNCES times. A step can then cover many ticks of
+# motion (SweptGame(step_ticks=10) is 10x fast-forward) without a ball
+# passing through a platform or a wall.
+#
+# A platform is a rectangle and the ball a circle, so the ball hits a
+# face when its centre reaches the rectangle grown by the radius, or a
+# corner when its centre reaches the circle of that radius around it.
+# Only approaching contacts count: a ball leaving a surface it touches is
+# let go, which is what the cooldown stood in for.
+
+MAX_BOUNCES = 8  # Impacts resolved per ball per step; the rest is dropped
+
+
+def wall_impact(position, velocity, low, high):
+    # Fraction of the move `velocity` at which position reaches low or high
+    if velocity > 0:
+        t = (high - position) / velocity
+    elif velocity < 0:
+        t = (low - position) / velocity
+    else:
+        return None
+    return max(t, 0.0) if t <= 1 else None
+
+
+def slab(position, velocity, low, high):
+    # Fractions of the move spent between low and high, (None, None) if never
+    if velocity == 0:
+        if low <= position <= high:
+            return -math.inf, math.inf
+        return None, None
+    t0 = (low - position) / velocity
+    t1 = (high - position) / velocity
+    return (t0, t1) if t0 <= t1 else (t1, t0)
+
+
+def platform_impact(x, y, dx, dy, radius, platform):
+    # (fraction of the move (dx, dy) at which the ball meets the platform,
+    # unit normal of the contact), or None if it does not meet it moving in
+    left, top = platform.x, platform.y
+    right, bottom = left + platform.width, top + platform.height
+    tx0, tx1 = slab(x, dx, left - radius, right + radius)
+    ty0, ty1 = slab(y, dy, top - radius, bottom + radius)
+    if tx0 is None or ty0 is None:
+        return None
+    enter = max(tx0, ty0)
+    if enter > min(tx1, ty1) or enter > 1 or min(tx1, ty1) < 0:
+        return None
+
+    if enter >= 0:
+        px, py = x + enter * dx, y + enter * dy
+        if left <= px <= right or top <= py <= bottom:
+            # Face: the grown rectangle's side is the contact
+            if tx0 > ty0:
+                return enter, (-1.0 if dx > 0 else 1.0), 0.0
+            return enter, 0.0, (-1.0 if dy > 0 else 1.0)
+    else:
+        px, py = x, y
+
+    # Corner region, or already within the grown rectangle: measure from
+    # the nearest point of the platform itself
+    cx = max(left, min(px, right))
+    cy = max(top, min(py, bottom))
+    mx, my = x - cx, y - cy
+    outside = mx * mx + my * my - radius * radius
+    if outside <= 0:
+        # Touching at the start: a hit only if moving further in
+        length = math.sqrt(mx * mx + my * my)
+        if length == 0 or mx * dx + my * dy >= 0:
+            return None
+        return 0.0, mx / length, my / length
+    a = dx * dx + dy * dy
+    b = mx * dx + my * dy
+    disc = b * b - a * outside
+    if b >= 0 or disc < 0:
+        return None
+    t = (-b - math.sqrt(disc)) / a
+    if t > 1:
+        return None
+    nx, ny = mx + t * dx, my + t * dy
+    length = math.sqrt(nx * nx + ny * ny)
+    return t, nx / length, ny / length
+
+
+class SweptGame(Game):
+    def __init__(self, profiler=None, step_ticks=1):
+        Game.__init__(self, profiler)
+        self.step_ticks = step_ticks  # Ticks of motion per update
+        self.dropped_bounces = 0  # Balls that ran out of MAX_BOUNCES
+
+    def update(self):
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(self.tick + 1)
+        self.tick += self.step_ticks
+        checks = 0
+        for ball in self.balls:
+            checks += self.sweep(ball, self.step_ticks)
+        if profiler:
+            profiler.lap('balls')
+            profiler.count('balls', len(self.balls))
+            profiler.count('platforms', len(self.platforms))
+            profiler.count('collision_checks', checks)
+
+    def sweep(self, ball, ticks):
+        # Move the ball `ticks` ticks along, bouncing at every impact on the
+        # way; returns how many platforms were tested
+        r = ball.radius
+        checks = 0
+        for _ in range(MAX_BOUNCES):
+            move_x = ball.dx * ticks
+            move_y = ball.dy * ticks
+            end_x = ball.x + move_x
+            end_y = ball.y + move_y
+            first, normal, hit = None, None, None
+
+            for t, nx, ny in ((wall_impact(ball.x, move_x, r, WIDTH - r), 1.0, 0.0),
+                              (wall_impact(ball.y, move_y, r, HEIGHT - r), 0.0, 1.0)):
+                if t is not None and (first is None or t < first):
+                    first, normal = t, (nx, ny)
+
+            candidates = self.platform_grid.query_box(min(ball.x, end_x), min(ball.y, end_y),
+                                                      max(ball.x, end_x), max(ball.y, end_y))
+            checks += len(candidates)
+            for platform in candidates:
+                impact = platform_impact(ball.x, ball.y, move_x, move_y, r, platform)
+                if impact is not None and (first is None or impact[0] < first):
+                    first, normal, hit = impact[0], impact[1:], platform
+
+            if first is None:
+                ball.x, ball.y = end_x, end_y
+                return checks
+
+            ball.x += move_x * first
+            ball.y += move_y * first
+            nx, ny = normal
+            if ny == 0:
+                ball.dx = -ball.dx  # Walls and faces flip exactly, as move() does
+            elif nx == 0:
+                ball.dy = -ball.dy
+            else:
+                along = ball.dx * nx + ball.dy * ny
+                ball.dx -= 2 * along * nx
+                ball.dy -= 2 * along * ny
+            ticks *= 1 - first
+            if hit is not None:
+                ball.last_collided_platform = hit
+                self.damage_platform(hit)
+
+        self.dropped_bounces += 1
+        ball.x = max(r, min(WIDTH - r, ball.x))
+        ball.y = max(r, min(HEIGHT - r, ball.y))
+        return checks
@@ -0,0 +1,57 @@
+import math
+
+# Cached retargeting for battle_game. A soldier keeps the target it has
+# while that target is alive and no further than it was when picked plus a
+# slack, and only searches again when those fail or its turn comes round:
+# soldiers re-pick every `interval` ticks, staggered by uid so that only
+# about 1/interval of an army searches on any tick. Game(targeting=None)
+# is the exact mode, a fresh nearest-enemy search for every soldier every
+# tick.
+#
+# With audit=True every kept target is checked against an exact search and
+# disagreements are counted, to measure what the cache costs in accuracy.
+
+INTERVAL = 10  # Ticks between forced re-picks
+SLACK = 20.0  # Pixels a kept target may drift beyond its pick distance
+
+
+class CachedTargeting:
+    def __init__(self, interval=INTERVAL, slack=SLACK, audit=False):
+        self.interval = interval
+        self.slack = slack
+        self.audit = audit
+        self.queries = 0
+        self.kept = 0
+        self.audited = 0
+        self.mismatches = 0
+
+    def choose(self, game, soldier, enemies, grid):
+        self.queries += 1
+        target = soldier.target
+        if (target is not None and target.health > 0 and
+                (game.tick + soldier.uid) % self.interval):
+            distance = math.sqrt((target.x - soldier.x)**2 + (target.y - soldier.y)**2)
+            if distance <= soldier.target_distance + self.slack:
+                self.kept += 1
+                if self.audit:
+                    self.audited += 1
+                    if game.find_nearest(soldier, enemies, grid) is not target:
+                        self.mismatches += 1
+                return target
+
+        nearest = game.find_nearest(soldier, enemies, grid)
+        if nearest is not None:
+            soldier.target_distance = math.sqrt((nearest.x - soldier.x)**2 +
+                                                (nearest.y - soldier.y)**2)
+        return nearest
+
+    def stats(self):
+        return {
+            'queries': self.queries,
+            'kept': self.kept,
+            'searches': self.queries - self.kept,
+            'kept_rate': self.kept / self.queries if self.queries else 0.0,
+            'audited': self.audited,
+            'mismatches': self.mismatches,
+            'mismatch_rate': self.mismatches / self.audited if self.audited else 0.0,
+        }
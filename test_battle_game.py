@@ -0,0 +1,30 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+from battle_game import Game
+
+
+def soldiers(army):
+    return [(soldier.x, soldier.y, soldier.health) for soldier in army]
+
+
+def bullets(game):
+    return [(bullet.uid, bullet.x, bullet.y, bullet.dx, bullet.dy, bullet.team)
+            for bullet in game.bullets]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_spatial_index_matches_brute_force(seed):
+    # The grids must change how targets and hits are found, never which
+    options = dict(headless=True, seed=seed, spawn_jitter=40, spawn_delay=30)
+    indexed = Game(use_spatial_index=True, **options)
+    brute = Game(use_spatial_index=False, **options)
+    for tick in range(2000):
+        indexed.update()
+        brute.update()
+        assert soldiers(indexed.red_army) == soldiers(brute.red_army), tick
+        assert soldiers(indexed.blue_army) == soldiers(brute.blue_army), tick
+        assert bullets(indexed) == bullets(brute), tick
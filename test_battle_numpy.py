@@ -0,0 +1,73 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pytest
+
+import battle_numpy
+from battle_game import Game
+from battle_numpy import ArrayGame, nearest_brute, nearest_indices, unique_points
+
+
+def soldiers(game):
+    return [[(soldier.x, soldier.y, soldier.health) for soldier in army]
+            for army in (game.red_army, game.blue_army)]
+
+
+def array_soldiers(game):
+    return [list(zip(army.x.tolist(), army.y.tolist(), army.health.tolist()))
+            for army in (game.red_army, game.blue_army)]
+
+
+def bullets(game):
+    return [(bullet.x, bullet.y, bullet.dx, bullet.dy, bullet.team) for bullet in game.bullets]
+
+
+def array_bullets(game):
+    teams = ['red', 'blue']
+    shots = game.bullets
+    return [(x, y, dx, dy, teams[team])
+            for x, y, dx, dy, team in zip(shots.x.tolist(), shots.y.tolist(), shots.dx.tolist(),
+                                          shots.dy.tolist(), shots.team.tolist())]
+
+
+@pytest.mark.parametrize('search', ['brute', 'grid'])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_arrays_match_objects(monkeypatch, seed, search):
+    # Both backends play the same battle to the bit; 'grid' sends every
+    # nearest-enemy search through the grid, a few queries at a time
+    if search == 'grid':
+        monkeypatch.setattr(battle_numpy, 'BRUTE_FORCE_PAIRS', 0)
+        monkeypatch.setattr(battle_numpy, 'GRID_QUERIES', 7)
+    options = dict(headless=True, seed=seed, spawn_jitter=40, spawn_delay=30)
+    objects = Game(**options)
+    arrays = ArrayGame(**options)
+    for tick in range(1500):
+        objects.update()
+        arrays.update()
+        assert array_soldiers(arrays) == soldiers(objects), tick
+        assert array_bullets(arrays) == bullets(objects), tick
+
+
+@pytest.mark.parametrize('layout', ['apart_x', 'apart_y', 'mixed', 'stacked', 'lone'])
+def test_nearest_grid_matches_brute_force(monkeypatch, layout):
+    rng = np.random.default_rng(3)
+    qx, qy = rng.uniform(0, 80, 3000), rng.uniform(0, 80, 3000)
+    ex, ey = rng.uniform(0, 80, 2000), rng.uniform(0, 80, 2000)
+    if layout == 'apart_x':
+        ex += 2000
+    elif layout == 'apart_y':
+        ey += 2000
+    elif layout == 'mixed':
+        ex = rng.uniform(-500, 500, 2000)
+    elif layout == 'stacked':
+        # Soldiers stacked on a few spots, so distances tie
+        qx, qy, ex, ey = (np.floor(v / 20) for v in (qx, qy, ex, ey))
+    else:
+        ex, ey = ex[:1], ey[:1]
+    ux, uy, first, _ = unique_points(ex, ey)
+    vx, vy, _, inverse = unique_points(qx, qy)
+    expected = nearest_brute(vx, vy, ux, uy, first)[inverse]
+    monkeypatch.setattr(battle_numpy, 'BRUTE_FORCE_PAIRS', 0)
+    assert (nearest_indices(qx, qy, ex, ey) == expected).all()
@@ -0,0 +1,52 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+from battle_game import make_game
+from checkpoint import big_game, load, save, state
+
+OPTIONS = dict(headless=True, seed=4, spawn_jitter=20, spawn_delay=30)
+
+
+def without_uids(game):
+    # The array backend has no uids, and one that loads its checkpoint
+    # hands out new ones
+    tick, spawn_timer, rng, tables = state(game)
+    return tick, spawn_timer, rng, [{name: column for name, column in table.items()
+                                     if name != 'uid'} for table in tables]
+
+
+@pytest.mark.parametrize('saved, resumed', [('object', 'object'), ('numpy', 'numpy'),
+                                            ('object', 'numpy'), ('numpy', 'object')])
+def test_resumed_battle_matches_uninterrupted(tmp_path, saved, resumed):
+    path = str(tmp_path / 'battle.smcp')
+    game = make_game(saved, **OPTIONS)
+    for _ in range(300):
+        game.update()
+    save(game, path)
+    loaded = load(path, resumed, headless=True)
+    for tick in range(300):
+        game.update()
+        loaded.update()
+        if saved == resumed:
+            assert state(loaded) == state(game), tick
+        else:
+            assert without_uids(loaded) == without_uids(game), tick
+
+
+@pytest.mark.parametrize('backend', ['object', 'numpy'])
+def test_big_state_round_trips(tmp_path, backend):
+    path = str(tmp_path / 'big.smcp')
+    game = big_game(backend, 10000, seed=4)
+    save(game, path)
+    assert state(load(path, backend, headless=True)) == state(game)
+
+
+def test_squads_are_refused(tmp_path):
+    from squads import SquadLOD
+
+    game = make_game('object', squads=SquadLOD(), **OPTIONS)
+    with pytest.raises(ValueError):
+        save(game, str(tmp_path / 'squads.smcp'))
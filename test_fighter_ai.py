@@ -0,0 +1,26 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+import rrr
+from fighter_ai import FighterAI, check
+from netplay import new_fight, fight_state
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_restored_fight_steps_like_original(seed):
+    frame, _ = check(3000, seed)
+    assert frame is None
+
+
+def test_search_leaves_fight_untouched():
+    player1, player2 = new_fight()
+    for _ in range(30):
+        rrr.step_fight(player1, player2, rrr.RIGHT | rrr.PROJECTILE, rrr.LEFT | rrr.UP)
+    before = fight_state(player1, player2)
+    ai = FighterAI(1, budget=0.002, seed=0)
+    ai.buttons(player1, player2)
+    assert ai.rollouts >= 10
+    assert fight_state(player1, player2) == before
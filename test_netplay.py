@@ -0,0 +1,19 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+from netplay import MAX_ROLLBACK, loopback
+
+
+@pytest.mark.parametrize('latency, jitter, loss', [(0, 0, 0.0), (6, 2, 0.05), (12, 4, 0.2)])
+def test_loopback_fights_identical(latency, jitter, loss):
+    report = loopback(600, latency, jitter, loss, seed=1)
+    assert report['identical']
+    if latency:
+        assert all(stats['rollbacks'] for stats in report['sessions'])
+    if latency >= 12:
+        # Rollbacks reach the deepest allowed and still fit in a 60 Hz frame
+        assert max(stats['max_rollback'] for stats in report['sessions']) == MAX_ROLLBACK
+        assert report['worst_frame_ms'] < 1000 / 60
@@ -0,0 +1,37 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+from gameloop import STEP_RATE
+from offline import EventSimulator, make_game, game_state
+
+
+def frame_step(game, ticks):
+    for _ in range(ticks):
+        game.step()
+
+
+@pytest.mark.parametrize('indestructible', [False, True])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_matches_frame_stepping(seed, indestructible):
+    # Indestructible platforms keep every ball hitting them for the whole
+    # run, so impacts never run out
+    ticks = 60 * STEP_RATE
+    stepped = make_game(20, seed, indestructible)
+    frame_step(stepped, ticks)
+    skipped = make_game(20, seed, indestructible)
+    EventSimulator(skipped).advance(ticks)
+    assert game_state(skipped) == game_state(stepped)
+
+
+def test_advance_in_pieces():
+    # Stopping between impacts and carrying on gives the same game
+    stepped = make_game(10, 4, indestructible=True)
+    frame_step(stepped, 3000)
+    skipped = make_game(10, 4, indestructible=True)
+    simulator = EventSimulator(skipped)
+    for ticks in (1, 499, 1000, 1500):
+        simulator.advance(ticks)
+    assert game_state(skipped) == game_state(stepped)
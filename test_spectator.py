@@ -0,0 +1,16 @@
+import asyncio
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from spectator import load_test
+
+
+def test_load_test_viewers_verify():
+    # Stalls longer than the server's history, so the lagging viewers need
+    # the keyframe fallback to catch up
+    report = asyncio.run(load_test(6, 240, lagging=0.5, loss=0.1, stall=1.2, verify=6,
+                                   seed=3, spawn_delay=30))
+    assert report['lagging']
+    assert report['failed'] == 0
+    assert report['verified'] == '6/6'
@@ -0,0 +1,61 @@
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from battle_game import Game
+from montecarlo import compare_outcomes, run_batch
+from squads import SquadLOD
+
+# Armies marching across a wide field, so squads form on the way; red fires
+# a little faster, and blue wins a battle in ten
+SCENARIO = dict(world_size=(2400, 1200), spawn_delay=60, spawn_jitter=20,
+                red_stats={'shoot_delay': 56}, max_ticks=6000)
+
+
+def fast_game(lod):
+    # Fast soldiers close the gap before the squads are shot at
+    return Game(headless=True, seed=3, squads=lod, world_size=(2400, 1200),
+                spawn_delay=60, spawn_jitter=20,
+                red_stats={'speed': 4}, blue_stats={'speed': 4})
+
+
+def test_squads_move_in_formation_and_split():
+    lod = SquadLOD()
+    game = fast_game(lod)
+    for tick in range(1000):
+        game.update()
+        for squad in lod.squads:
+            for member, (dx, dy) in zip(squad.members, squad.offsets):
+                assert member.squad is squad
+                assert (member.x, member.y) == (squad.x + dx, squad.y + dy), tick
+    assert lod.merges and lod.splits
+    # Split squads hand their members back to the army loops
+    grouped = {id(member) for squad in lod.squads for member in squad.members}
+    for soldier in game.red_army + game.blue_army:
+        assert (soldier.squad is not None) == (id(soldier) in grouped)
+
+
+def test_hit_breaks_squad_up():
+    lod = SquadLOD()
+    game = fast_game(lod)
+    while not lod.squads:
+        game.update()
+    squad = lod.squads[0]
+    squad.members[-1].health -= 20
+    game.update()
+    assert squad not in lod.squads
+    assert all(member.squad is None for member in squad.members)
+
+
+def test_outcomes_match_full_simulation():
+    # The same seeded battles with and without squads. A single battle is
+    # chaotic, as nudging every soldier by a pixel changes a long one's
+    # winner, so only the distributions are compared: who wins how often,
+    # and how long the quicker half of the wins take
+    full = run_batch(40, seed=7, **SCENARIO)
+    squads = run_batch(40, seed=7, squads=True, **SCENARIO)
+    difference = compare_outcomes(full, squads)
+    for outcome in ('red_win_rate', 'blue_win_rate', 'timeout_rate'):
+        assert abs(difference[outcome]) <= 0.15, difference
+    assert abs(difference['ticks_p10']) <= 0.1, difference
+    assert abs(difference['ticks_p50']) <= 0.1, difference